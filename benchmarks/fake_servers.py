@@ -0,0 +1,362 @@
+"""
+ベンチマーク用の Google サジェスト / DataForSEO の代替サーバー
+
+本物の API を使わずにパイプラインの処理能力を測るため、同じ形式のレスポンスを返す
+HTTP サーバーをローカルで起動する。応答内容はクエリ・キーワードのハッシュから決めるため、
+同じ設定なら毎回同じ件数のキーワードが得られる。
+
+- サジェスト: GET /complete/search?q=... → ["クエリ", ["候補", ...]]
+- DataForSEO: POST task_post / GET tasks_ready / GET task_get/regular/<id>
+  （<base>/v3/serp/google/organic/ 以下）
+- 両方: GET /_stats → リクエスト数などの集計
+
+task_post のタスクに pingback_url / postback_url があれば、完了時刻にその URL へ
+通知を送る（DataForSEO の完了通知の代わり。$id / $tag を置き換える）。postback の
+本文は task_get/regular と同じ形式の JSON を gzip 圧縮したもの。
+
+サーバーは別プロセスで動かし、計測対象のプロセスの CPU・メモリに影響しないようにする。
+"""
+
+import gzip
+import hashlib
+import heapq
+import json
+import multiprocessing
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import urllib.request
+from urllib.parse import parse_qs, quote, urlparse
+
+DFS_PREFIX = "/v3/serp/google/organic"
+
+DEFAULT_CONFIG = {
+    "suggest": {
+        "latency": 0.05,       # 1 リクエストあたりの応答遅延（秒）
+        "error_rate": 0.0,     # HTTP 500 を返す割合
+        "suggestions": 10,     # 1 クエリあたりの候補数
+        "vocabulary": 2000,    # 候補に使う語の種類（小さいほど重複が増える）
+    },
+    "dataforseo": {
+        "latency": 0.05,       # 1 リクエストあたりの応答遅延（秒）
+        "error_rate": 0.0,     # task_get で HTTP 500 を返す割合
+        "post_error_rate": 0.0,  # task_post でタスク単位の失敗を返す割合
+        "post_request_error_rate": 0.0,  # task_post のリクエスト全体で HTTP 500 を返す割合
+        "ready_error_rate": 0.0,  # tasks_ready で HTTP 500 を返す割合
+        "ready_delay": 2.0,    # 投稿から tasks_ready に現れるまでの秒数
+        "ready_jitter": 1.0,   # ready_delay に加える 0〜ready_jitter 秒のばらつき
+        "result_items": 10,    # task_get の結果に含めるオーガニック結果の件数
+        "cost": 0.0006,        # 1 タスクあたりの料金（レスポンスの cost）
+        "callback_drop_rate": 0.0,  # pingback / postback を送らない割合（取りこぼしの再現）
+    },
+}
+
+
+def _stable_int(*parts):
+    digest = hashlib.blake2b("\x00".join(map(str, parts)).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def _task_result(config, task_id, task):
+    """task_get/regular（postback の本文も同じ）のレスポンス"""
+    keyword = task["data"].get("keyword", "")
+    # allintitle の件数は 0〜980 件で小さい値に偏らせる（S〜C の各ランクが一定数出るように）
+    spread = _stable_int(keyword) % 100
+    count = spread * spread // 10
+    # 日付指定検索は 3 件に 1 件だけ結果があるものとする
+    recent = "search_param" not in task["data"] or _stable_int(keyword, "recent") % 3 == 0
+    items = [
+        {"type": "organic", "rank_absolute": i + 1, "title": f"{keyword} {i}",
+         "url": f"https://example.com/{_stable_int(keyword, i) % 100000}"}
+        for i in range(config["result_items"] if recent else 0)
+    ]
+    return {
+        "status_code": 20000, "status_message": "Ok.",
+        "tasks": [{
+            "id": task_id, "status_code": 20000, "status_message": "Ok.", "cost": 0,
+            "data": task["data"],
+            "result": [{"keyword": keyword, "se_results_count": count, "items": items}],
+        }],
+    }
+
+
+class _Stats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counts)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.incr("bytes_sent", len(body))
+
+    def _fail(self):
+        self.server.stats.incr("errors_injected")
+        self._send_json({"error": "injected"}, status=500)
+
+    def _should_fail(self, rate):
+        with self.server.rng_lock:
+            return self.server.rng.random() < rate
+
+
+class _SuggestHandler(_Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/_stats":
+            return self._send_json(self.server.stats.snapshot())
+        config = self.server.config
+        self.server.stats.incr("requests")
+        time.sleep(config["latency"])
+        if self._should_fail(config["error_rate"]):
+            return self._fail()
+        query = (parse_qs(url.query).get("q") or [""])[0]
+        # 末尾のサフィックスを除いた部分に、クエリから決まる語を付けた候補を返す
+        base = query.rsplit(" ", 1)[0] if " " in query else query
+        words = [
+            f"語{_stable_int(query, i) % config['vocabulary']:05d}"
+            for i in range(config["suggestions"])
+        ]
+        self._send_json([query, [f"{base} {word}" for word in words]])
+
+
+class _DataForSEOHandler(_Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == "/_stats":
+            stats = self.server.stats.snapshot()
+            with self.server.tasks_lock:
+                stats["tasks_pending"] = len(self.server.tasks)
+            return self._send_json(stats)
+        path = url.path[len(DFS_PREFIX):].strip("/")
+        self.server.stats.incr(f"requests.{path.split('/')[0]}")
+        time.sleep(self.server.config["latency"])
+        if path == "tasks_ready":
+            return self._tasks_ready()
+        if path.startswith("task_get/regular/"):
+            return self._task_get(path.rsplit("/", 1)[1])
+        self._send_json({"status_code": 40400, "status_message": "Not Found."}, status=404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path[len(DFS_PREFIX):].strip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"[]")
+        self.server.stats.incr("bytes_received", length)
+        self.server.stats.incr(f"requests.{path}")
+        time.sleep(self.server.config["latency"])
+        if path != "task_post":
+            return self._send_json({"status_code": 40400, "status_message": "Not Found."}, status=404)
+
+        config = self.server.config
+        if self._should_fail(config["post_request_error_rate"]):
+            # タスクは作らない（クライアントはバッチごと投稿し直す）
+            return self._fail()
+        now = time.time()
+        tasks = []
+        for task in payload:
+            if self._should_fail(config["post_error_rate"]):
+                self.server.stats.incr("errors_injected")
+                tasks.append({"id": None, "status_code": 40501, "status_message": "Invalid Field.",
+                              "cost": 0, "data": task})
+                continue
+            task_id = str(uuid.uuid4())
+            with self.server.rng_lock:
+                ready_at = now + config["ready_delay"] + self.server.rng.random() * config["ready_jitter"]
+            with self.server.tasks_lock:
+                self.server.tasks[task_id] = {"data": task, "ready_at": ready_at}
+            if task.get("pingback_url") or task.get("postback_url"):
+                self.server.callbacks.schedule(ready_at, task_id)
+            tasks.append({"id": task_id, "status_code": 20100, "status_message": "Task Created.",
+                          "cost": config["cost"], "data": task})
+        self.server.stats.incr("tasks_posted", len(tasks))
+        self._send_json({
+            "status_code": 20000, "status_message": "Ok.",
+            "cost": sum(task["cost"] for task in tasks),
+            "tasks_count": len(tasks), "tasks": tasks,
+        })
+
+    def _tasks_ready(self):
+        if self._should_fail(self.server.config["ready_error_rate"]):
+            return self._fail()
+        now = time.time()
+        with self.server.tasks_lock:
+            ready = [
+                {"id": task_id, "tag": task["data"].get("tag"), "se": "google", "se_type": "organic"}
+                for task_id, task in self.server.tasks.items()
+                if task["ready_at"] <= now and not task.get("delivered")
+            ][:1000]
+        self._send_json({
+            "status_code": 20000, "status_message": "Ok.", "cost": 0,
+            "tasks": [{"status_code": 20000, "result_count": len(ready), "result": ready}],
+        })
+
+    def _task_get(self, task_id):
+        config = self.server.config
+        if self._should_fail(config["error_rate"]):
+            return self._fail()
+        with self.server.tasks_lock:
+            task = self.server.tasks.get(task_id)
+            if task is not None and task["ready_at"] <= time.time():
+                del self.server.tasks[task_id]
+            else:
+                task = None
+        if task is None:
+            return self._send_json({
+                "status_code": 20000, "status_message": "Ok.",
+                "tasks": [{"id": task_id, "status_code": 40400, "status_message": "Not Found.", "result": None}],
+            })
+        self.server.stats.incr("tasks_fetched")
+        self._send_json(_task_result(config, task_id, task))
+
+
+class _CallbackSender:
+    """完了時刻になったタスクの pingback / postback を送る（DataForSEO 側の通知の代わり）"""
+
+    def __init__(self, server):
+        self.server = server
+        self._heap = []
+        self._cond = threading.Condition()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def schedule(self, ready_at, task_id):
+        with self._cond:
+            heapq.heappush(self._heap, (ready_at, task_id))
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    self._cond.wait(self._heap[0][0] - time.time() if self._heap else None)
+                _, task_id = heapq.heappop(self._heap)
+            self._send(task_id)
+
+    def _send(self, task_id):
+        server = self.server
+        with server.tasks_lock:
+            task = server.tasks.get(task_id)
+        if task is None:
+            return
+        with server.rng_lock:
+            dropped = server.rng.random() < server.config["callback_drop_rate"]
+        if dropped:
+            server.stats.incr("callbacks_dropped")
+            return
+        data = task["data"]
+        url = data.get("postback_url") or data["pingback_url"]
+        url = url.replace("$id", task_id).replace("$tag", quote(data.get("tag") or ""))
+        if data.get("postback_url"):
+            body = gzip.compress(json.dumps(_task_result(server.config, task_id, task)).encode("utf-8"))
+            request = urllib.request.Request(url, data=body, method="POST",
+                                             headers={"Content-Type": "application/json"})
+            kind = "postback"
+        else:
+            request = urllib.request.Request(url)
+            kind = "pingback"
+        try:
+            urllib.request.urlopen(request, timeout=10).close()
+            server.stats.incr(f"callbacks_sent.{kind}")
+            if kind == "postback":
+                # 結果を届けたタスクは tasks_ready に出さない
+                with server.tasks_lock:
+                    task["delivered"] = True
+        except OSError:
+            server.stats.incr("callbacks_failed")
+
+
+def _make_server(handler, config, seed):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    server.config = config
+    server.stats = _Stats()
+    server.rng = random.Random(seed)
+    server.rng_lock = threading.Lock()
+    server.tasks = {}
+    server.tasks_lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _serve(config, seed, conn):
+    suggest = _make_server(_SuggestHandler, config["suggest"], seed)
+    dataforseo = _make_server(_DataForSEOHandler, config["dataforseo"], seed + 1)
+    dataforseo.callbacks = _CallbackSender(dataforseo)
+    conn.send((suggest.server_address[1], dataforseo.server_address[1]))
+    # 親プロセスから停止の合図（または接続断）が来るまで待つ
+    try:
+        conn.recv()
+    except EOFError:
+        pass
+    suggest.shutdown()
+    dataforseo.shutdown()
+
+
+def merge_config(overrides=None):
+    config = {name: dict(values) for name, values in DEFAULT_CONFIG.items()}
+    for name, values in (overrides or {}).items():
+        config[name].update(values)
+    return config
+
+
+class FakeServers:
+    """
+    代替サーバーを別プロセスで起動するコンテキストマネージャ
+
+    with FakeServers(config) as servers: の中で servers.suggest_url /
+    servers.dataforseo_url を設定の suggest.url / dataforseo.base_url に使う。
+    """
+
+    def __init__(self, config=None, seed=0):
+        self.config = merge_config(config)
+        self.seed = seed
+        self._process = None
+        self._conn = None
+
+    def __enter__(self):
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child = ctx.Pipe()
+        self._process = ctx.Process(target=_serve, args=(self.config, self.seed, child), daemon=True)
+        self._process.start()
+        suggest_port, dataforseo_port = self._conn.recv()
+        self.suggest_url = f"http://127.0.0.1:{suggest_port}/complete/search"
+        self.suggest_stats_url = f"http://127.0.0.1:{suggest_port}/_stats"
+        self.dataforseo_url = f"http://127.0.0.1:{dataforseo_port}{DFS_PREFIX}"
+        self.dataforseo_stats_url = f"http://127.0.0.1:{dataforseo_port}/_stats"
+        return self
+
+    def stats(self):
+        import requests
+
+        return {
+            "suggest": requests.get(self.suggest_stats_url, timeout=10).json(),
+            "dataforseo": requests.get(self.dataforseo_stats_url, timeout=10).json(),
+        }
+
+    def __exit__(self, *exc):
+        try:
+            self._conn.send("stop")
+        except OSError:
+            pass
+        self._process.join(timeout=5)
+        if self._process.is_alive():
+            self._process.terminate()
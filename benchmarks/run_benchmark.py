@@ -0,0 +1,284 @@
+"""
+ヘッドレス実行（run サブコマンドと同じ経路）のベンチマーク
+
+代替サーバー（benchmarks/fake_servers.py）を起動し、一時ディレクトリのキャッシュで
+サジェスト収集 → DataForSEO → ランク判定 → 結果出力 までを実行して、
+キーワード数/秒・最大メモリ使用量・段階ごとの所要時間を JSON に保存する。
+
+    python benchmarks/run_benchmark.py --scenario small
+    python benchmarks/run_benchmark.py --scenario medium --ready-delay 5 --compare benchmarks/results/前回.json
+
+結果は既定で benchmarks/results/<シナリオ>-<日時>.json に保存する。
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+# シナリオ: プロファイルの設定と代替サーバーの設定
+SCENARIOS = {
+    "small": {
+        "seeds": 5,
+        "settings": {"suggest": {"suffixes": ["hiragana"], "engine": "async"}},
+        "servers": {},
+    },
+    "medium": {
+        "seeds": 20,
+        "settings": {"suggest": {"suffixes": ["hiragana", "alphabet"], "engine": "async"}},
+        "servers": {"dataforseo": {"ready_delay": 5.0}},
+    },
+    "deep": {
+        "seeds": 3,
+        "settings": {"suggest": {"suffixes": ["hiragana"], "engine": "async", "max_depth": 2}},
+        "servers": {},
+    },
+}
+
+# 代替サーバーに向けるための共通の設定（待ち時間やレート制限は計測の邪魔になるため緩める）
+BASE_SETTINGS = {
+    "suggest": {"interval": 0, "concurrency": 32, "rate": 500.0, "retries": 1},
+    "dataforseo": {"poll_interval": 0.5},
+}
+
+
+def _merge(base, override):
+    merged = dict(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _peak_rss_mb():
+    # Linux の ru_maxrss は KB、macOS はバイト
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class StageTimer:
+    """progress コールバックから段階ごとの開始・終了時刻と件数を記録する"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def __call__(self, stage, done, total):
+        now = time.perf_counter() - self.started
+        entry = self.stages.setdefault(stage, {"first": now, "last": now, "events": 0})
+        entry["last"] = now
+        entry["events"] += 1
+        entry["done"] = done
+        entry["total"] = total
+
+    def summary(self):
+        stages = {}
+        for stage, entry in self.stages.items():
+            seconds = entry["last"] - entry["first"]
+            stages[stage] = {
+                "first_at": round(entry["first"], 3),
+                "last_at": round(entry["last"], 3),
+                "seconds": round(seconds, 3),
+                "done": entry["done"],
+                "total": entry["total"],
+                "per_sec": round(entry["done"] / seconds, 1) if seconds > 0 else None,
+            }
+        return stages
+
+
+def run_scenario(name, scenario, server_overrides=None, seed=0):
+    """シナリオを 1 回実行して計測結果の dict を返す"""
+    from benchmarks.fake_servers import FakeServers
+
+    work_dir = tempfile.mkdtemp(prefix="demand-miner-bench-")
+    # core を import する前に、キャッシュ・ジャーナルを一時ディレクトリに向ける
+    os.environ["DEMAND_MINER_CACHE_DIR"] = os.path.join(work_dir, "cache")
+    from core.callback import start_callback_server
+    from core.config import DEFAULT_SETTINGS, _deep_merge
+    from core.export import ResultStreamWriter
+    from core.pipeline import run_pipeline
+
+    servers_config = _merge(scenario.get("servers", {}), server_overrides or {})
+    with FakeServers(servers_config, seed=seed) as servers:
+        settings = _deep_merge(DEFAULT_SETTINGS, _merge(BASE_SETTINGS, scenario.get("settings")))
+        settings["suggest"]["url"] = servers.suggest_url
+        settings["dataforseo"]["base_url"] = servers.dataforseo_url
+        callback_server = None
+        if settings["dataforseo"]["callback_mode"] != "poll":
+            # 代替サーバーからの完了通知をこのプロセスの受け口で受ける
+            callback_server = start_callback_server(0, host="127.0.0.1")
+            settings["dataforseo"]["callback_url"] = f"http://127.0.0.1:{callback_server.server_address[1]}"
+        profile = {
+            "name": f"benchmark-{name}",
+            "seeds": [f"シード{i:03d}" for i in range(scenario["seeds"])],
+            "settings": settings,
+        }
+        api_keys = {"dataforseo": {"login": "benchmark", "password": "benchmark"}}
+
+        rss_before = _peak_rss_mb()
+        timer = StageTimer()
+        out = os.path.join(work_dir, "results.csv")
+        with ResultStreamWriter(out, settings["export"]["row_group_size"]) as writer:
+            table = run_pipeline(profile, api_keys, progress=timer, on_rows=writer.write_rows,
+                                 resume=False, summary_dir=os.path.join(work_dir, "runs"))
+            writer.finish(table)
+        seconds = time.perf_counter() - timer.started
+        server_stats = servers.stats()
+        if callback_server is not None:
+            callback_server.shutdown()
+    # パイプライン側の計測値（core.metrics の実行サマリー）
+    run_summary = {}
+    for filename in os.listdir(os.path.join(work_dir, "runs")):
+        with open(os.path.join(work_dir, "runs", filename), encoding="utf-8") as f:
+            run_summary = json.load(f)
+
+    return {
+        "scenario": name,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {"seeds": scenario["seeds"], "settings": scenario.get("settings"),
+                   "servers": servers_config},
+        "keywords": len(table),
+        "ranked": int((table.rank_code >= 0).sum()),
+        "seconds": round(seconds, 3),
+        "keywords_per_sec": round(len(table) / seconds, 1) if seconds > 0 else None,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "peak_rss_delta_mb": round(_peak_rss_mb() - rss_before, 1),
+        "stages": timer.summary(),
+        "poll_cycles": (run_summary.get("metrics") or {}).get("demand_miner_poll_cycles_total", 0),
+        "pipeline_stages": run_summary.get("stages"),
+        "serp": run_summary.get("serp"),
+        "metrics": run_summary.get("metrics"),
+        "servers": server_stats,
+    }
+
+
+def compare(result, baseline):
+    """主要な指標を前回の結果と比べて表示する"""
+    def line(label, new, old, higher_is_better):
+        if new is None or old in (None, 0):
+            print(f"  {label:<28} {new!s:>10}")
+            return
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        mark = "+" if better else ("-" if abs(change) >= 1 else " ")
+        print(f"  {label:<28} {old:>10} → {new:>10}  ({change:+.1f}%) {mark}")
+
+    print(f"比較: {baseline.get('git_commit')} ({baseline.get('timestamp')}) → {result.get('git_commit')}")
+    line("keywords_per_sec", result["keywords_per_sec"], baseline.get("keywords_per_sec"), True)
+    line("seconds", result["seconds"], baseline.get("seconds"), False)
+    line("peak_rss_mb", result["peak_rss_mb"], baseline.get("peak_rss_mb"), False)
+    line("poll_cycles", result.get("poll_cycles"), baseline.get("poll_cycles"), False)
+    for stage, entry in result["stages"].items():
+        old = (baseline.get("stages") or {}).get(stage, {})
+        line(f"{stage}.seconds", entry["seconds"], old.get("seconds"), False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="代替サーバーを使ったヘッドレス実行のベンチマーク")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="small")
+    parser.add_argument("--seeds", type=int, help="シード数（シナリオの値を上書き）")
+    parser.add_argument("--suggest-latency", type=float, help="サジェストの応答遅延（秒）")
+    parser.add_argument("--suggest-error-rate", type=float, help="サジェストのエラー率")
+    parser.add_argument("--dfs-latency", type=float, help="DataForSEO の応答遅延（秒）")
+    parser.add_argument("--dfs-error-rate", type=float, help="task_get のエラー率")
+    parser.add_argument("--dfs-ready-error-rate", type=float, help="tasks_ready のエラー率")
+    parser.add_argument("--dfs-post-error-rate", type=float,
+                        help="task_post のリクエスト全体のエラー率")
+    parser.add_argument("--ready-delay", type=float, help="タスクが tasks_ready に現れるまでの秒数")
+    parser.add_argument("--result-items", type=int, help="task_get の結果に含める件数")
+    parser.add_argument(
+        "--poll-interval", type=float,
+        help="tasks_ready を固定間隔（秒）で確認する（省略時は core.poller の適応的な間隔）",
+    )
+    parser.add_argument(
+        "--callback", choices=["pingback", "postback"],
+        help="tasks_ready の確認の代わりに完了通知で処理する（代替サーバーが通知を送る）",
+    )
+    parser.add_argument("--callback-drop-rate", type=float, help="完了通知を送らない割合")
+    parser.add_argument("--stop-after-s", type=int, help="ランク S が N 件見つかったら打ち切る")
+    parser.add_argument("--max-cost", type=float, help="タスクの料金の上限（USD）")
+    parser.add_argument("--seed", type=int, default=0, help="エラー注入などの乱数のシード")
+    parser.add_argument("--out", help="結果の JSON の保存先（省略時は benchmarks/results/）")
+    parser.add_argument("--compare", help="比較する前回の結果（JSON）")
+    args = parser.parse_args()
+
+    scenario = dict(SCENARIOS[args.scenario])
+    if args.seeds is not None:
+        scenario["seeds"] = args.seeds
+    if args.poll_interval is not None:
+        scenario["settings"] = _merge(scenario.get("settings") or {}, {
+            "dataforseo": {"poll_adaptive": False, "poll_interval": args.poll_interval},
+        })
+    for option in ("stop_after_s", "max_cost"):
+        if getattr(args, option) is not None:
+            scenario["settings"] = _merge(scenario.get("settings") or {}, {
+                "dataforseo": {option: getattr(args, option)},
+            })
+    if args.callback:
+        scenario["settings"] = _merge(scenario.get("settings") or {}, {
+            "dataforseo": {"callback_mode": args.callback, "callback_fallback_interval": 30},
+        })
+    overrides = {"suggest": {}, "dataforseo": {}}
+    for option, (server, key) in {
+        "suggest_latency": ("suggest", "latency"),
+        "suggest_error_rate": ("suggest", "error_rate"),
+        "dfs_latency": ("dataforseo", "latency"),
+        "dfs_error_rate": ("dataforseo", "error_rate"),
+        "dfs_ready_error_rate": ("dataforseo", "ready_error_rate"),
+        "dfs_post_error_rate": ("dataforseo", "post_request_error_rate"),
+        "ready_delay": ("dataforseo", "ready_delay"),
+        "result_items": ("dataforseo", "result_items"),
+        "callback_drop_rate": ("dataforseo", "callback_drop_rate"),
+    }.items():
+        value = getattr(args, option)
+        if value is not None:
+            overrides[server][key] = value
+
+    result = run_scenario(args.scenario, scenario, overrides, seed=args.seed)
+
+    out = args.out or os.path.join(
+        RESULTS_DIR, f"{args.scenario}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(
+        f"{result['keywords']} 件 / {result['seconds']} 秒 "
+        f"({result['keywords_per_sec']} 件/秒, 最大メモリ {result['peak_rss_mb']} MB)"
+    )
+    for stage, entry in result["stages"].items():
+        print(f"  {stage:<8} {entry['seconds']:>8} 秒  {entry['done']}/{entry['total']}")
+    print(f"保存しました: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
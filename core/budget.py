@@ -0,0 +1,212 @@
+"""
+DataForSEO の料金の記録と上限
+
+task_post のレスポンスの cost を日付・プロファイル・種別ごとに
+cache/dataforseo/spend.sqlite3 に積み上げ（SpendLedger）、settings.yaml の budget の
+上限と比べる（Budget）。
+
+- daily: 1 日の全プロファイルの合計
+- profile_daily: 1 日のプロファイルごとの合計
+
+それぞれ soft（超えたら警告を出し、投稿は続ける）と hard（超える分は投稿しない）を
+指定できる。hard の残りは core.planner.SerpTaskPlan が dataforseo.max_cost（1 回の実行の
+上限）と同じように扱い、残りの料金で打ち切る。日付はローカル時刻で区切る。
+jobs のワーカーや別プロセスで並行して動く実行の料金も同じ台帳に記録されるため、
+上限はそれらを合わせた額で判定する。
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from core.config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(CACHE_DIR, "dataforseo", "spend.sqlite3")
+
+SCOPES = ("daily", "profile_daily")
+
+
+def today():
+    return time.strftime("%Y-%m-%d")
+
+
+class SpendLedger:
+    """
+    (日付, プロファイル, 種別) ごとのタスク数と料金の合計
+
+    複数プロセス・スレッドから同時に記録しても合計が失われないよう、1 回の UPSERT で加算する。
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spend (
+                day TEXT NOT NULL,
+                profile TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                tasks INTEGER NOT NULL,
+                cost REAL NOT NULL,
+                PRIMARY KEY (day, profile, kind)
+            ) WITHOUT ROWID
+            """
+        )
+
+    def record(self, profile, spent, day=None):
+        """投稿したタスクの {種別: (タスク数, 料金)} を加える"""
+        rows = [
+            (day or today(), profile, kind, tasks, cost)
+            for kind, (tasks, cost) in spent.items() if tasks or cost
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT INTO spend VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (day, profile, kind) DO UPDATE SET
+                    tasks = tasks + excluded.tasks, cost = cost + excluded.cost
+                """,
+                rows,
+            )
+
+    def total(self, day=None, profile=None):
+        """その日（省略時は今日）の料金の合計。profile を指定するとそのプロファイルに限定"""
+        sql = "SELECT COALESCE(SUM(cost), 0) FROM spend WHERE day = ?"
+        params = [day or today()]
+        if profile is not None:
+            sql += " AND profile = ?"
+            params.append(profile)
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()[0]
+
+    def rows(self, since=None, profile=None):
+        """[{"day", "profile", "kind", "tasks", "cost"}, ...]（日付・プロファイル・種別の順）"""
+        conditions = []
+        params = []
+        if since:
+            conditions.append("day >= ?")
+            params.append(since)
+        if profile:
+            conditions.append("profile = ?")
+            params.append(profile)
+        where = " AND ".join(conditions) or "1"
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT day, profile, kind, tasks, cost FROM spend WHERE {where}"
+                " ORDER BY day, profile, kind",
+                params,
+            ).fetchall()
+        return [
+            {"day": day, "profile": profile, "kind": kind, "tasks": tasks, "cost": cost}
+            for day, profile, kind, tasks, cost in rows
+        ]
+
+    def task_costs(self):
+        """これまでの 1 タスクあたりの料金 {種別: USD}（見積もり用）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, SUM(cost), SUM(tasks) FROM spend GROUP BY kind"
+            ).fetchall()
+        return {kind: cost / tasks for kind, cost, tasks in rows if tasks}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class Budget:
+    """
+    1 つの実行（プロファイル）から見た料金の上限
+
+    limits は {"daily" | "profile_daily": {"soft": USD, "hard": USD}}（None は上限なし）。
+    """
+
+    def __init__(self, ledger, profile, limits=None):
+        self.ledger = ledger
+        self.profile = profile
+        self.limits = {scope: dict((limits or {}).get(scope) or {}) for scope in SCOPES}
+        self._warned = set()
+
+    @classmethod
+    def from_settings(cls, settings, profile, ledger=None):
+        return cls(ledger or SpendLedger(), profile, settings.get("budget"))
+
+    def _label(self, scope):
+        if scope == "daily":
+            return "1 日の上限"
+        return f"プロファイル {self.profile} の 1 日の上限"
+
+    def spent(self):
+        """{"daily": 今日の全プロファイルの合計, "profile_daily": 今日のこのプロファイルの合計}"""
+        day = today()
+        return {
+            "daily": self.ledger.total(day),
+            "profile_daily": self.ledger.total(day, self.profile),
+        }
+
+    def remaining(self):
+        """hard の上限までの残りの料金と、それを決めた上限の説明（上限が無ければ (None, None)）"""
+        limits = [(scope, self.limits[scope].get("hard")) for scope in SCOPES]
+        limits = [(scope, hard) for scope, hard in limits if hard is not None]
+        if not limits:
+            return None, None
+        spent = self.spent()
+        return min(
+            (hard - spent[scope], f"{self._label(scope)} {hard}") for scope, hard in limits
+        )
+
+    def record(self, spent):
+        """投稿したタスクの {種別: (タスク数, 料金)} を台帳に加え、soft の上限を超えたら警告する"""
+        self.ledger.record(self.profile, spent)
+        self.check()
+
+    def check(self):
+        """soft の上限を超えていれば（上限ごとに 1 回だけ）警告する"""
+        spent = self.spent()
+        for scope in SCOPES:
+            soft = self.limits[scope].get("soft")
+            if soft is None or scope in self._warned or spent[scope] < soft:
+                continue
+            self._warned.add(scope)
+            logger.warning(
+                "料金が%s（soft）%s を超えました（%.4f）", self._label(scope), soft, spent[scope]
+            )
+
+    def estimate(self, tasks, default_cost):
+        """{種別: タスク数} の料金の見積もり（実績の無い種別は default_cost で見積もる）"""
+        costs = self.ledger.task_costs()
+        return sum(count * costs.get(kind, default_cost) for kind, count in tasks.items())
+
+    def warn_estimate(self, cost):
+        """見積もりの料金が上限の残りを超える場合に警告する"""
+        spent = self.spent()
+        for scope in SCOPES:
+            for level in ("hard", "soft"):
+                limit = self.limits[scope].get(level)
+                if limit is not None and spent[scope] + cost > limit:
+                    logger.warning(
+                        "見積もりの料金 %.4f が%s（%s）%s の残り %.4f を超えています",
+                        cost, self._label(scope), level, limit, max(limit - spent[scope], 0),
+                    )
+                    break
+
+    def status(self):
+        """実行のサマリー用の {今日の合計と上限}"""
+        spent = self.spent()
+        return {
+            scope: {"spent": round(spent[scope], 6), **self.limits[scope]}
+            for scope in SCOPES
+        }
+
+    def close(self):
+        self.ledger.close()
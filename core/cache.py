@@ -0,0 +1,559 @@
+"""
+取得結果のキャッシュ
+
+種別は "suggest" / "allintitle" / "freshness"。
+
+- SQLiteCache: cache/cache.sqlite3（WAL モード）に保存する。通常はこちらを使う。
+  CachePolicy で種別ごとの有効期限と、読み込みを無視する種別を指定できる
+- TieredCache: SQLiteCache の前段にプロセス内の LRU（MemoryLRU）を置く。
+  get_shared_cache で同一プロセス内の全ハンドラが 1 つのインスタンスを共有する。
+  別のプロセス（main.py cache invalidate など）での削除は、SQLite の世代番号で検出して
+  LRU を捨てる
+- FileCache: cache/<種別>/<キーのSHA1>.json に 1 エントリ 1 ファイルで保存する旧形式。
+  migrate_file_cache で SQLiteCache に移行できる
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from core.config import CACHE_DIR
+from core.metrics import CACHE_LOOKUPS, CACHE_SECONDS
+from core.normalize import KeywordNormalizer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(CACHE_DIR, "cache.sqlite3")
+
+KINDS = ("suggest", "allintitle", "freshness")
+
+
+class CachePolicy:
+    """
+    種別ごとの有効期限（秒。None なら無期限）と、キャッシュを読まずに再取得する種別
+
+    有効期限を過ぎたエントリや bypass に含まれる種別は存在しないものとして扱われ、
+    再取得した結果で上書きされる。
+    """
+
+    def __init__(self, ttl=None, bypass=()):
+        self.ttl = dict(ttl or {})
+        self.bypass = set(bypass)
+
+    @classmethod
+    def from_settings(cls, settings, bypass=()):
+        """settings.yaml の cache.ttl（日数）から作る"""
+        ttl_days = (settings.get("cache") or {}).get("ttl") or {}
+        ttl = {kind: None if days is None else float(days) * 86400 for kind, days in ttl_days.items()}
+        return cls(ttl, bypass)
+
+    def min_fetched_at(self, kind, now=None):
+        """この時刻より前に取得したエントリは期限切れ（無期限なら 0）"""
+        ttl = self.ttl.get(kind)
+        if ttl is None:
+            return 0
+        return (time.time() if now is None else now) - ttl
+
+
+class FileCache:
+    def __init__(self, root=CACHE_DIR, enabled=True):
+        self.root = root
+        # enabled=False（--no-cache）のときは読み込みだけを無効にし、書き込みは行う
+        self.enabled = enabled
+
+    def _path(self, kind, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, kind, f"{digest}.json")
+
+    def get(self, kind, key):
+        if not self.enabled:
+            return None
+        path = self._path(kind, key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def get_many(self, kind, keys):
+        values = {}
+        for key in keys:
+            value = self.get(kind, key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def set(self, kind, key, value):
+        path = self._path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {"key": key, "value": value, "fetched_at": time.time()}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def set_many(self, kind, items):
+        for key, value in items:
+            self.set(kind, key, value)
+
+    def entries(self, kind):
+        """保存済みの (キー, 値, 取得時刻) を列挙する"""
+        directory = os.path.join(self.root, kind)
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    entry = json.load(f)
+                yield entry["key"], entry["value"], entry.get("fetched_at", 0)
+            except (OSError, ValueError, KeyError):
+                logger.warning("読み込めないキャッシュファイルをスキップします: %s", name)
+
+    def close(self):
+        pass
+
+
+class SQLiteCache:
+    """
+    SQLite によるキャッシュ
+
+    (種別, 正規化キーワード, location, language) を主キーとし、値は JSON 文字列で保存する。
+    キーワードは normalizer（core.normalize.KeywordNormalizer）で正規化する。
+    get_many は json_each を使い、キーワード数に関わらず 1 回の索引付きクエリで引く。
+    profile を指定すると、書き込んだキーワードをプロファイルと対応付けて記録し、
+    プロファイル単位で無効化できるようにする。
+    invalidate / renormalize は cache_meta の世代番号（generation）を増やす。
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, location="2392", language="ja", enabled=True,
+                 policy=None, profile=None, normalizer=None):
+        self.path = path
+        self.normalizer = normalizer or KeywordNormalizer()
+        self.location = str(location)
+        self.language = language
+        self.enabled = enabled
+        self.policy = policy or CachePolicy()
+        self.profile = profile
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                kind TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                location TEXT NOT NULL,
+                language TEXT NOT NULL,
+                value TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                PRIMARY KEY (kind, keyword, location, language)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS cache_fetched_at ON cache (kind, fetched_at);
+            CREATE TABLE IF NOT EXISTS cache_profiles (
+                profile TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                keyword TEXT NOT NULL,
+                PRIMARY KEY (profile, kind, keyword)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+
+    def generation(self):
+        """invalidate / renormalize のたびに増える番号（他のプロセスでの削除の検出に使う）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache_meta WHERE name = 'generation'"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def _bump_generation(self):
+        self._conn.execute(
+            "INSERT INTO cache_meta VALUES ('generation', 1)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + 1"
+        )
+
+    def get(self, kind, key):
+        return self.get_many(kind, [key]).get(key)
+
+    def get_many(self, kind, keys):
+        """{キー: 値} を返す（キャッシュに無いキーは含まない）"""
+        return {key: value for key, (value, _) in self.get_entries(kind, keys).items()}
+
+    def get_entries(self, kind, keys):
+        """{キー: (値, 取得時刻)} を返す（キャッシュに無いキーは含まない）"""
+        if not self.enabled or kind in self.policy.bypass or not keys:
+            return {}
+        by_norm = {}
+        for key in keys:
+            by_norm.setdefault(self.normalizer(key), []).append(key)
+        with CACHE_SECONDS.time(op="get"), self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT keyword, value, fetched_at FROM cache
+                WHERE kind = ? AND location = ? AND language = ? AND fetched_at >= ?
+                  AND keyword IN (SELECT value FROM json_each(?))
+                """,
+                (
+                    kind, self.location, self.language, self.policy.min_fetched_at(kind),
+                    json.dumps(list(by_norm), ensure_ascii=False),
+                ),
+            ).fetchall()
+        values = {}
+        for norm, value, fetched_at in rows:
+            decoded = json.loads(value)
+            for key in by_norm[norm]:
+                values[key] = (decoded, fetched_at)
+        CACHE_LOOKUPS.inc(len(values), kind=kind, tier="sqlite", result="hit")
+        CACHE_LOOKUPS.inc(len(keys) - len(values), kind=kind, tier="sqlite", result="miss")
+        return values
+
+    def set(self, kind, key, value):
+        self.set_many(kind, [(key, value)])
+
+    def set_many(self, kind, items):
+        """(キー, 値) の並びを 1 トランザクションで書き込む"""
+        now = time.time()
+        self.import_entries(kind, ((key, value, now) for key, value in items))
+
+    def import_entries(self, kind, entries):
+        """(キー, 値, 取得時刻) の並びを 1 トランザクションで書き込む"""
+        rows = [
+            (kind, self.normalizer(key), self.location, self.language,
+             json.dumps(value, ensure_ascii=False), fetched_at)
+            for key, value, fetched_at in entries
+        ]
+        if not rows:
+            return
+        with CACHE_SECONDS.time(op="set"), self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            if self.profile:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO cache_profiles VALUES (?, ?, ?)",
+                    [(self.profile, kind, row[1]) for row in rows],
+                )
+
+    def invalidate(self, kinds=None, profile=None, older_than=None, pattern=None):
+        """
+        条件に合うエントリを削除し、削除件数を返す
+
+        kinds: 対象の種別（省略時は全種別）
+        profile: そのプロファイルで取得したキーワードに限定
+        older_than: この秒数より前に取得したものに限定
+        pattern: キーワードのワイルドカード（* / ?。SQLite の GLOB）
+        """
+        conditions = []
+        params = []
+        if kinds:
+            conditions.append(f"kind IN ({', '.join('?' * len(kinds))})")
+            params.extend(kinds)
+        if older_than is not None:
+            conditions.append("fetched_at < ?")
+            params.append(time.time() - older_than)
+        if pattern:
+            conditions.append("keyword GLOB ?")
+            params.append(self.normalizer(pattern))
+        if profile:
+            conditions.append(
+                "(kind, keyword) IN (SELECT kind, keyword FROM cache_profiles WHERE profile = ?)"
+            )
+            params.append(profile)
+        where = " AND ".join(conditions) or "1"
+        with self._lock, self._conn:
+            deleted = self._conn.execute(f"DELETE FROM cache WHERE {where}", params).rowcount
+            self._conn.execute(
+                """
+                DELETE FROM cache_profiles WHERE NOT EXISTS (
+                    SELECT 1 FROM cache
+                    WHERE cache.kind = cache_profiles.kind AND cache.keyword = cache_profiles.keyword
+                )
+                """
+            )
+            if deleted:
+                self._bump_generation()
+        return deleted
+
+    def renormalize(self):
+        """
+        保存済みのキーワードを現在の正規化規則で付け直し、変更した件数を返す
+
+        正規化後に同じキーになるエントリが複数ある場合は、取得時刻の新しいものを残す。
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, keyword, location, language, value, fetched_at FROM cache"
+                " ORDER BY fetched_at"
+            ).fetchall()
+            changed = [row for row in rows if self.normalizer(row[1]) != row[1]]
+            with self._conn:
+                self._conn.executemany(
+                    "DELETE FROM cache WHERE kind = ? AND keyword = ? AND location = ? AND language = ?",
+                    [row[:4] for row in changed],
+                )
+                self._conn.executemany(
+                    """
+                    INSERT INTO cache VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (kind, keyword, location, language) DO UPDATE SET
+                        value = excluded.value, fetched_at = excluded.fetched_at
+                    WHERE excluded.fetched_at > cache.fetched_at
+                    """,
+                    [(kind, self.normalizer(kw), loc, lang, value, fetched_at)
+                     for kind, kw, loc, lang, value, fetched_at in changed],
+                )
+                profiles = self._conn.execute("SELECT profile, kind, keyword FROM cache_profiles").fetchall()
+                stale = [row for row in profiles if self.normalizer(row[2]) != row[2]]
+                self._conn.executemany(
+                    "DELETE FROM cache_profiles WHERE profile = ? AND kind = ? AND keyword = ?", stale
+                )
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO cache_profiles VALUES (?, ?, ?)",
+                    [(profile, kind, self.normalizer(kw)) for profile, kind, kw in stale],
+                )
+                if changed:
+                    self._bump_generation()
+        return len(changed)
+
+    def view(self, enabled=True, bypass=(), profile=None, ttl=None):
+        """
+        接続を共有したまま enabled / bypass / profile（と ttl）だけを変えたインスタンスを返す
+
+        ttl（{種別: 秒}）を省略すると元のインスタンスの有効期限を使う。
+        ビューの close は何もしない（接続は元のインスタンスが持つ）。
+        """
+        clone = copy.copy(self)
+        clone.enabled = enabled
+        clone.policy = CachePolicy(self.policy.ttl if ttl is None else ttl, bypass)
+        clone.profile = profile
+        clone._is_view = True
+        return clone
+
+    def close(self):
+        if getattr(self, "_is_view", False):
+            return
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryLRU:
+    """
+    件数とおおよそのバイト数で上限を設けた LRU
+
+    値は (値, 取得時刻, バイト数) で保持する。バイト数は JSON 化した長さで見積もる。
+    generation は載せた値を読んだ時点の SQLiteCache の世代番号（TieredCache が使う）。
+    """
+
+    def __init__(self, max_entries=200000, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.generation = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, min_fetched_at=0):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] < min_fetched_at:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, fetched_at, size=None):
+        if size is None:
+            size = len(json.dumps(value, ensure_ascii=False)) + len(key[1])
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._data[key] = (value, fetched_at, size)
+            self.bytes += size
+            while self._data and (len(self._data) > self.max_entries or self.bytes > self.max_bytes):
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= evicted[2]
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class TieredCache:
+    """
+    MemoryLRU → SQLiteCache の 2 段キャッシュ
+
+    SQLiteCache と同じインターフェースを持つ。読み込みはまず LRU を引き、
+    足りない分だけを 1 回のクエリで SQLite から引いて LRU に載せる。
+    有効期限・bypass・enabled は下段の SQLiteCache の設定に従う。
+    読み込みのたびに下段の世代番号を確かめ、別のプロセスが invalidate / renormalize
+    していれば LRU を空にしてから引く。
+    """
+
+    def __init__(self, backend, lru=None):
+        self.backend = backend
+        self.lru = lru if lru is not None else MemoryLRU()
+
+    @property
+    def policy(self):
+        return self.backend.policy
+
+    def get(self, kind, key):
+        return self.get_many(kind, [key]).get(key)
+
+    def get_many(self, kind, keys):
+        backend = self.backend
+        if not backend.enabled or kind in backend.policy.bypass or not keys:
+            return {}
+        self._revalidate()
+        min_fetched_at = backend.policy.min_fetched_at(kind)
+        values = {}
+        missing = []
+        for key in keys:
+            value = self.lru.get((kind, backend.normalizer(key)), min_fetched_at)
+            if value is None:
+                missing.append(key)
+            else:
+                values[key] = value
+        CACHE_LOOKUPS.inc(len(values), kind=kind, tier="memory", result="hit")
+        CACHE_LOOKUPS.inc(len(missing), kind=kind, tier="memory", result="miss")
+        if missing:
+            for key, (value, fetched_at) in backend.get_entries(kind, missing).items():
+                # 有効期限が下段と同じに切れるよう、LRU には下段の取得時刻で載せる
+                self.lru.put((kind, backend.normalizer(key)), value, fetched_at)
+                values[key] = value
+        return values
+
+    def _revalidate(self):
+        """下段の世代番号が LRU に載せたときから変わっていれば LRU を空にする"""
+        generation = self.backend.generation()
+        if generation != self.lru.generation:
+            self.lru.clear()
+            self.lru.generation = generation
+
+    def set(self, kind, key, value):
+        self.set_many(kind, [(key, value)])
+
+    def set_many(self, kind, items):
+        items = list(items)
+        self._revalidate()
+        self.backend.set_many(kind, items)
+        now = time.time()
+        for key, value in items:
+            self.lru.put((kind, self.backend.normalizer(key)), value, now)
+
+    def import_entries(self, kind, entries):
+        self.backend.import_entries(kind, entries)
+
+    def invalidate(self, **conditions):
+        self.lru.clear()
+        return self.backend.invalidate(**conditions)
+
+    def view(self, enabled=True, bypass=(), profile=None, ttl=None):
+        """
+        LRU と接続を共有し、1 回の実行用に enabled / bypass / profile（と ttl）を変えたビューを返す
+
+        LRU のエントリは取得時刻を持つため、有効期限はビューごとに読み込みの時点で判定する。
+        """
+        return TieredCache(self.backend.view(enabled, bypass, profile, ttl), self.lru)
+
+    def stats(self):
+        return self.lru.stats()
+
+    def close(self):
+        self.backend.close()
+
+
+_shared_caches = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_cache(settings, path=DEFAULT_DB_PATH):
+    """
+    プロセス内で共有する TieredCache を返す（GUI の各ハンドラから使う）
+
+    同じ DB・地域・言語に対しては常に同じインスタンスを返す。呼び出し側で close しないこと。
+    インスタンスの有効期限は最初に開いたプロファイルの設定になるため、プロファイルごとの
+    cache.ttl は view の ttl で渡す（run_pipeline はそうしている）。
+    """
+    dfs = settings.get("dataforseo", {})
+    key = (path, str(dfs.get("location_code", 2392)), dfs.get("language_code", "ja"))
+    with _shared_lock:
+        cache = _shared_caches.get(key)
+        if cache is None:
+            memory = (settings.get("cache") or {}).get("memory") or {}
+            cache = TieredCache(
+                open_cache(settings, path=path),
+                MemoryLRU(
+                    max_entries=memory.get("max_entries", 200000),
+                    max_bytes=int(memory.get("max_mb", 256) * 1024 * 1024),
+                ),
+            )
+            _shared_caches[key] = cache
+        return cache
+
+
+def open_cache(settings, enabled=True, path=DEFAULT_DB_PATH, bypass=(), profile=None):
+    """設定の location_code / language_code・cache.ttl・normalize.rules を使って SQLiteCache を開く"""
+    dfs = settings.get("dataforseo", {})
+    return SQLiteCache(
+        path,
+        location=dfs.get("location_code", 2392),
+        language=dfs.get("language_code", "ja"),
+        enabled=enabled,
+        policy=CachePolicy.from_settings(settings, bypass),
+        profile=profile,
+        normalizer=KeywordNormalizer.from_settings(settings),
+    )
+
+
+def migrate_file_cache(target, root=CACHE_DIR, batch_size=1000):
+    """旧形式のファイルキャッシュを SQLiteCache に移行し、種別ごとの件数を返す"""
+    source = FileCache(root)
+    counts = {}
+    for kind in KINDS:
+        count = 0
+        batch = []
+        for entry in source.entries(kind):
+            batch.append(entry)
+            if len(batch) >= batch_size:
+                target.import_entries(kind, batch)
+                count += len(batch)
+                batch = []
+        target.import_entries(kind, batch)
+        counts[kind] = count + len(batch)
+    return counts
@@ -0,0 +1,275 @@
+"""
+DataForSEO の完了通知（pingback / postback）の受信
+
+task_post に pingback_url / postback_url を付けると、タスクの完了時に DataForSEO から
+通知が届く。tasks_ready の確認を待たずに取得（pingback）または結果の取り込み
+（postback）ができる。
+
+- pingback: GET <callback_url>/dataforseo/pingback?id=<タスク ID>&tag=<タグ>&token=<トークン>
+  → SerpTaskEngine がすぐに task_get/regular で取得する
+- postback: POST <callback_url>/dataforseo/postback?id=<タスク ID>&tag=<タグ>&token=<トークン>
+  （本文は task_get/regular と同じ形式の JSON。gzip 圧縮されていてもよい）
+  → 取得せずにそのまま結果として取り込む
+
+受け口は公開 URL から到達できるため、通知の URL には CallbackReceiver ごとに生成した
+秘密のトークンを付け、受信時に照合する（authorize。一致しなければ 403）。さらに通知の
+タグが投稿したタスクのタグ（種別:キーワード）と一致しないものは取り込まない。
+
+通知はプロセス内で共有する CallbackReceiver（get_receiver）が受け、タスク ID ごとに
+投稿した SerpTaskEngine の CallbackInbox に振り分ける。HTTP の受け口は GUI のサーバー
+（main.py の mount_callbacks）か、start_callback_server で起動する別ポートのサーバー。
+受け口が無いプロセスでは、callback_mode を指定していても tasks_ready の確認で処理する。
+"""
+
+import gzip
+import hmac
+import json
+import logging
+import queue
+import secrets
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from core.metrics import CALLBACKS
+
+logger = logging.getLogger(__name__)
+
+PINGBACK_PATH = "/dataforseo/pingback"
+POSTBACK_PATH = "/dataforseo/postback"
+MODES = ("poll", "pingback", "postback")
+
+# 投稿のレスポンスより先に届いた通知を保持する件数と秒数
+UNCLAIMED_LIMIT = 10000
+UNCLAIMED_TTL = 600
+
+
+def callback_fields(mode, callback_url, token=None):
+    """task_post のタスク定義に加える pingback_url / postback_url（token は受信時に照合する）"""
+    base = callback_url.rstrip("/")
+    query = "id=$id&tag=$tag" + (f"&token={token}" if token else "")
+    if mode == "pingback":
+        return {"pingback_url": f"{base}{PINGBACK_PATH}?{query}"}
+    if mode == "postback":
+        return {"postback_url": f"{base}{POSTBACK_PATH}?{query}", "postback_data": "regular"}
+    return {}
+
+
+def parse_postback(body):
+    """postback の本文から [(タスク ID, タグ, result の先頭要素 or None), ...] を取り出す"""
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    data = json.loads(body or b"{}")
+    tasks = []
+    for task in data.get("tasks") or []:
+        if not task.get("id"):
+            continue
+        result = task.get("result") if task.get("status_code") == 20000 else None
+        tag = (task.get("data") or {}).get("tag")
+        tasks.append((task["id"], tag, result[0] if result else None))
+    return tasks
+
+
+class CallbackInbox:
+    """
+    1 つの SerpTaskEngine 宛ての通知
+
+    get() は (タスク ID, 結果) を返す。結果は pingback なら None（取得が必要）、
+    postback なら task_get/regular の result の先頭要素。wake() は get() の待ちを
+    解くだけの空の通知で、取得の完了を同じ待ちで拾うのに使う。
+    """
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self._queue = queue.Queue()
+
+    @property
+    def token(self):
+        return self.receiver.token
+
+    def expect(self, tasks):
+        """投稿したタスク [(タスク ID, タグ), ...] の通知をこの受信箱に届けるよう登録する"""
+        self.receiver._expect(self, tasks)
+
+    def deliver(self, task_id, result):
+        self._queue.put((task_id, result))
+
+    def wake(self, *_):
+        self._queue.put(None)
+
+    def get(self, timeout):
+        """通知を 1 件待ち、続けて届いている分もまとめて返す（タイムアウトなら空）"""
+        items = []
+        try:
+            items.append(self._queue.get(timeout=max(timeout, 0)))
+            while True:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return [item for item in items if item is not None]
+
+    def close(self):
+        self.receiver._release(self)
+
+
+class CallbackReceiver:
+    def __init__(self, token=None):
+        self._lock = threading.Lock()
+        self._routes = {}     # タスク ID -> (CallbackInbox, タグ)
+        self._unclaimed = {}  # タスク ID -> (受信時刻, タグ, 結果)
+        self.listening = False
+        # 通知の URL に付ける秘密のトークン（プロセスごとに生成する）
+        self.token = token or secrets.token_urlsafe(24)
+
+    def open_inbox(self):
+        return CallbackInbox(self)
+
+    def authorize(self, token):
+        """通知の URL のトークンが一致するか"""
+        return bool(token) and hmac.compare_digest(str(token), self.token)
+
+    def _expect(self, inbox, tasks):
+        early = []
+        rejected = []
+        with self._lock:
+            for task_id, tag in tasks:
+                if task_id in self._unclaimed:
+                    _, received_tag, result = self._unclaimed.pop(task_id)
+                    if received_tag == tag:
+                        early.append((task_id, result))
+                        continue
+                    rejected.append(task_id)
+                self._routes[task_id] = (inbox, tag)
+        for task_id in rejected:
+            self._reject(task_id)
+        for task_id, result in early:
+            inbox.deliver(task_id, result)
+
+    def _release(self, inbox):
+        with self._lock:
+            for task_id in [tid for tid, (owner, _) in self._routes.items() if owner is inbox]:
+                del self._routes[task_id]
+
+    def _reject(self, task_id, kind=None):
+        logger.warning("タグが投稿したタスクと一致しない完了通知を無視しました: %s", task_id)
+        if kind:
+            CALLBACKS.inc(kind=kind, result="rejected")
+
+    def _dispatch(self, task_id, tag, result, kind):
+        with self._lock:
+            route = self._routes.get(task_id)
+            if route is None:
+                # 投稿のレスポンスより先に届いた可能性があるため、しばらく保持する
+                now = time.time()
+                for tid in [t for t, (at, _, _) in self._unclaimed.items() if at < now - UNCLAIMED_TTL]:
+                    del self._unclaimed[tid]
+                if len(self._unclaimed) < UNCLAIMED_LIMIT:
+                    self._unclaimed[task_id] = (now, tag, result)
+            elif route[1] == tag:
+                del self._routes[task_id]
+        if route is not None and route[1] != tag:
+            # 経路は残し、tasks_ready の確認で回収する
+            self._reject(task_id, kind)
+            return
+        CALLBACKS.inc(kind=kind, result="routed" if route is not None else "unclaimed")
+        if route is not None:
+            route[0].deliver(task_id, result)
+
+    def pingback(self, task_id, tag=None):
+        if task_id:
+            self._dispatch(task_id, tag, None, "pingback")
+
+    def postback(self, body):
+        """postback の本文を取り込み、取り込んだタスク数を返す"""
+        tasks = parse_postback(body)
+        for task_id, tag, result in tasks:
+            self._dispatch(task_id, tag, result, "postback")
+        return len(tasks)
+
+
+_receiver = CallbackReceiver()
+
+
+def get_receiver():
+    """プロセス内で共有する CallbackReceiver"""
+    return _receiver
+
+
+def open_inbox(settings, receiver=None):
+    """
+    設定の callback_mode に応じて受信箱を開く
+
+    "poll" の場合と、このプロセスに通知の受け口が無い場合は None を返す。
+    """
+    mode = settings.get("callback_mode", "poll")
+    if mode == "poll":
+        return None
+    if mode not in MODES:
+        raise ValueError(f"未知の callback_mode: {mode}")
+    receiver = receiver or get_receiver()
+    if not settings.get("callback_url"):
+        logger.warning("callback_url が未設定のため tasks_ready の確認で処理します")
+        return None
+    if not receiver.listening:
+        logger.warning("完了通知の受け口が起動していないため tasks_ready の確認で処理します")
+        return None
+    return receiver.open_inbox()
+
+
+def start_callback_server(port, host="0.0.0.0", receiver=None):
+    """pingback / postback を受けるサーバーをデーモンスレッドで起動する"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    receiver = receiver or get_receiver()
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _query(self):
+            url = urlparse(self.path)
+            query = {name: values[0] for name, values in parse_qs(url.query).items()}
+            return url.path, query
+
+        def do_GET(self):
+            path, query = self._query()
+            if path != PINGBACK_PATH:
+                self.send_error(404)
+                return
+            if not receiver.authorize(query.get("token")):
+                self._reply(403)
+                return
+            receiver.pingback(query.get("id"), query.get("tag"))
+            self._reply(200)
+
+        def do_POST(self):
+            path, query = self._query()
+            if path != POSTBACK_PATH:
+                self.send_error(404)
+                return
+            if not receiver.authorize(query.get("token")):
+                self._reply(403)
+                return
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            try:
+                receiver.postback(body)
+            except (OSError, ValueError) as e:
+                logger.warning("postback を読み取れませんでした: %s", e)
+                self._reply(400)
+                return
+            self._reply(200)
+
+        def log_message(self, format, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # 多数のタスクの通知が同時に届いても接続を拒否しないよう、待ち行列を長くする
+        request_queue_size = 128
+        daemon_threads = True
+
+    server = Server((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="callback", daemon=True).start()
+    receiver.listening = True
+    return server
@@ -0,0 +1,182 @@
+"""
+表記違いのキーワードのクラスタリング（MinHash + LSH）
+
+サジェストには助詞や語順だけが異なるキーワード（「東京 カフェ おすすめ」と
+「おすすめ カフェ 東京」など）が多く含まれる。DataForSEO に問い合わせる前に
+これらをまとめ、クラスタごとに代表の 1 件だけを問い合わせる。
+
+- 各キーワードを空白で区切った語ごとの文字 n-gram の集合にする（語順に依存しない）
+- n-gram の集合から MinHash 署名を作り（NumPy でまとめて計算）、署名を帯に分けた
+  LSH で候補の組（いずれかの帯で同じバケットに入った組）を見つける
+- 候補の組は署名から推定した Jaccard 係数がしきい値以上のものだけを同じクラスタにする。
+  バケット内の組はすべて比べる（すでに同じクラスタにつながった組は省く）
+
+計算量はキーワード数にほぼ比例する。
+"""
+
+import hashlib
+import logging
+
+import numpy as np
+
+from core.config import DEFAULT_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# MinHash の置換に使うメルセンヌ素数（a * x が uint64 に収まる大きさ）
+_PRIME = (1 << 31) - 1
+_CHUNK = 1 << 18
+# これ以下の件数のバケットは、全組をまとめて配列で比べる
+_PAIRWISE_MAX = 64
+
+
+def shingles(keyword, ngram=2):
+    """語ごとの文字 n-gram の集合（語が n 文字未満ならその語そのもの）"""
+    grams = set()
+    for token in keyword.split():
+        if len(token) <= ngram:
+            grams.add(token)
+        else:
+            grams.update(token[i:i + ngram] for i in range(len(token) - ngram + 1))
+    return grams
+
+
+def _hash(gram):
+    return int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+def _bands(num_perm, threshold):
+    """(帯の数, 帯あたりの行数) を、LSH の境界 (1/b)^(1/r) がしきい値に最も近くなるように選ぶ"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+def minhash_signatures(keywords, ngram=2, num_perm=64, seed=1):
+    """キーワードごとの MinHash 署名（len(keywords) x num_perm の uint64 配列）"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+    b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    # n-gram に通し番号を振り、キーワードごとの n-gram 番号を連続して並べる
+    vocab = {}
+    ids = []
+    counts = np.empty(len(keywords), dtype=np.int64)
+    for i, keyword in enumerate(keywords):
+        grams = shingles(keyword, ngram) or {""}
+        ids.extend(vocab.setdefault(gram, len(vocab)) for gram in grams)
+        counts[i] = len(grams)
+    gram_hashes = np.fromiter(map(_hash, vocab), dtype=np.uint64, count=len(vocab)) % _PRIME
+    hashes = gram_hashes[np.asarray(ids, dtype=np.int64)]
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    signatures = np.empty((len(keywords), num_perm), dtype=np.uint64)
+    # 全 n-gram x 置換 の行列を一度に作るとメモリが大きいため、キーワード単位で区切る
+    step = max(1, _CHUNK // max(1, int(counts.mean()) if len(counts) else 1))
+    for start in range(0, len(keywords), step):
+        end = min(start + step, len(keywords))
+        lo, hi = offsets[start], offsets[end]
+        permuted = (hashes[lo:hi, None] * a + b) % _PRIME
+        signatures[start:end] = np.minimum.reduceat(permuted, offsets[start:end] - lo, axis=0)
+    return signatures
+
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def _link_pairs(signatures, left, right, threshold, parent):
+    """組 (left[k], right[k]) のうち署名の一致率がしきい値以上のものをつなぎ、つないだ数を返す"""
+    linked = 0
+    step = max(1, _CHUNK // signatures.shape[1])
+    for start in range(0, len(left), step):
+        lo, hi = left[start:start + step], right[start:start + step]
+        similar = (signatures[lo] == signatures[hi]).mean(axis=1) >= threshold
+        for i, j in zip(lo[similar].tolist(), hi[similar].tolist()):
+            ri, rj = _find(parent, i), _find(parent, j)
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+                linked += 1
+    return linked
+
+
+def _link_bucket(signatures, members, threshold, parent):
+    """
+    LSH の同じバケットに入ったキーワード（members）の全組を比べ、署名の一致率が
+    しきい値以上のものを同じクラスタにつなぎ、つないだ数を返す
+    """
+    block = signatures[members]
+    roots = np.array([_find(parent, i) for i in members.tolist()])
+    linked = 0
+    for k in range(len(members) - 1):
+        rest = np.flatnonzero(roots[k + 1:] != roots[k]) + k + 1
+        if not len(rest):
+            continue
+        similarity = (block[rest] == block[k]).mean(axis=1)
+        for j in rest[similarity >= threshold].tolist():
+            if roots[j] == roots[k]:
+                continue
+            root, other = sorted((roots[k], roots[j]))
+            parent[other] = root
+            roots[roots == other] = root
+            linked += 1
+    return linked
+
+
+def cluster_keywords(keywords, threshold=None, ngram=2, num_perm=64, normalizer=None):
+    """
+    近い表記のキーワードをまとめ、{キーワード: クラスタの代表} を返す
+
+    代表はクラスタ内で最初に現れたキーワード。threshold を省略すると設定の既定値
+    （cluster.threshold）を使う。normalizer（core.normalize.KeywordNormalizer）を
+    渡すと正規化してから比較する。
+    """
+    if threshold is None:
+        threshold = DEFAULT_SETTINGS["cluster"]["threshold"]
+    keywords = list(keywords)
+    n = len(keywords)
+    if n == 0:
+        return {}
+    texts = [normalizer(kw) for kw in keywords] if normalizer else keywords
+    signatures = minhash_signatures(texts, ngram, num_perm)
+    bands, rows = _bands(num_perm, threshold)
+
+    parent = list(range(n))
+    pairs = 0
+    for band in range(bands):
+        block = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        _, buckets = np.unique(block.view(f"V{block.shape[1] * 8}").ravel(), return_inverse=True)
+        order = np.argsort(buckets, kind="stable")
+        sorted_buckets = buckets[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_buckets[1:] != sorted_buckets[:-1])))
+        ends = np.append(starts[1:], n)
+        sizes = ends - starts
+        # 同じ帯のバケットに入った組のうち、署名全体の一致率がしきい値以上のものをつなぐ。
+        # 小さいバケットは同じ件数のものごとに全組を並べてまとめて比べ、大きいバケットは
+        # すでにつながった組を省きながらバケットごとに比べる
+        small = (sizes > 1) & (sizes <= _PAIRWISE_MAX)
+        for size in np.unique(sizes[small]).tolist():
+            members = order[starts[sizes == size][:, None] + np.arange(size)]
+            left, right = np.triu_indices(size, 1)
+            pairs += _link_pairs(
+                signatures, members[:, left].ravel(), members[:, right].ravel(), threshold, parent
+            )
+        for start, end in zip(starts[sizes > _PAIRWISE_MAX].tolist(), ends[sizes > _PAIRWISE_MAX].tolist()):
+            pairs += _link_bucket(signatures, order[start:end], threshold, parent)
+
+    representatives = {}
+    for i, keyword in enumerate(keywords):
+        representatives[keyword] = keywords[_find(parent, i)]
+    logger.info("クラスタリング: %d 件 → %d クラスタ", n, n - pairs)
+    return representatives
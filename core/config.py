@@ -0,0 +1,198 @@
+"""
+設定ファイル・APIキー・プロファイルの読み込み
+"""
+
+import copy
+import os
+
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIG_DIR = os.path.join(ROOT_DIR, "config")
+PROFILES_DIR = os.path.join(ROOT_DIR, "profiles")
+# ベンチマークなどで本番のキャッシュ・タスクジャーナルに触れないよう、環境変数で差し替えられる
+CACHE_DIR = os.environ.get("DEMAND_MINER_CACHE_DIR") or os.path.join(ROOT_DIR, "cache")
+OUTPUTS_DIR = os.path.join(ROOT_DIR, "outputs")
+
+# settings.yaml に書かれていない項目はこの値で補完する
+DEFAULT_SETTINGS = {
+    "suggest": {
+        "hl": "ja",
+        "gl": "jp",
+        "interval": 0.5,
+        "timeout": 10,
+        "suffixes": ["hiragana", "alphabet", "digits"],
+        # "sequential"（順次取得）または "async"（並列取得）
+        "engine": "sequential",
+        "concurrency": 8,
+        "rate": 5.0,
+        "burst": None,
+        "retries": 2,
+        # 再帰展開の深さ（1 ならシードのサジェストのみ）と展開順（"yield" / "fifo"）
+        "max_depth": 1,
+        "priority": "yield",
+        "snapshot_every": 500,
+        # サジェスト API の URL（null なら Google。ベンチマークの代替サーバーを指すのに使う）
+        "url": None,
+        # 訪問済み集合（"set" / "bloom"）。bloom は想定件数と偽陽性率からフィルタの大きさを決め、
+        # visited_mmap なら cache/frontier/ 以下のファイルに mmap する
+        "visited": "set",
+        "visited_capacity": 1000000,
+        "visited_error_rate": 0.001,
+        "visited_mmap": True,
+    },
+    "dataforseo": {
+        "location_code": 2392,
+        "language_code": "ja",
+        "batch_size": 100,
+        "poll_interval": 10,
+        "poll_timeout": 3600,
+        # tasks_ready の確認間隔を過去の完了時間の分布（cache/dataforseo/queue_latency.json）と
+        # 指数バックオフで決める（false なら poll_interval の固定間隔）
+        "poll_adaptive": True,
+        "poll_min_interval": 1,
+        "poll_max_interval": 20,
+        "poll_quantile": 0.1,
+        # 完了通知（core.callback）。"poll"（tasks_ready を確認）/ "pingback"（通知を受けて取得）/
+        # "postback"（結果を通知で受け取る）。callback_url は DataForSEO から到達できる公開 URL で、
+        # GUI のサーバーか --callback-port で起動した受け口に転送されている必要がある
+        "callback_mode": "poll",
+        "callback_url": None,
+        # 通知の取りこぼしに備えて tasks_ready を確認する間隔（秒）
+        "callback_fallback_interval": 300,
+        # 投稿済みで未取得のタスク数の上限と、結果取得の並列数
+        "max_in_flight": 1000,
+        "fetch_workers": 8,
+        # task_get が失敗したタスクを取得し直す回数と最初の間隔（秒。1 回ごとに倍にする）
+        "fetch_retries": 3,
+        "fetch_retry_interval": 5,
+        # task_post / tasks_ready のリクエストが失敗した場合に、同じバッチを投稿し直す回数
+        # （間隔は fetch_retry_interval から倍にしていく。tasks_ready は次の確認まで待つ）
+        "post_retries": 3,
+        # 日付指定検索の期間（Google の tbs=qdr:X。d / w / m / y）
+        "freshness_period": "m",
+        # allintitle 件数だけでランク C に決まるキーワードの日付指定検索を省略する（core.planner）。
+        # allintitle が未取得のキーワードの日付指定検索は、その結果を受け取ってから投稿する
+        "skip_freshness_for_c": True,
+        # S / A になりそうなキーワード（似たキーワードの allintitle 件数が少ない・ロングテール）から
+        # 投稿する。stop_after_s 件のランク S が見つかるか、この実行の料金が max_cost（USD）に
+        # 達したら、未投稿のキーワードは問い合わせずに終える（null なら打ち切らない）
+        "prioritize": True,
+        "stop_after_s": None,
+        "max_cost": None,
+        # API のベース URL（null なら本番の serp/google/organic）
+        "base_url": None,
+    },
+    # 種別ごとのキャッシュ有効期限（日数。null なら無期限）
+    "cache": {
+        "ttl": {
+            "suggest": 30,
+            "allintitle": 30,
+            "freshness": 7,
+        },
+        # プロセス内 LRU の上限（GUI で共有するキャッシュ用）
+        "memory": {
+            "max_entries": 200000,
+            "max_mb": 256,
+        },
+    },
+    # キーワードの正規化規則（core.normalize。キャッシュのキーにも使うため全プロファイル共通）
+    "normalize": {
+        "rules": ["nfkc", "lower", "space"],
+    },
+    # DataForSEO に問い合わせる前の類似キーワードのクラスタリング（core.cluster）
+    "cluster": {
+        "enabled": False,
+        # 同じクラスタにする文字 n-gram の Jaccard 係数の下限
+        "threshold": 0.8,
+        "ngram": 2,
+        "num_perm": 64,
+        # クラスタの代表の値を他のキーワードにも使う（false なら他のキーワードは未判定のまま）
+        "inherit": True,
+    },
+    # 結果ファイルの書き出し単位（行数。Parquet では 1 行グループ）
+    "export": {
+        "row_group_size": 10000,
+    },
+    # DataForSEO の料金の上限（USD。core.budget）。daily は 1 日の全プロファイルの合計、
+    # profile_daily は 1 日のプロファイルごとの合計。soft を超えると警告し、hard を超える分は
+    # 投稿しない（null なら上限なし）。1 回の実行の上限は dataforseo.max_cost
+    "budget": {
+        "daily": {"soft": None, "hard": None},
+        "profile_daily": {"soft": None, "hard": None},
+    },
+    # バックグラウンドでジョブを実行するワーカー数
+    "jobs": {
+        "workers": 2,
+    },
+    # allintitle 件数の上限値。直近の競合記事がある場合は 1 ランク下げる
+    "rank": {
+        "S": 10,
+        "A": 30,
+        "B": 100,
+    },
+}
+
+
+def _deep_merge(base, override):
+    merged = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _deep_merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _load_yaml(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+def load_settings(path=None):
+    """config/settings.yaml を読み込み、既定値とマージして返す"""
+    path = path or os.path.join(CONFIG_DIR, "settings.yaml")
+    return _deep_merge(DEFAULT_SETTINGS, _load_yaml(path))
+
+
+def load_api_keys(path=None):
+    """config/api_keys.yaml を読み込む（存在しなければ空の dict）"""
+    path = path or os.path.join(CONFIG_DIR, "api_keys.yaml")
+    return _load_yaml(path)
+
+
+def load_profile(name_or_path, settings=None):
+    """
+    プロファイルを読み込む
+
+    name_or_path にはプロファイル名（profiles/<name>.yaml）か YAML ファイルのパスを指定する。
+    プロファイル内の suggest / dataforseo / cache / cluster / export / rank はグローバル設定を上書きする。
+    """
+    if os.path.isfile(name_or_path):
+        path = name_or_path
+    else:
+        path = os.path.join(PROFILES_DIR, f"{name_or_path}.yaml")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"プロファイルが見つかりません: {name_or_path}")
+
+    profile = _load_yaml(path)
+    profile.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    profile.setdefault("seeds", [])
+
+    settings = settings if settings is not None else load_settings()
+    overrides = {k: profile[k] for k in ("suggest", "dataforseo", "cache", "cluster", "export", "rank") if k in profile}
+    profile["settings"] = _deep_merge(settings, overrides)
+    return profile
+
+
+def read_seeds(path):
+    """1 行 1 シードのテキストファイルを読み込む（空行と # コメントは無視）"""
+    seeds = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                seeds.append(line)
+    return seeds
@@ -0,0 +1,125 @@
+"""
+DataForSEO Google Organic SERP API (Standard queue) クライアント
+
+task_post でタスクをバッチ投稿し、tasks_ready で完了を確認してから
+task_get/regular で結果を取得する。
+"""
+
+import time
+
+from core.metrics import DFS_BYTES, DFS_REQUESTS, DFS_SECONDS
+
+API_BASE = "https://api.dataforseo.com/v3/serp/google/organic"
+
+STATUS_OK = 20000
+STATUS_TASK_CREATED = 20100
+
+# タスク種別
+ALLINTITLE = "allintitle"
+FRESHNESS = "freshness"
+
+
+class DataForSEOError(Exception):
+    pass
+
+
+class DataForSEOClient:
+    def __init__(self, login, password, base_url=API_BASE, timeout=60, pool_size=10):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.auth = (login, password)
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=pool_size))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=pool_size))
+
+    @classmethod
+    def from_api_keys(cls, api_keys, **kwargs):
+        creds = (api_keys or {}).get("dataforseo") or {}
+        if not creds.get("login") or not creds.get("password"):
+            raise DataForSEOError(
+                "DataForSEO のログイン情報がありません（config/api_keys.yaml を確認してください）"
+            )
+        return cls(creds["login"], creds["password"], **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def _request(self, method, path, payload=None):
+        endpoint = path.split("/")[0]
+        started = time.perf_counter()
+        try:
+            resp = self.session.request(
+                method, f"{self.base_url}/{path}", json=payload, timeout=self.timeout
+            )
+            resp.raise_for_status()
+            DFS_BYTES.inc(len(resp.content), endpoint=endpoint)
+            data = resp.json()
+            if data.get("status_code") != STATUS_OK:
+                raise DataForSEOError(f"{path}: {data.get('status_code')} {data.get('status_message')}")
+        except Exception:
+            DFS_REQUESTS.inc(endpoint=endpoint, result="error")
+            raise
+        finally:
+            DFS_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        DFS_REQUESTS.inc(endpoint=endpoint, result="ok")
+        return data
+
+    def task_post(self, tasks):
+        """タスクを投稿し、レスポンスの tasks 配列を返す（最大 100 件）"""
+        return self._request("POST", "task_post", tasks).get("tasks") or []
+
+    def tasks_ready(self):
+        """完了済みで未取得のタスク（id / tag などを含む dict）の一覧を返す"""
+        items = []
+        for task in self._request("GET", "tasks_ready").get("tasks") or []:
+            items.extend(task.get("result") or [])
+        return items
+
+    def task_get(self, task_id):
+        """task_get/regular で結果を取得し、result の先頭要素を返す"""
+        tasks = self._request("GET", f"task_get/regular/{task_id}").get("tasks") or []
+        if not tasks or not tasks[0].get("result"):
+            return None
+        return tasks[0]["result"][0]
+
+
+def build_task(keyword, kind, settings, tag=None):
+    """キーワードと種別から task_post 用のタスク定義を作る"""
+    task = {
+        "location_code": settings.get("location_code", 2392),
+        "language_code": settings.get("language_code", "ja"),
+        "tag": tag or task_tag(kind, keyword),
+    }
+    if kind == ALLINTITLE:
+        task["keyword"] = f"allintitle:{keyword}"
+    elif kind == FRESHNESS:
+        task["keyword"] = keyword
+        task["search_param"] = f"tbs=qdr:{settings.get('freshness_period', 'm')}"
+    else:
+        raise ValueError(f"未知のタスク種別: {kind}")
+    return task
+
+
+def task_tag(kind, keyword):
+    """build_task が付けるタグ（種別:キーワード）"""
+    return f"{kind}:{keyword}"
+
+
+def parse_task_tag(tag):
+    """build_task で付けたタグ "種別:キーワード" を分解する"""
+    kind, _, keyword = (tag or "").partition(":")
+    return kind, keyword
+
+
+def extract_signal(kind, result):
+    """task_get の結果から種別ごとの指標を取り出す"""
+    if result is None:
+        return None
+    if kind == ALLINTITLE:
+        return result.get("se_results_count") or 0
+    # 日付指定検索はオーガニック結果の件数を直近の競合記事数とみなす
+    items = result.get("items") or []
+    return sum(1 for item in items if item.get("type") == "organic")
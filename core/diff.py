@@ -0,0 +1,229 @@
+"""
+実行結果どうしの差分
+
+2 つの結果ファイル（outputs/ の CSV / Parquet / Arrow）を正規化したキーワードで突き合わせ、
+新規・消滅・ランク変化・allintitle 件数の変化を列挙する。正規化はキャッシュのキーと同じ
+規則（settings.yaml の normalize.rules。KeywordNormalizer.from_settings）で行う。
+
+旧い方の結果はキーワードの 64bit ハッシュ・allintitle・ランクの NumPy 配列だけを
+メモリに持ち（100 万行でおよそ 20MB）、新しい方はバッチ単位で読みながら
+ハッシュの二分探索で突き合わせる。消滅したキーワードは旧い方をもう一度読んで列挙する。
+"""
+
+import csv
+import os
+
+import numpy as np
+
+from core.normalize import KeywordNormalizer
+from core.ranker import RANKS
+
+DIFF_COLUMNS = [
+    "keyword", "change", "old_rank", "new_rank", "old_allintitle", "new_allintitle",
+    "allintitle_delta",
+]
+
+# 変化の種類
+NEW = "new"
+REMOVED = "removed"
+RANK_CHANGED = "rank_changed"
+ALLINTITLE_CHANGED = "allintitle_changed"
+
+BATCH_SIZE = 65536
+
+
+def _int_or_none(value):
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+def _rank_code(rank):
+    return RANKS.index(rank) if rank in RANKS else -1
+
+
+def iter_result_batches(path, batch_size=BATCH_SIZE):
+    """
+    結果ファイルを列単位のバッチで読む
+
+    (キーワードのリスト, allintitle の float 配列（未取得は NaN）, ランク番号の int8 配列
+    （未判定は -1）) を返す。
+    """
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append((row["keyword"], _int_or_none(row.get("allintitle")), row.get("rank")))
+                if len(batch) >= batch_size:
+                    yield _csv_columns(batch)
+                    batch = []
+            if batch:
+                yield _csv_columns(batch)
+        return
+
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    columns = ["keyword", "allintitle", "rank"]
+    if path.endswith((".arrow", ".arrows")):
+        with pa.OSFile(path, "rb") as source:
+            for record_batch in pa.ipc.open_stream(source):
+                yield _arrow_columns(record_batch.select(columns))
+        return
+
+    # Parquet は単一ファイルのほか、中断時に残る .parts/ ディレクトリも読める
+    dataset = ds.dataset(path, format="parquet")
+    for record_batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield _arrow_columns(record_batch)
+
+
+def _csv_columns(batch):
+    keywords = [kw for kw, _, _ in batch]
+    allintitle = np.array([np.nan if a is None else a for _, a, _ in batch], dtype=np.float64)
+    ranks = np.array([_rank_code(r) for _, _, r in batch], dtype=np.int8)
+    return keywords, allintitle, ranks
+
+
+def _arrow_columns(record_batch):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    keywords = record_batch.column("keyword").to_pylist()
+    allintitle = pc.cast(record_batch.column("allintitle"), pa.float64())
+    allintitle = allintitle.to_numpy(zero_copy_only=False)
+    ranks = pc.index_in(record_batch.column("rank"), value_set=pa.array(RANKS))
+    ranks = pc.fill_null(ranks, -1).to_numpy(zero_copy_only=False).astype(np.int8)
+    return keywords, allintitle, ranks
+
+
+def _hashes(keywords, normalizer):
+    """
+    正規化したキーワードの 64bit ハッシュ
+
+    ハッシュは同じプロセス内での突き合わせにしか使わないため、組み込みの hash で足りる
+    （文字列のハッシュはプロセスごとに変わるので保存しないこと）。
+    """
+    return np.fromiter(map(hash, map(normalizer, keywords)), np.int64, len(keywords))
+
+
+class RunIndex:
+    """1 回分の結果をキーワードのハッシュ順に並べた配列"""
+
+    def __init__(self, path, normalizer, batch_size=BATCH_SIZE):
+        hashes, allintitle, ranks = [], [], []
+        for keywords, batch_allintitle, batch_ranks in iter_result_batches(path, batch_size):
+            hashes.append(_hashes(keywords, normalizer))
+            allintitle.append(batch_allintitle)
+            ranks.append(batch_ranks)
+        hashes = np.concatenate(hashes) if hashes else np.empty(0, np.int64)
+        # 同じ正規化キーワードが複数あれば先に出現したものを使う
+        self.hashes, first = np.unique(hashes, return_index=True)
+        self.allintitle = np.concatenate(allintitle)[first] if allintitle else np.empty(0)
+        self.ranks = np.concatenate(ranks)[first] if ranks else np.empty(0, np.int8)
+        self.matched = np.zeros(len(self.hashes), dtype=bool)
+
+    def lookup(self, hashes):
+        """各ハッシュの位置を返す（見つからなければ -1）"""
+        if len(self.hashes) == 0:
+            return np.full(len(hashes), -1, dtype=np.int64)
+        positions = np.searchsorted(self.hashes, hashes)
+        positions[positions >= len(self.hashes)] = 0
+        return np.where(self.hashes[positions] == hashes, positions, -1)
+
+
+def _label(code):
+    return RANKS[code] if code >= 0 else None
+
+
+def _number(value):
+    return None if np.isnan(value) else int(value)
+
+
+def iter_diff(old_path, new_path, min_delta=1, summary=None, batch_size=BATCH_SIZE,
+              normalizer=None):
+    """
+    差分の行（DIFF_COLUMNS の dict）を順に返す
+
+    ランクが変わった行は RANK_CHANGED、ランクは同じで allintitle 件数が min_delta 以上
+    動いた行は ALLINTITLE_CHANGED になる。summary に dict を渡すと種類ごとの件数を入れる。
+    判定はバッチ単位の配列演算で行い、変化のあった行だけを dict にする。
+    normalizer（core.normalize.KeywordNormalizer）を省略すると既定の規則で突き合わせる。
+    """
+    normalizer = normalizer or KeywordNormalizer()
+    counts = summary if summary is not None else {}
+    for change in (NEW, REMOVED, RANK_CHANGED, ALLINTITLE_CHANGED, "unchanged"):
+        counts[change] = 0
+
+    old = RunIndex(old_path, normalizer, batch_size)
+    for keywords, allintitle, ranks in iter_result_batches(new_path, batch_size):
+        positions = old.lookup(_hashes(keywords, normalizer))
+        found = positions >= 0
+        matched = positions[found]
+        old.matched[matched] = True
+
+        old_ranks = np.full(len(keywords), -1, dtype=np.int8)
+        old_ranks[found] = old.ranks[matched]
+        old_allintitle = np.full(len(keywords), np.nan)
+        old_allintitle[found] = old.allintitle[matched]
+        delta = allintitle - old_allintitle
+
+        rank_changed = found & (old_ranks != ranks)
+        allintitle_changed = found & ~rank_changed & (np.abs(np.nan_to_num(delta)) >= min_delta)
+        changes = np.full(len(keywords), None, dtype=object)
+        changes[~found] = NEW
+        changes[rank_changed] = RANK_CHANGED
+        changes[allintitle_changed] = ALLINTITLE_CHANGED
+
+        counts[NEW] += int((~found).sum())
+        counts[RANK_CHANGED] += int(rank_changed.sum())
+        counts[ALLINTITLE_CHANGED] += int(allintitle_changed.sum())
+        counts["unchanged"] += int(found.sum() - rank_changed.sum() - allintitle_changed.sum())
+
+        for i in np.flatnonzero(changes != None):  # noqa: E711
+            yield _diff_row(
+                keywords[i], changes[i], _label(old_ranks[i]), _label(ranks[i]),
+                _number(old_allintitle[i]), _number(allintitle[i]),
+            )
+
+    if old.matched.all():
+        return
+    for keywords, allintitle, ranks in iter_result_batches(old_path, batch_size):
+        positions = old.lookup(_hashes(keywords, normalizer))
+        for i in np.flatnonzero(~old.matched[positions]):
+            if old.matched[positions[i]]:
+                # 同じ正規化キーワードが同じバッチに複数ある場合
+                continue
+            # 重複キーワードを 2 回出さないよう、出した時点で一致扱いにする
+            old.matched[positions[i]] = True
+            counts[REMOVED] += 1
+            yield _diff_row(
+                keywords[i], REMOVED, _label(ranks[i]), None, _number(allintitle[i]), None
+            )
+
+
+def _diff_row(keyword, change, old_rank, new_rank, old_allintitle, new_allintitle):
+    delta = None
+    if old_allintitle is not None and new_allintitle is not None:
+        delta = new_allintitle - old_allintitle
+    return {
+        "keyword": keyword,
+        "change": change,
+        "old_rank": old_rank,
+        "new_rank": new_rank,
+        "old_allintitle": old_allintitle,
+        "new_allintitle": new_allintitle,
+        "allintitle_delta": delta,
+    }
+
+
+def write_diff(old_path, new_path, out_path, min_delta=1, normalizer=None):
+    """差分を CSV に書き出し、種類ごとの件数を返す"""
+    directory = os.path.dirname(out_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    summary = {}
+    with open(out_path, "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=DIFF_COLUMNS)
+        writer.writeheader()
+        writer.writerows(iter_diff(old_path, new_path, min_delta, summary, normalizer=normalizer))
+    return summary
@@ -0,0 +1,203 @@
+"""
+分析結果のファイル出力（CSV / Parquet / Arrow IPC）
+
+ResultStreamWriter はランクが確定した行を受け取るたびにバッファし、row_group_size 行
+たまるごとに書き出す。処理の途中でプロセスが終了しても、それまでに書き出した行は
+読める状態で残る。
+
+- .csv: 行を追記し、書き出すたびに flush する
+- .parquet: 実行中は <出力先>.parts/ に 1 行グループ = 1 ファイルで書き出し、
+  正常終了時に 1 つのファイルへまとめる（中断時は .parts/ をデータセットとして読める）
+- .arrow / .arrows: Arrow IPC ストリーム形式。末尾まで書き終えていなくても読める
+
+Parquet / Arrow 出力には pyarrow が必要。
+"""
+
+import csv
+import glob
+import os
+import shutil
+
+from core.results import COLUMNS
+
+DEFAULT_ROW_GROUP_SIZE = 10000
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError("Parquet / Arrow 出力には pyarrow が必要です（pip install pyarrow）") from e
+
+
+def _arrow_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("keyword", pa.string()),
+        ("seed", pa.string()),
+        ("depth", pa.int16()),
+        ("allintitle", pa.int64()),
+        ("recent_count", pa.int64()),
+        ("trend", pa.float64()),
+        ("rank", pa.string()),
+        ("cluster", pa.string()),
+    ])
+
+
+def _arrow_batch(rows, schema):
+    import pyarrow as pa
+
+    return pa.record_batch(
+        [pa.array([row.get(col) for row in rows], type=schema.field(col).type) for col in COLUMNS],
+        schema=schema,
+    )
+
+
+class _CSVWriter:
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS, extrasaction="ignore")
+        self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self, complete=True):
+        self._file.close()
+
+
+class _ParquetWriter:
+    def __init__(self, path):
+        _require_pyarrow()
+        self.path = path
+        self.parts_dir = f"{path}.parts"
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+        os.makedirs(self.parts_dir)
+        self.schema = _arrow_schema()
+        self._parts = 0
+
+    def write(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        part = os.path.join(self.parts_dir, f"part-{self._parts:05d}.parquet")
+        tmp = f"{part}.tmp"
+        pq.write_table(pa.Table.from_batches([_arrow_batch(rows, self.schema)]), tmp)
+        os.replace(tmp, part)
+        self._parts += 1
+
+    def close(self, complete=True):
+        """complete=True なら部分ファイルを 1 つの Parquet にまとめる（各部分が 1 行グループ）"""
+        if not complete:
+            return
+        import pyarrow.parquet as pq
+
+        tmp = f"{self.path}.tmp"
+        with pq.ParquetWriter(tmp, self.schema) as writer:
+            for part in sorted(glob.glob(os.path.join(self.parts_dir, "part-*.parquet"))):
+                writer.write_table(pq.read_table(part))
+        os.replace(tmp, self.path)
+        shutil.rmtree(self.parts_dir, ignore_errors=True)
+
+
+class _ArrowStreamWriter:
+    def __init__(self, path):
+        _require_pyarrow()
+        import pyarrow as pa
+
+        self.path = path
+        self.schema = _arrow_schema()
+        self._sink = pa.OSFile(path, "wb")
+        self._writer = pa.ipc.new_stream(self._sink, self.schema)
+
+    def write(self, rows):
+        self._writer.write_batch(_arrow_batch(rows, self.schema))
+        self._sink.flush()
+
+    def close(self, complete=True):
+        self._writer.close()
+        self._sink.close()
+
+
+def _open_writer(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith(".parquet"):
+        return _ParquetWriter(path)
+    if path.endswith((".arrow", ".arrows")):
+        return _ArrowStreamWriter(path)
+    return _CSVWriter(path)
+
+
+class ResultStreamWriter:
+    """
+    1 つ以上の出力先へ結果を逐次書き出す
+
+    write_rows でランクが確定した行を受け取り、finish で ResultTable のうち
+    まだ書き出していない行（未判定の行など）を書き出して閉じる。
+    """
+
+    def __init__(self, paths, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+        if isinstance(paths, str):
+            paths = [paths]
+        self.paths = list(paths)
+        self.row_group_size = row_group_size
+        self.written = set()
+        self.count = 0
+        self._buffer = []
+        self._writers = []
+        try:
+            for path in self.paths:
+                self._writers.append(_open_writer(path))
+        except BaseException:
+            self.close(complete=False)
+            raise
+
+    def write_rows(self, rows):
+        for row in rows:
+            if row["keyword"] not in self.written:
+                self.written.add(row["keyword"])
+                self._buffer.append(row)
+        if len(self._buffer) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        for writer in self._writers:
+            writer.write(self._buffer)
+        self.count += len(self._buffer)
+        self._buffer = []
+
+    def finish(self, table):
+        """table の残りの行を書き出し、出力を完成させる"""
+        remaining = [i for i, kw in enumerate(table.keyword) if kw not in self.written]
+        for start in range(0, len(remaining), self.row_group_size):
+            self.write_rows(table.rows(remaining[start:start + self.row_group_size]))
+        self.close()
+
+    def close(self, complete=True):
+        """complete=False は異常終了時用（バッファを書き出すが Parquet はまとめない）"""
+        try:
+            self.flush()
+        finally:
+            for writer in self._writers:
+                writer.close(complete)
+            self._writers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._writers:
+            self.close(complete=exc_type is None)
+
+
+def write_results(table, path, row_group_size=DEFAULT_ROW_GROUP_SIZE):
+    """ResultTable 全体を拡張子に応じた形式で書き出す"""
+    with ResultStreamWriter(path, row_group_size) as writer:
+        writer.finish(table)
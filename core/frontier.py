@@ -0,0 +1,334 @@
+"""
+再帰的なサジェスト展開のための永続フロンティア
+
+展開待ちのクエリと収集済みキーワードを cache/frontier/<プロファイル>/ に保存し、
+中断（クラッシュや Ctrl-C）後も同じ位置から再開できるようにする。
+
+- journal.jsonl: クエリ 1 件の完了ごとに追記するジャーナル
+- candidates.jsonl: 収集済みキーワード（1 行 1 件。収集するたびに追記する）
+- snapshot.json: 一定件数ごとに書き出す展開待ちのクエリのスナップショットと、その時点の
+  candidates.jsonl の長さ（書き出し後にジャーナルを空にする）
+- visited-*: 訪問済み集合の一時ファイル（suggest.visited が "bloom" の場合。core.visited）
+
+メモリに持つのは展開待ちのクエリと訪問済みの集合だけで、収集済みキーワードはファイルに
+追記していき、展開が終わってから読み出す。再開時は candidates.jsonl をスナップショットの
+時点の長さに切り詰め、スナップショットを読み込んでからジャーナルを再生する。投入済みクエリの
+集合は収集済みキーワードから作り直せるため、スナップショットには保存しない。
+"""
+
+import asyncio
+import contextlib
+import hashlib
+import heapq
+import json
+import logging
+import os
+
+from core.suggest import build_queries, build_suffixes
+from core.visited import ExactVisitedSet, open_visited
+
+logger = logging.getLogger(__name__)
+
+
+def frontier_fingerprint(seeds, settings):
+    """展開結果に影響する設定のハッシュ。変わっていれば保存済みの状態は使わない"""
+    key = {
+        "seeds": list(seeds),
+        "suffixes": settings.get("suffixes"),
+        "max_depth": settings.get("max_depth", 1),
+        "priority": settings.get("priority", "yield"),
+    }
+    return hashlib.sha1(json.dumps(key, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SuggestFrontier:
+    """
+    優先度付き BFS フロンティア
+
+    クエリは (優先度, 深さ, 投入順) の順に取り出す。priority が "yield" の場合、
+    優先度は親クエリが新規に生んだキーワード数で、収穫の多い接頭辞から先に展開する。
+    "fifo" の場合は純粋な幅優先になる。
+
+    訪問済みのキーワード・クエリの集合は visited_settings（suggest の設定）の
+    visited に応じて Python の set か Bloom フィルタ（core.visited）で持つ。
+    """
+
+    def __init__(self, directory, fingerprint, suffixes, max_depth=1, priority="yield",
+                 snapshot_every=500, visited_settings=None):
+        self.directory = directory
+        self.fingerprint = fingerprint
+        self.suffixes = suffixes
+        self.max_depth = max_depth
+        self.priority = priority
+        self.snapshot_every = snapshot_every
+        self.visited_settings = visited_settings or {}
+
+        self.pending = {}  # クエリ -> [優先度, 深さ, 投入順, シード]
+        self.queued = ExactVisitedSet()  # 一度でも投入したクエリ
+        self.collected = 0  # 収集済みキーワードの件数
+        self.seen = ExactVisitedSet()
+        self._heap = []
+        self._seq = 0
+        self._since_snapshot = 0
+        self._journal = None
+        self._candidates = None
+
+    @property
+    def journal_path(self):
+        return os.path.join(self.directory, "journal.jsonl")
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self.directory, "snapshot.json")
+
+    @property
+    def candidates_path(self):
+        return os.path.join(self.directory, "candidates.jsonl")
+
+    def __len__(self):
+        return len(self.pending)
+
+    # --- 状態の構築 ---
+
+    def start(self, seeds):
+        """保存済みの状態があれば再開し、無ければシードから開始する。再開した場合は True"""
+        os.makedirs(self.directory, exist_ok=True)
+        self.seen = open_visited(
+            self.visited_settings, os.path.join(self.directory, "visited-keywords")
+        )
+        # クエリはキーワード 1 件につき サフィックス数 + 1 件できる
+        self.queued = open_visited(
+            self.visited_settings, os.path.join(self.directory, "visited-queries"),
+            capacity_scale=len(self.suffixes) + 1,
+        )
+        resumed = self._load()
+        if not resumed:
+            self._open_candidates(0)
+            for seed in seeds:
+                self._add_candidate(seed, seed, 0)
+                self._push_children(seed, seed, 0, 0)
+            self.snapshot()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return resumed
+
+    def _load(self):
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if state.get("fingerprint") != self.fingerprint:
+            logger.info("設定が変わったため保存済みのフロンティアを破棄します: %s", self.directory)
+            return False
+
+        self._seq = state["seq"]
+        if "candidates" in state:
+            # 収集済みキーワードをスナップショットに含めていた以前の形式
+            self._open_candidates(0)
+            for row in state["candidates"]:
+                self._add_candidate(row["keyword"], row["seed"], row["depth"])
+                self._restore_queued(row)
+        else:
+            self._open_candidates(state["candidates_size"])
+            for row in self.iter_candidates():
+                self.seen.add(row["keyword"])
+                self.collected += 1
+                self._restore_queued(row)
+        for query, entry in state["pending"].items():
+            self._enqueue(query, *entry)
+
+        replayed = 0
+        try:
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except ValueError:
+                        # 書き込み途中で中断された末尾の行
+                        break
+                    self._apply(event["q"], event["new"])
+                    replayed += 1
+        except OSError:
+            pass
+        logger.info(
+            "フロンティアを再開: 残り %d クエリ / 収集済み %d 件（ジャーナル %d 件を再生）",
+            len(self.pending), self.collected, replayed,
+        )
+        return True
+
+    # --- 内部操作 ---
+
+    def _open_candidates(self, size):
+        """candidates.jsonl を size バイト（スナップショットの時点）に切り詰めて追記用に開く"""
+        self._candidates = open(self.candidates_path, "a", encoding="utf-8")
+        self._candidates.truncate(size)
+
+    def _restore_queued(self, row):
+        if row["depth"] < self.max_depth:
+            for query in build_queries(row["keyword"], self.suffixes):
+                self.queued.add(query)
+
+    def _add_candidate(self, keyword, seed, depth):
+        if not self.seen.add(keyword):
+            return False
+        row = {"keyword": keyword, "seed": seed, "depth": depth}
+        self._candidates.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self.collected += 1
+        return True
+
+    def _enqueue(self, query, priority, depth, seq, seed):
+        self.pending[query] = [priority, depth, seq, seed]
+        heapq.heappush(self._heap, (-priority, depth, seq, query))
+
+    def _push_children(self, keyword, seed, depth, priority):
+        if depth >= self.max_depth:
+            return
+        if self.priority != "yield":
+            priority = 0
+        for query in build_queries(keyword, self.suffixes):
+            if self.queued.add(query):
+                self._seq += 1
+                self._enqueue(query, priority, depth, self._seq, seed)
+
+    def _apply(self, query, new_keywords):
+        """クエリの完了を状態に反映する（同じイベントの再適用は無視される）"""
+        entry = self.pending.pop(query, None)
+        if entry is None:
+            return []
+        _, depth, _, seed = entry
+        added = [kw for kw in new_keywords if self._add_candidate(kw, seed, depth + 1)]
+        for keyword in added:
+            self._push_children(keyword, seed, depth + 1, len(added))
+        return added
+
+    # --- 公開操作 ---
+
+    def pop_batch(self, size):
+        """次に展開するクエリを最大 size 件返す（complete されるまで pending に残る）"""
+        batch = []
+        while self._heap and len(batch) < size:
+            query = heapq.heappop(self._heap)[3]
+            if query in self.pending:
+                batch.append(query)
+        return batch
+
+    def complete(self, query, suggestions):
+        """クエリの結果を記録し、新規キーワードを返す"""
+        new_keywords = [kw for kw in dict.fromkeys(suggestions) if kw not in self.seen]
+        self._journal.write(json.dumps({"q": query, "new": new_keywords}, ensure_ascii=False) + "\n")
+        self._journal.flush()
+        added = self._apply(query, new_keywords)
+
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every:
+            self.snapshot()
+        return added
+
+    def iter_candidates(self):
+        """収集済みキーワードの {"keyword", "seed", "depth"} を収集順に返す"""
+        if self._candidates is not None:
+            self._candidates.flush()
+        with open(self.candidates_path, encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def sync(self):
+        """ジャーナルと収集済みキーワードをディスクに確実に書き出す"""
+        for f in (self._candidates, self._journal):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def snapshot(self):
+        """展開待ちのクエリと収集済みキーワードの長さを書き出してジャーナルを空にする"""
+        self._candidates.flush()
+        os.fsync(self._candidates.fileno())
+        state = {
+            "fingerprint": self.fingerprint,
+            "seq": self._seq,
+            "candidates_size": os.fstat(self._candidates.fileno()).st_size,
+            "pending": self.pending,
+        }
+        tmp = f"{self.snapshot_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.snapshot_path)
+
+        if self._journal is not None:
+            self._journal.truncate(0)
+            self._journal.seek(0)
+        self._since_snapshot = 0
+
+    def close(self):
+        self.sync()
+        for f in (self._candidates, self._journal):
+            if f is not None:
+                f.close()
+        self._candidates = self._journal = None
+        self.seen.close()
+        self.queued.close()
+
+    def clear(self):
+        """展開完了後に保存済みの状態を削除する"""
+        self.close()
+        for path in (self.snapshot_path, self.journal_path, self.candidates_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def collect_candidates_recursive(seeds, settings, state_dir, cache=None, progress=None):
+    """
+    シードを max_depth 段まで再帰的に展開し、collect_candidates と同じ形式の候補リストを返す
+
+    state_dir に途中状態を保存し、中断後の再実行では続きから展開する。
+    すべて展開し終えたら保存済みの状態は削除する。
+    """
+    suffixes = build_suffixes(settings.get("suffixes"))
+    frontier = SuggestFrontier(
+        state_dir,
+        frontier_fingerprint(seeds, settings),
+        suffixes,
+        max_depth=settings.get("max_depth", 1),
+        priority=settings.get("priority", "yield"),
+        snapshot_every=settings.get("snapshot_every", 500),
+        visited_settings=settings,
+    )
+    frontier.start(seeds)
+
+    done = 0
+    with contextlib.ExitStack() as stack:
+        stack.callback(frontier.close)
+        if settings.get("engine") == "async":
+            from core.suggest_async import AsyncSuggestCrawler
+
+            crawler = stack.enter_context(AsyncSuggestCrawler(settings, cache=cache))
+            batch_size = crawler.concurrency * 4
+
+            def fetch_batch(queries):
+                return asyncio.run(crawler.crawl(queries))
+        else:
+            import requests
+
+            from core.suggest import collect_sequential
+
+            session = stack.enter_context(requests.Session())
+            batch_size = 1
+
+            def fetch_batch(queries):
+                return dict(collect_sequential(queries, settings, cache=cache, session=session))
+
+        while frontier:
+            batch = frontier.pop_batch(batch_size)
+            results = fetch_batch(batch)
+            for query in batch:
+                frontier.complete(query, results.get(query) or [])
+            frontier.sync()
+            done += len(batch)
+            if progress:
+                progress("suggest", done, done + len(frontier))
+
+    candidates = list(frontier.iter_candidates())
+    frontier.clear()
+    return candidates
@@ -0,0 +1,329 @@
+"""
+分析ジョブのキューとワーカープール
+
+長時間の分析を GUI のリクエスト処理から切り離して実行する。ジョブは
+cache/jobs.sqlite3 に保存され、プロセスを再起動しても失われない。
+
+- JobQueue: 投入・取り出し・キャンセル・進捗の記録
+- WorkerPool: キューからジョブを取り出して run_pipeline を実行するスレッド群
+
+GUI の各ハンドラは get_job_queue() で同じキューを取得し、submit したジョブ ID で
+状態を問い合わせる。
+
+複数のプロセス（GUI と jobs worker など）が同じキューを使える。実行中のジョブには
+取り出した WorkerPool の ID（worker）を記録し、WorkerPool は HEARTBEAT_INTERVAL ごとに
+heartbeat_at を更新する。STALE_SECONDS 以上更新されていない実行中のジョブだけを、
+落ちたプロセスのものとみなして待機中に戻す。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from core.config import CACHE_DIR, OUTPUTS_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(CACHE_DIR, "jobs.sqlite3")
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# 実行中のジョブの heartbeat_at を更新する間隔と、落ちたとみなすまでの秒数
+HEARTBEAT_INTERVAL = 10
+STALE_SECONDS = 60
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # 複数プロセスからの取り出しは BEGIN IMMEDIATE で排他する
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                profile TEXT NOT NULL,
+                params TEXT NOT NULL,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                progress TEXT,
+                result_path TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                worker TEXT,
+                heartbeat_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, priority DESC, created_at);
+            """
+        )
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, type_ in (("worker", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {type_}")
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def submit(self, profile, params=None, priority=0):
+        """ジョブを投入し、ジョブ ID を返す。priority が大きいものから実行される"""
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, profile, params, priority, status, created_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, profile, json.dumps(params or {}, ensure_ascii=False), priority, QUEUED,
+             time.time()),
+        )
+        return job_id
+
+    def claim(self, worker=None):
+        """最も優先度の高い待機中のジョブを worker の実行中にして返す（無ければ None）"""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, worker = ?, heartbeat_at = ?"
+                        " WHERE id = ?",
+                        (RUNNING, now, worker, now, row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return None if row is None else self._to_dict(row, status=RUNNING)
+
+    def cancel(self, job_id):
+        """待機中なら即座に、実行中なら次の進捗報告の時点でキャンセルする"""
+        self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, time.time(), job_id, QUEUED),
+        )
+        self._execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+        )
+
+    def is_cancel_requested(self, job_id):
+        row = self._execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def update_progress(self, job_id, stages):
+        self._execute(
+            "UPDATE jobs SET progress = ? WHERE id = ?",
+            (json.dumps(stages, ensure_ascii=False), job_id),
+        )
+
+    def finish(self, job_id, status, result_path=None, error=None):
+        self._execute(
+            "UPDATE jobs SET status = ?, result_path = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, result_path, error, time.time(), job_id),
+        )
+
+    def requeue(self, job_id):
+        """実行中のジョブを待機中に戻す"""
+        self._execute(
+            "UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?",
+            (QUEUED, job_id, RUNNING),
+        )
+
+    def heartbeat(self, worker):
+        """worker が実行中のジョブの heartbeat_at を更新する"""
+        self._execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE worker = ? AND status = ?",
+            (time.time(), worker, RUNNING),
+        )
+
+    def requeue_stale(self, stale_after=STALE_SECONDS):
+        """
+        heartbeat_at が stale_after 秒以上更新されていない実行中のジョブ（実行していた
+        プロセスが落ちたもの）を待機中に戻し、戻した件数を返す
+
+        キャンセルが要求されていたものは待機中に戻さずキャンセル済みにする。
+        """
+        stale = "status = ? AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+        cutoff = time.time() - stale_after
+        cursor = self._execute(
+            "UPDATE jobs SET status = ?, started_at = NULL, worker = NULL, heartbeat_at = NULL"
+            f" WHERE {stale} AND cancel_requested = 0",
+            (QUEUED, RUNNING, cutoff),
+        )
+        self._execute(
+            f"UPDATE jobs SET status = ?, finished_at = ? WHERE {stale}",
+            (CANCELLED, time.time(), RUNNING, cutoff),
+        )
+        return cursor.rowcount
+
+    def get(self, job_id):
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._to_dict(row)
+
+    def list(self, status=None, limit=100):
+        if status:
+            rows = self._execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?",
+                (status, limit),
+            ).fetchall()
+        else:
+            rows = self._execute(
+                "SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row, **overrides):
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else {}
+        job.update(overrides)
+        return job
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class WorkerPool:
+    """
+    JobQueue からジョブを取り出して実行するスレッド群
+
+    ジョブの params は run_pipeline のキーワード引数（seeds / no_cache / refresh など）と、
+    出力先の "out"（省略時は outputs/jobs/<ジョブ ID>.csv）。
+    """
+
+    def __init__(self, job_queue, workers=2, poll_interval=1.0, progress_interval=1.0):
+        self.queue = job_queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.progress_interval = progress_interval
+        self.worker_id = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._requeue_stale()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        return self
+
+    def _requeue_stale(self):
+        requeued = self.queue.requeue_stale()
+        if requeued:
+            logger.info("中断されていたジョブ %d 件を再投入しました", requeued)
+
+    def _heartbeat(self):
+        """実行中のジョブの heartbeat_at を更新し、落ちた他のプロセスのジョブを再投入する"""
+        while not self._stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                self.queue.heartbeat(self.worker_id)
+                self._requeue_stale()
+            except sqlite3.Error as e:
+                logger.warning("ジョブの heartbeat を更新できませんでした: %s", e)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job = self.queue.claim(self.worker_id)
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        from core.cache import get_shared_cache
+        from core.config import load_api_keys, load_profile
+        from core.export import ResultStreamWriter
+        from core.pipeline import run_pipeline
+
+        job_id = job["id"]
+        params = dict(job["params"])
+        out = params.pop("out", None) or os.path.join(OUTPUTS_DIR, "jobs", f"{job_id}.csv")
+        stages = {}
+        last_report = [0.0]
+
+        def progress(stage, done, total):
+            stages[stage] = [done, total]
+            now = time.monotonic()
+            if now - last_report[0] < self.progress_interval:
+                return
+            last_report[0] = now
+            self.queue.update_progress(job_id, stages)
+            if self.queue.is_cancel_requested(job_id) or self._stop.is_set():
+                raise JobCancelled()
+
+        logger.info("ジョブ開始: %s (%s)", job_id, job["profile"])
+        try:
+            profile = load_profile(job["profile"])
+            row_group_size = profile["settings"]["export"]["row_group_size"]
+            with ResultStreamWriter(out, row_group_size) as writer:
+                table = run_pipeline(
+                    profile,
+                    load_api_keys(),
+                    progress=progress,
+                    cache=get_shared_cache(profile["settings"]),
+                    on_rows=writer.write_rows,
+                    **params,
+                )
+                writer.finish(table)
+        except JobCancelled:
+            self.queue.update_progress(job_id, stages)
+            if self._stop.is_set() and not self.queue.is_cancel_requested(job_id):
+                # 終了処理による中断は次回起動時に再開する
+                self.queue.requeue(job_id)
+            else:
+                self.queue.finish(job_id, CANCELLED)
+            logger.info("ジョブ中断: %s", job_id)
+        except Exception as e:
+            logger.exception("ジョブ失敗: %s", job_id)
+            self.queue.finish(job_id, FAILED, error=str(e))
+        else:
+            self.queue.update_progress(job_id, stages)
+            self.queue.finish(job_id, DONE, result_path=out)
+            logger.info("ジョブ完了: %s -> %s", job_id, out)
+
+
+_shared_queue = None
+_shared_lock = threading.Lock()
+
+
+def get_job_queue(path=DEFAULT_DB_PATH):
+    """プロセス内で共有する JobQueue を返す（呼び出し側で close しないこと）"""
+    global _shared_queue
+    with _shared_lock:
+        if _shared_queue is None:
+            _shared_queue = JobQueue(path)
+        return _shared_queue
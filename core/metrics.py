@@ -0,0 +1,298 @@
+"""
+処理時間・件数の計測
+
+各段階（サジェスト取得・キャッシュ・DataForSEO・ランク判定）で使うカウンタ・ゲージ・
+ヒストグラムをプロセス内の REGISTRY にまとめ、Prometheus のテキスト形式で出力する。
+
+- render(): /metrics の応答本文
+- RunRecorder: 1 回の実行の段階ごとの所要時間と、実行中のカウンタの増分を
+  outputs/runs/ に JSON で書き出す
+- start_metrics_server(port): GUI 以外（run / jobs worker）で /metrics を公開する
+
+同じプロセスで複数の実行が重なった場合、実行ごとのサマリーのカウンタには
+重なった他の実行の分も含まれる（段階ごとの所要時間は実行ごとに正確）。
+"""
+
+import contextlib
+import itertools
+import json
+import math
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, registry=None):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values = {}
+        (registry or REGISTRY).register(self)
+
+    def samples(self):
+        """[(名前, ラベル, 値), ...]"""
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS, registry=None):
+        super().__init__(name, help, registry)
+        self.buckets = tuple(buckets) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += 1
+            entry[2] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, count, total) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    samples.append(
+                        (f"{self.name}_bucket", key + (("le", _format_value(bound)),), bucket_count)
+                    )
+                samples.append((f"{self.name}_count", key, count))
+                samples.append((f"{self.name}_sum", key, total))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = []
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """Prometheus のテキスト形式（0.0.4）"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, key, value in metric.samples():
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """{"名前{ラベル}": 値} の dict（ヒストグラムは _count と _sum だけ）"""
+        values = {}
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            for name, key, value in metric.samples():
+                if name.endswith("_bucket"):
+                    continue
+                values[f"{name}{_format_labels(key)}"] = value
+        return values
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# --- 各モジュールで使う指標 ---
+
+SUGGEST_REQUESTS = Counter(
+    "demand_miner_suggest_requests_total", "サジェスト API へのリクエスト数（result=ok|error）"
+)
+SUGGEST_SECONDS = Histogram("demand_miner_suggest_request_seconds", "サジェスト API の応答時間")
+SUGGEST_BYTES = Counter("demand_miner_suggest_response_bytes_total", "サジェスト API の応答の合計バイト数")
+
+CACHE_LOOKUPS = Counter(
+    "demand_miner_cache_lookups_total", "キャッシュの参照件数（kind, tier=memory|sqlite, result=hit|miss）"
+)
+CACHE_SECONDS = Histogram(
+    "demand_miner_cache_io_seconds", "SQLite キャッシュの読み書きの所要時間（op=get|set）",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+DFS_REQUESTS = Counter(
+    "demand_miner_dataforseo_requests_total", "DataForSEO へのリクエスト数（endpoint, result=ok|error）"
+)
+DFS_SECONDS = Histogram("demand_miner_dataforseo_request_seconds", "DataForSEO の応答時間（endpoint）")
+DFS_BYTES = Counter(
+    "demand_miner_dataforseo_response_bytes_total", "DataForSEO の応答の合計バイト数（endpoint）"
+)
+TASKS_POSTED = Counter("demand_miner_tasks_posted_total", "投稿したタスク数（kind）")
+TASK_COST = Counter("demand_miner_task_cost_total", "投稿したタスクの料金の合計（USD。kind）")
+TASKS_SKIPPED = Counter(
+    "demand_miner_tasks_skipped_total", "結果がランクに影響しないため投稿しなかったタスク数（kind）"
+)
+TASKS_IN_FLIGHT = Gauge("demand_miner_tasks_in_flight", "投稿済みで未取得のタスク数")
+TASK_WAIT_SECONDS = Histogram(
+    "demand_miner_task_wait_seconds", "タスクの投稿から tasks_ready で完了を確認するまでの時間",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600),
+)
+POLL_CYCLES = Counter("demand_miner_poll_cycles_total", "tasks_ready の確認回数")
+CALLBACKS = Counter(
+    "demand_miner_callbacks_total", "受信した完了通知の件数（kind=pingback|postback, result=routed|unclaimed|rejected）"
+)
+
+STAGE_SECONDS = Histogram(
+    "demand_miner_stage_seconds", "パイプラインの段階ごとの所要時間（stage）",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600, 7200),
+)
+RUNS = Counter("demand_miner_runs_total", "分析の実行回数（result=ok|error）")
+KEYWORDS = Counter("demand_miner_keywords_total", "分析したキーワード数")
+
+
+def render():
+    return REGISTRY.render()
+
+
+class RunRecorder:
+    """1 回の実行の段階ごとの所要時間と、実行中のカウンタの増分を記録する"""
+
+    def __init__(self, profile_name):
+        self.profile_name = profile_name
+        self.started_at = time.time()
+        self.stages = {}
+        self.notes = {}
+        self._started = time.perf_counter()
+        self._before = REGISTRY.snapshot()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stages[name] = round(self.stages.get(name, 0) + elapsed, 3)
+            STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def note(self, **values):
+        """サマリーに載せる値（打ち切りの理由など）を加える"""
+        self.notes.update(values)
+
+    def summary(self, **extra):
+        after = REGISTRY.snapshot()
+        counters = {}
+        for name, value in after.items():
+            delta = value - self._before.get(name, 0)
+            if delta:
+                counters[name] = round(delta, 6) if isinstance(delta, float) else delta
+        return {
+            "profile": self.profile_name,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            "seconds": round(time.perf_counter() - self._started, 3),
+            "stages": self.stages,
+            **self.notes,
+            **extra,
+            "metrics": counters,
+        }
+
+    def write(self, directory, **extra):
+        """
+        サマリーを <directory>/<プロファイル>-<日時>.json に書き出し、パスを返す
+
+        同じプロファイルの実行が同じ秒に始まった場合（複数のジョブワーカーなど）は
+        上書きせず、<プロファイル>-<日時>-2.json のように番号を付ける。
+        """
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        summary = self.summary(**extra)
+        for n in itertools.count(1):
+            suffix = "" if n == 1 else f"-{n}"
+            path = os.path.join(directory, f"{self.profile_name}-{stamp}{suffix}.json")
+            try:
+                # 排他的に作成し、別のプロセスが同じ名前で書き出したファイルを上書きしない
+                with open(path, "x", encoding="utf-8") as f:
+                    json.dump(summary, f, ensure_ascii=False, indent=2)
+            except FileExistsError:
+                continue
+            return path
+
+
+def start_metrics_server(port, host="0.0.0.0"):
+    """/metrics を返す HTTP サーバーをデーモンスレッドで起動する"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
@@ -0,0 +1,75 @@
+"""
+キーワードの正規化
+
+サジェストには全角・半角、カタカナ・ひらがな、全角スペース・半角スペースだけが
+異なる実質的に同じクエリが混ざる。正規化した文字列をキャッシュのキー、
+task_post 前の重複除去、結果の表示上のグループ化に使う。
+
+規則（settings.yaml の normalize.rules で選ぶ。書いた順に適用する）:
+
+- nfkc: Unicode NFKC 正規化（全角英数→半角、半角カナ→全角、全角スペース→半角など）
+- lower: 英字を小文字にする
+- kana: カタカナをひらがなにする
+- space: 前後の空白を除き、連続する空白を 1 つにまとめる
+"""
+
+import unicodedata
+from functools import lru_cache
+
+# kana は allintitle の件数が変わり得る（タイトルの表記をそのまま照合する）ため既定では使わない
+DEFAULT_RULES = ("nfkc", "lower", "space")
+
+# ァ(U+30A1)〜ヶ(U+30F6) を ぁ(U+3041)〜ゖ(U+3096) に対応させる
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def _nfkc(text):
+    return unicodedata.normalize("NFKC", text)
+
+
+def _kana(text):
+    return text.translate(_KATAKANA_TO_HIRAGANA)
+
+
+def _space(text):
+    return " ".join(text.split())
+
+
+RULES = {
+    "nfkc": _nfkc,
+    "lower": str.lower,
+    "kana": _kana,
+    "space": _space,
+}
+
+
+class KeywordNormalizer:
+    def __init__(self, rules=DEFAULT_RULES, cache_size=1 << 16):
+        unknown = [rule for rule in rules if rule not in RULES]
+        if unknown:
+            raise ValueError(f"未知の正規化規則: {', '.join(unknown)}")
+        self.rules = tuple(rules)
+        funcs = [RULES[rule] for rule in self.rules]
+
+        @lru_cache(maxsize=cache_size)
+        def normalize(keyword):
+            for func in funcs:
+                keyword = func(keyword)
+            return keyword
+
+        self._normalize = normalize
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls((settings.get("normalize") or {}).get("rules", DEFAULT_RULES))
+
+    def __call__(self, keyword):
+        return self._normalize(keyword)
+
+    def group(self, keywords):
+        """{正規化後: [元のキーワード, ...]} を出現順で返す"""
+        groups = {}
+        for keyword in keywords:
+            groups.setdefault(self(keyword), []).append(keyword)
+        return groups
+
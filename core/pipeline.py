@@ -0,0 +1,446 @@
+"""
+GUI を介さない分析パイプライン
+
+サジェスト収集 →（類似キーワードのクラスタリング →）allintitle 検索 → 鮮度チェック →
+ランク判定 を順に実行する。
+
+run_pipeline は完了後に結果をまとめて返す。iter_pipeline は同じ処理を別スレッドで
+実行し、段階ごとの進捗と、ランクが確定した行を逐次 yield する（Gradio の
+ジェネレータ型ハンドラからそのまま使える）。呼び出し側が途中で読むのをやめると
+（ジェネレータが閉じられると）、次の進捗の通知で実行を打ち切る。estimate_pipeline は DataForSEO に投稿せずに
+キャッシュの利用件数と有料のタスク数・料金を見積もる。
+"""
+
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from core.budget import Budget
+from core.cache import CachePolicy, open_cache
+from core.cluster import cluster_keywords
+from core.config import CACHE_DIR, OUTPUTS_DIR
+from core.dataforseo import ALLINTITLE, API_BASE, FRESHNESS, DataForSEOClient
+from core.metrics import KEYWORDS, RUNS, RunRecorder
+from core.normalize import KeywordNormalizer
+from core.planner import DEFAULT_TASK_COST, SerpTaskPlan
+from core.ranker import RANKS, decided_by_allintitle, rank_keyword
+from core.results import ResultTable
+from core.serp_engine import run_tasks
+from core.suggest import collect_candidates
+from core.task_journal import TaskJournal
+
+logger = logging.getLogger(__name__)
+
+# 実行ごとのサマリー（core.metrics.RunRecorder）の書き出し先
+RUNS_DIR = os.path.join(OUTPUTS_DIR, "runs")
+
+
+class PipelineCancelled(Exception):
+    pass
+
+
+class _PartialRanker:
+    """
+    allintitle と鮮度の両方がそろったキーワードから順にランクを判定して通知する
+
+    allintitle 件数だけでランク C に決まるキーワードは鮮度を待たずに判定する
+    （日付指定検索を省略した場合、recent_count は None のまま）。
+    """
+
+    def __init__(self, rows, thresholds, on_rows, progress, plan=None):
+        self.rows = {row["keyword"]: row for row in rows}
+        self.thresholds = thresholds
+        self.on_rows = on_rows
+        self.progress = progress
+        # 確定したランクを渡す先（core.planner.SerpTaskPlan。S の件数での打ち切り用）
+        self.plan = plan
+        self.ranked = 0
+
+    def update(self, values, keywords):
+        ready = []
+        for keyword in keywords:
+            row = self.rows.get(keyword)
+            if row is None or "rank" in row:
+                continue
+            if keyword not in values[ALLINTITLE]:
+                continue
+            allintitle = values[ALLINTITLE][keyword]
+            if keyword in values[FRESHNESS] or decided_by_allintitle(allintitle, self.thresholds):
+                row = dict(
+                    row,
+                    allintitle=allintitle,
+                    recent_count=values[FRESHNESS].get(keyword),
+                )
+                row["rank"] = rank_keyword(row["allintitle"], row["recent_count"], self.thresholds)
+                self.rows[keyword]["rank"] = row["rank"]
+                ready.append(row)
+        if not ready:
+            return
+        self.ranked += len(ready)
+        if self.plan is not None:
+            self.plan.record_ranks((row["keyword"], row["rank"]) for row in ready)
+        if self.on_rows:
+            self.on_rows(ready)
+        if self.progress:
+            self.progress("ranked", self.ranked, len(self.rows))
+
+
+def _owners(keywords, normalizer, clusters=None, inherit=True):
+    """
+    {問い合わせるキーワード: [その値を使うキーワード, ...]} を返す
+
+    正規化すると同じになるキーワードは常にまとめる。clusters（{キーワード: 代表}）を
+    渡すと代表だけを問い合わせ、inherit=True ならクラスタの他のキーワードにも代表の値を配る。
+    """
+    if clusters is None:
+        return {group[0]: group for group in normalizer.group(keywords).values()}
+    owners = {}
+    for keyword in keywords:
+        head = clusters.get(keyword, keyword)
+        members = owners.setdefault(head, [])
+        if inherit or normalizer(keyword) == normalizer(head):
+            members.append(keyword)
+    return owners
+
+
+def _cached_values(keywords, cache, owners):
+    """{種別: {キーワード: キャッシュの値}}（代表の値は、値の無いメンバーにも配る）"""
+    values = {}
+    for kind in (ALLINTITLE, FRESHNESS):
+        values[kind] = cache.get_many(kind, keywords)
+        kind_values = values[kind]
+        for head, members in owners.items():
+            if head in kind_values and len(members) > 1:
+                for member in members:
+                    kind_values.setdefault(member, kind_values[head])
+    return values
+
+
+def _serp_signals(keywords, client, settings, cache, progress, plan, on_values=None,
+                  normalizer=None, clusters=None, inherit=True, depths=None):
+    """
+    キャッシュに無い (キーワード, 種別) だけを DataForSEO に問い合わせ、
+    {種別: {キーワード: 値}} を返す。全種別のタスクを 1 つのパイプラインで処理し、
+    何をどの順で投稿するかは plan（core.planner.SerpTaskPlan）が決める。
+    正規化すると同じになるキーワード（と clusters の同じクラスタのキーワード）は
+    代表の 1 つだけを問い合わせ、結果を配る（_owners）。
+    on_values(values, キーワード一覧) はキャッシュから読んだ直後と、結果を受け取るたびに呼ばれる。
+    depths（{キーワード: 再帰展開の深さ}）は plan の優先順位の見積もりに使う。
+    """
+    owners = _owners(keywords, normalizer or KeywordNormalizer(), clusters, inherit)
+    values = _cached_values(keywords, cache, owners)
+    missing = plan.initial(list(owners), values, depths)
+    for kind in (ALLINTITLE, FRESHNESS):
+        logger.info(
+            "%s: キャッシュ %d 件 / 取得 %d 件", kind, len(values[kind]),
+            sum(1 for _, k in missing if k == kind),
+        )
+    if plan.skipped or plan.deferred:
+        logger.info(
+            "日付指定検索: ランク C に決まるため省略 %d 件 / allintitle の結果待ち %d 件",
+            len(plan.skipped), plan.deferred,
+        )
+    if plan.budget is not None and missing:
+        tasks = plan.expected_tasks(missing, values[ALLINTITLE])
+        cost = plan.budget.estimate(tasks, DEFAULT_TASK_COST)
+        logger.info("見積もり: タスク %d 件 / 料金 約 %.4f", sum(tasks.values()), cost)
+        plan.budget.warn_estimate(cost)
+    if len(owners) < len(keywords):
+        logger.info("重複・類似の %d 件は代表のキーワードだけを取得します", len(keywords) - len(owners))
+    if on_values:
+        on_values(values, keywords)
+
+    def on_results(results):
+        by_kind = {}
+        updated = []
+        for keyword, kind, value in results:
+            by_kind.setdefault(kind, []).append((keyword, value))
+            members = owners.get(keyword, [keyword])
+            values[kind][keyword] = value
+            for member in members:
+                values[kind].setdefault(member, value)
+            updated.append(keyword)
+            updated.extend(members)
+        for kind, items in by_kind.items():
+            cache.set_many(kind, items)
+        if on_values:
+            on_values(values, updated)
+
+    # 前回の実行で回収できなかったタスクがあれば、取得対象が無くても回収する
+    journal = TaskJournal()
+    try:
+        if missing or journal.outstanding:
+            run_tasks(client, missing, settings, progress, journal=journal, on_results=on_results,
+                      plan=plan)
+    finally:
+        journal.close()
+    return values
+
+
+def run_pipeline(profile, api_keys, seeds=None, no_cache=False, progress=None, resume=True,
+                 refresh=(), cache=None, on_rows=None, summary_dir=RUNS_DIR):
+    """
+    プロファイルに対して分析を実行し、結果を ResultTable で返す
+
+    seeds を省略した場合はプロファイルの seeds を使う。
+    DataForSEO のログイン情報が無い場合はサジェスト収集のみ行う。
+    resume=False の場合は保存済みの再帰展開の途中状態を破棄してから開始する。
+    refresh に指定した種別（"suggest" / "allintitle" / "freshness"）は有効期限内の
+    キャッシュがあっても再取得する。no_cache=True は全種別を再取得する。
+    cache に共有キャッシュ（core.cache.get_shared_cache）を渡すと、そのビューを使い、
+    終了時に閉じない。省略時はこの実行だけのキャッシュを開いて閉じる。
+
+    progress(段階, 完了数, 全体数) の段階は "suggest"（サジェスト取得）/ "posted"（タスク投稿）/
+    "ready"（タスク結果取得）/ "ranked"（ランク確定）。on_rows を渡すと、ランクが確定した行を
+    dict のリストで逐次受け取れる。
+
+    終了時（失敗時も）に段階ごとの所要時間と計測値（core.metrics）のサマリーを
+    summary_dir（既定は outputs/runs/）に書き出す。None なら書き出さない。
+    """
+    settings = profile["settings"]
+    seeds = seeds if seeds is not None else profile["seeds"]
+    recorder = RunRecorder(profile["name"])
+    table = None
+    status = "error"
+    base = cache if cache is not None else open_cache(settings)
+    run_cache = base.view(enabled=not no_cache, bypass=refresh, profile=profile["name"],
+                          ttl=CachePolicy.from_settings(settings).ttl)
+    try:
+        table = _run(profile, api_keys, seeds, settings, run_cache, progress, resume, on_rows,
+                     recorder)
+        status = "ok"
+        return table
+    finally:
+        if cache is None:
+            base.close()
+        RUNS.inc(result=status)
+        if table is not None:
+            KEYWORDS.inc(len(table))
+        if summary_dir:
+            _write_summary(recorder, summary_dir, status, settings, table)
+
+
+def estimate_pipeline(profile, seeds=None, no_cache=False, progress=None, resume=True, refresh=(),
+                      cache=None):
+    """
+    DataForSEO に投稿せずに、実行した場合のキャッシュの利用件数と有料のタスク数・料金を見積もる
+
+    引数は run_pipeline と同じ（no_cache / refresh の見積もりへの影響を確かめられる）。
+    サジェストの収集とクラスタリングは実際に行う（サジェストは無料で、取得した分は
+    キャッシュに残るため続けて実行する run_pipeline で再利用される）。
+    料金は種別ごとのこれまでの 1 タスクあたりの実績（core.budget.SpendLedger）で見積もる。
+    stop_after_s / max_cost / budget の上限による打ち切りは考えない。
+
+    返す dict: keywords（候補数）/ queried（重複・類似をまとめた問い合わせ対象数）/
+    cached・tasks（{種別: 件数}）/ freshness_skipped / cost / budget（今日の料金と上限）
+    """
+    settings = profile["settings"]
+    seeds = seeds if seeds is not None else profile["seeds"]
+    recorder = RunRecorder(profile["name"])
+    base = cache if cache is not None else open_cache(settings)
+    run_cache = base.view(enabled=not no_cache, bypass=refresh, profile=profile["name"],
+                          ttl=CachePolicy.from_settings(settings).ttl)
+    budget = Budget.from_settings(settings, profile["name"])
+    try:
+        rows, table, normalizer = _candidates(profile, seeds, settings, run_cache, progress, resume,
+                                              recorder)
+        clusters = _cluster(rows, table, settings, normalizer, recorder)
+        keywords = list(table.keyword)
+        owners = _owners(keywords, normalizer, clusters, settings["cluster"].get("inherit", True))
+        values = _cached_values(keywords, run_cache, owners)
+        plan = SerpTaskPlan.from_settings(settings["dataforseo"], settings["rank"])
+        missing = plan.initial(list(owners), values, {row["keyword"]: row["depth"] for row in rows})
+        tasks = plan.expected_tasks(missing, values[ALLINTITLE])
+        return {
+            "keywords": len(keywords),
+            "queried": len(owners),
+            "cached": {kind: sum(1 for head in owners if head in values[kind])
+                       for kind in (ALLINTITLE, FRESHNESS)},
+            "tasks": tasks,
+            "freshness_skipped": len(plan.skipped),
+            "cost": round(budget.estimate(tasks, DEFAULT_TASK_COST), 6),
+            "budget": budget.status(),
+        }
+    finally:
+        budget.close()
+        if cache is None:
+            base.close()
+
+
+def _write_summary(recorder, summary_dir, status, settings, table):
+    extra = {"status": status}
+    if table is not None:
+        extra["keywords"] = len(table)
+        codes, counts = np.unique(table.rank_code, return_counts=True)
+        extra["ranks"] = {
+            (RANKS[code] if code >= 0 else "unranked"): int(count) for code, count in zip(codes, counts)
+        }
+    # 並列度の調整に使う設定
+    extra["settings"] = {
+        "suggest": {k: settings["suggest"].get(k) for k in ("engine", "concurrency", "rate")},
+        "dataforseo": {
+            k: settings["dataforseo"].get(k)
+            for k in ("batch_size", "max_in_flight", "fetch_workers", "poll_interval", "stop_after_s",
+                      "max_cost")
+        },
+    }
+    try:
+        path = recorder.write(summary_dir, **extra)
+    except OSError as e:
+        logger.warning("実行サマリーを書き出せませんでした: %s", e)
+    else:
+        logger.info("実行サマリー: %s", path)
+
+
+def _candidates(profile, seeds, settings, cache, progress, resume, recorder):
+    """サジェストの候補を集め、(行, ResultTable, KeywordNormalizer) を返す"""
+    state_dir = os.path.join(CACHE_DIR, "frontier", profile["name"])
+    if not resume:
+        shutil.rmtree(state_dir, ignore_errors=True)
+    with recorder.stage("suggest"):
+        rows = collect_candidates(
+            seeds, settings["suggest"], cache=cache, progress=progress, state_dir=state_dir
+        )
+    logger.info("サジェスト候補: %d 件", len(rows))
+    normalizer = KeywordNormalizer.from_settings(settings)
+    table = ResultTable.from_rows(rows, normalizer)
+    return rows, table, normalizer
+
+
+def _cluster(rows, table, settings, normalizer, recorder):
+    """cluster.enabled なら類似キーワードをまとめ、{キーワード: 代表} を返す（無効なら None）"""
+    clusters = None
+    cluster_settings = settings["cluster"]
+    if cluster_settings.get("enabled"):
+        with recorder.stage("cluster"):
+            clusters = cluster_keywords(
+                table.keyword,
+                threshold=cluster_settings.get("threshold", 0.8),
+                ngram=cluster_settings.get("ngram", 2),
+                num_perm=cluster_settings.get("num_perm", 64),
+                normalizer=normalizer,
+            )
+        table.set_clusters(clusters)
+        for row in rows:
+            row["cluster"] = clusters[row["keyword"]]
+    return clusters
+
+
+def _run(profile, api_keys, seeds, settings, cache, progress, resume, on_rows, recorder):
+    rows, table, normalizer = _candidates(profile, seeds, settings, cache, progress, resume,
+                                          recorder)
+    if not (api_keys or {}).get("dataforseo"):
+        logger.info("DataForSEO のログイン情報が無いため競合分析をスキップします")
+        return table
+
+    clusters = _cluster(rows, table, settings, normalizer, recorder)
+    cluster_settings = settings["cluster"]
+    dfs_settings = settings["dataforseo"]
+    client = DataForSEOClient.from_api_keys(
+        api_keys,
+        base_url=dfs_settings.get("base_url") or API_BASE,
+        pool_size=dfs_settings.get("fetch_workers", 8),
+    )
+    budget = Budget.from_settings(settings, profile["name"])
+    plan = SerpTaskPlan.from_settings(dfs_settings, settings["rank"], budget=budget)
+    ranker = _PartialRanker(rows, settings["rank"], on_rows, progress, plan=plan)
+    try:
+        with recorder.stage("serp"):
+            values = _serp_signals(
+                list(table.keyword), client, dfs_settings, cache, progress, plan,
+                on_values=ranker.update, normalizer=normalizer, clusters=clusters,
+                inherit=cluster_settings.get("inherit", True),
+                depths={row["keyword"]: row["depth"] for row in rows},
+            )
+    finally:
+        client.close()
+        recorder.note(serp={
+            "cost": round(plan.cost, 6),
+            "freshness_skipped": len(plan.skipped),
+            "s_ranked": plan.s_ranked,
+            "stopped": plan.stop_reason,
+        }, budget=budget.status())
+        budget.close()
+
+    with recorder.stage("rank"):
+        table.set_signal("allintitle", values[ALLINTITLE])
+        table.set_signal("recent_count", values[FRESHNESS])
+        table.rank(settings["rank"])
+    return table
+
+
+def iter_pipeline(profile, api_keys, interval=0.5, **kwargs):
+    """
+    run_pipeline を別スレッドで実行し、途中経過を dict で yield するジェネレータ
+
+    - {"type": "progress", "stages": {段階: (完了数, 全体数), ...}}
+    - {"type": "rows", "rows": [...]}: 前回以降にランクが確定した行だけ
+    - {"type": "done", "table": ResultTable}: 最後に 1 回
+
+    イベントは interval 秒ごとにまとめて yield するため、呼び出し側（GUI）の
+    更新頻度は結果の件数に依存しない。kwargs は run_pipeline にそのまま渡す。
+
+    ジェネレータが閉じられる（Gradio のタブが閉じられるなど）と cancel を立て、
+    実行中のスレッドは次の progress で PipelineCancelled により打ち切る
+    （投稿済みのタスクはジャーナルに残り、次回の実行で回収する）。
+    """
+    events = queue.Queue()
+    cancel = threading.Event()
+
+    def progress(stage, done, total):
+        if cancel.is_set():
+            raise PipelineCancelled()
+        events.put(("progress", stage, (done, total)))
+
+    def on_rows(rows):
+        events.put(("rows", None, rows))
+
+    def worker():
+        try:
+            table = run_pipeline(profile, api_keys, progress=progress, on_rows=on_rows, **kwargs)
+        except PipelineCancelled:
+            logger.info("呼び出し側が終了したため実行を打ち切りました")
+        except BaseException as e:
+            events.put(("error", None, e))
+        else:
+            events.put(("done", None, table))
+
+    threading.Thread(target=worker, name="pipeline", daemon=True).start()
+
+    stages = {}
+    pending_rows = []
+    changed = False
+    next_flush = time.monotonic() + interval
+    try:
+        while True:
+            try:
+                kind, stage, payload = events.get(timeout=max(0.0, next_flush - time.monotonic()))
+            except queue.Empty:
+                kind = None
+            if kind == "progress":
+                stages[stage] = payload
+                changed = True
+            elif kind == "rows":
+                pending_rows.extend(payload)
+
+            finished = kind in ("done", "error")
+            if finished or time.monotonic() >= next_flush:
+                if changed:
+                    yield {"type": "progress", "stages": dict(stages)}
+                    changed = False
+                if pending_rows:
+                    yield {"type": "rows", "rows": pending_rows}
+                    pending_rows = []
+                next_flush = time.monotonic() + interval
+            if kind == "error":
+                raise payload
+            if kind == "done":
+                yield {"type": "done", "table": payload}
+                return
+    finally:
+        cancel.set()
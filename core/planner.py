@@ -0,0 +1,404 @@
+"""
+DataForSEO タスクの投稿計画
+
+キーワードごとに allintitle 検索と日付指定検索の 2 種類のタスクが必要になる。
+SerpTaskPlan はキャッシュにある値を踏まえて、どの (キーワード, 種別) をどの順で
+投稿するかを決める。
+
+- 同じキーワードの 2 種類のタスクは並べて投稿し、同じバッチ（最大 100 タスク）に載せる
+- allintitle 件数だけでランク C に決まるキーワード（core.ranker.decided_by_allintitle）の
+  日付指定検索は投稿しない
+- skip_freshness が有効な場合、allintitle が未取得のキーワードの日付指定検索は
+  allintitle の結果を受け取るまで保留し、C に決まらなければ後続のバッチに加える
+  （follow_up）。1 キーワードあたりの投稿は 1 往復増えるが、C の分の料金がかからない
+
+prioritize が有効なら、S / A になりそうなキーワードから投稿する（priority_order）。
+stop_after_s（ランク S のキーワード数）か max_cost（この実行で投稿したタスクの料金の合計）に
+達すると、まだ投稿していないキーワードは問い合わせずに終える（ランクは未判定のまま）。
+S の件数で止めた場合も、allintitle を投稿済みのキーワードの日付指定検索は投稿する。
+stop_after_s を指定した場合は、打ち切りが効くようにランク未確定のキーワードの投稿数を
+これまでの S の割合（キャッシュにある allintitle 件数を含む）から見積もった数までに抑える。
+max_cost を指定した場合は、投稿済みのキーワードの残りのタスクの料金を確保した上で、残りの
+料金で始められる数までに抑える（admissible）。admissible / affordable_tasks は問い合わせだけで、
+料金による打ち切りは check_limits で決める。打ち切った後も、投稿済みのキーワードの残りの
+タスクは料金の残りで投稿できる分だけ投稿する（trim）。budget（core.budget.Budget）を渡すと、1 日の料金の上限（hard）の残りも
+max_cost と同じように扱う（小さい方が効く）。
+"""
+
+import logging
+import math
+
+from core.dataforseo import ALLINTITLE, FRESHNESS
+from core.metrics import TASKS_SKIPPED
+from core.ranker import RANKS, decided_by_allintitle
+
+logger = logging.getLogger(__name__)
+
+# priority_order の重み（allintitle 件数の対数に対する、深さ・語数 1 つあたりの差）
+DEPTH_WEIGHT = 0.5
+WORDS_WEIGHT = 0.5
+
+# admissible の最初の投稿数、S の確定率を使い始める件数、見込みに対する余裕
+PROBE = 100
+MIN_CHECKED = 10
+WINDOW_MARGIN = 1.5
+
+# 料金の実績が無い間の 1 タスクあたりの料金の見積もり（USD。Standard キュー）
+DEFAULT_TASK_COST = 0.0006
+
+
+def _words(keyword):
+    return keyword.split()
+
+
+def priority_order(keywords, cached_allintitle, depths=None):
+    """
+    allintitle 件数が少なそうな（S / A になりそうな）順にキーワードを並べ替える
+
+    見込みの件数（対数）は、キーワードの各語を含むキャッシュ済みのキーワードの
+    allintitle 件数の対数平均（似たキーワードの過去の競合の多さ）を語ごとに平均し、
+    再帰展開の深さと語数が多い（ロングテールの）ほど小さく見積もる。
+    キャッシュに手掛かりが無い語は全体の平均とみなす。同じ見込みなら元の順序を保つ。
+    """
+    depths = depths or {}
+    totals = {}
+    for keyword, count in cached_allintitle.items():
+        if count is None:
+            continue
+        value = math.log1p(count)
+        for word in set(_words(keyword)):
+            entry = totals.setdefault(word, [0.0, 0])
+            entry[0] += value
+            entry[1] += 1
+    overall = (
+        sum(total for total, _ in totals.values()) / sum(n for _, n in totals.values())
+        if totals else 0.0
+    )
+
+    def score(keyword):
+        words = _words(keyword) or [keyword]
+        history = sum(
+            totals[word][0] / totals[word][1] if word in totals else overall for word in words
+        ) / len(words)
+        return history - DEPTH_WEIGHT * depths.get(keyword, 0) - WORDS_WEIGHT * (len(words) - 1)
+
+    return sorted(keywords, key=score)
+
+
+class SerpTaskPlan:
+    def __init__(self, thresholds, skip_freshness=True, prioritize=True, stop_after_s=None,
+                 max_cost=None, budget=None):
+        self.thresholds = thresholds
+        self.skip_freshness = skip_freshness
+        self.prioritize = prioritize
+        self.stop_after_s = stop_after_s
+        self.max_cost = max_cost
+        self.budget = budget
+        self.skipped = set()  # 日付指定検索を省略したキーワード
+        self.cost = 0.0
+        self.s_ranked = 0
+        self.stop_reason = None
+        self._deferred = set()  # allintitle の結果待ちで日付指定検索を保留しているキーワード
+        self._started = set()  # この実行でタスクを投稿したキーワード
+        self._unresolved = set()  # _started のうちランクが確定していないもの
+        # admissible の見積もりに使う集計
+        self._awaiting = set()  # allintitle の結果待ち
+        self._candidates = set()  # allintitle 件数が S の範囲で、ランクが未確定
+        self._cached_candidates = set()  # キャッシュの allintitle 件数が S の範囲
+        self._allintitle_seen = 0
+        self._candidates_seen = 0
+        self._cached_seen = 0  # キャッシュにある allintitle 件数の数
+        self._cached_candidates_seen = 0  # そのうち S の範囲のもの
+        self._checked = 0  # S の範囲の allintitle 件数でランクが確定した数
+        self._confirmed = 0  # そのうち S になった数
+        self._tasks_posted = 0
+        self._follow_ups_seen = 0  # allintitle の結果から日付指定検索を追加した数
+        self._queued_follow_ups = set()  # 追加して未投稿の日付指定検索
+
+    @classmethod
+    def from_settings(cls, settings, thresholds, budget=None):
+        return cls(
+            thresholds,
+            skip_freshness=settings.get("skip_freshness_for_c", True),
+            prioritize=settings.get("prioritize", True),
+            stop_after_s=settings.get("stop_after_s"),
+            max_cost=settings.get("max_cost"),
+            budget=budget,
+        )
+
+    @property
+    def deferred(self):
+        return len(self._deferred)
+
+    @property
+    def follow_ups_in_flight(self):
+        """保留中の日付指定検索のうち、allintitle を投稿済みで結果を待っているキーワード数"""
+        return len(self._deferred & self._awaiting)
+
+    def _decided(self, allintitle):
+        return self.skip_freshness and decided_by_allintitle(allintitle, self.thresholds)
+
+    def initial(self, keywords, values, depths=None):
+        """
+        最初に投稿する (キーワード, 種別) のリストを返す
+
+        values は {種別: {キーワード: キャッシュの値}}。キャッシュにある種別は投稿しない。
+        depths（{キーワード: 再帰展開の深さ}）は優先順位の見積もりに使う。
+        """
+        requests_ = []
+        cached_allintitle = values[ALLINTITLE]
+        cached_freshness = values[FRESHNESS]
+        if self.prioritize:
+            keywords = priority_order(keywords, cached_allintitle, depths)
+        s_limit = self.thresholds[RANKS[0]]
+        for keyword in keywords:
+            if cached_allintitle.get(keyword) is not None:
+                self._cached_seen += 1
+                self._cached_candidates_seen += cached_allintitle[keyword] <= s_limit
+            if keyword not in cached_allintitle:
+                requests_.append((keyword, ALLINTITLE))
+                if keyword in cached_freshness:
+                    continue
+                if self.skip_freshness:
+                    self._deferred.add(keyword)
+                else:
+                    requests_.append((keyword, FRESHNESS))
+            elif keyword not in cached_freshness:
+                if cached_allintitle[keyword] is not None and cached_allintitle[keyword] <= s_limit:
+                    self._cached_candidates.add(keyword)
+                if self._decided(cached_allintitle[keyword]):
+                    self._skip(keyword)
+                else:
+                    requests_.append((keyword, FRESHNESS))
+        return requests_
+
+    def expected_tasks(self, requests_, cached_allintitle):
+        """
+        initial が返した requests_ から、この実行で投稿する見込みのタスク数を {種別: 件数} で返す
+
+        保留した日付指定検索は、キャッシュにある allintitle 件数のうちランク C に
+        決まらないものの割合だけ投稿されるとみなす（キャッシュが無ければすべて）。
+        打ち切り（stop_after_s / max_cost）は考えない。
+        """
+        counts = {ALLINTITLE: 0, FRESHNESS: 0}
+        for _, kind in requests_:
+            counts[kind] += 1
+        known = [value for value in cached_allintitle.values() if value is not None]
+        rate = sum(1 for value in known if not self._decided(value)) / len(known) if known else 1.0
+        counts[FRESHNESS] += round(len(self._deferred) * rate)
+        return counts
+
+    def _skip(self, keyword):
+        self.skipped.add(keyword)
+        TASKS_SKIPPED.inc(kind=FRESHNESS)
+
+    def _resolve(self, keyword):
+        self._unresolved.discard(keyword)
+        self._awaiting.discard(keyword)
+        self._candidates.discard(keyword)
+
+    def follow_up(self, results):
+        """
+        取得した [(キーワード, 種別, 値), ...] から、追加で投稿する (キーワード, 種別) を返す
+
+        allintitle が取得できなかった（値が None の）キーワードはランクを判定できないため、
+        保留していた日付指定検索も投稿しない。
+        """
+        requests_ = []
+        for keyword, kind, value in results:
+            if value is None:
+                # 取得できなかったキーワードはこの実行ではランクが確定しない
+                self._deferred.discard(keyword)
+                self._queued_follow_ups.discard(keyword)
+                self._resolve(keyword)
+                continue
+            if kind == ALLINTITLE and keyword in self._awaiting:
+                self._awaiting.discard(keyword)
+                self._allintitle_seen += 1
+                if value <= self.thresholds[RANKS[0]]:
+                    self._candidates_seen += 1
+                    if keyword in self._unresolved:
+                        self._candidates.add(keyword)
+            if kind != ALLINTITLE or keyword not in self._deferred:
+                continue
+            self._deferred.discard(keyword)
+            if self._decided(value):
+                self._skip(keyword)
+            else:
+                self._follow_ups_seen += 1
+                self._queued_follow_ups.add(keyword)
+                requests_.append((keyword, FRESHNESS))
+        return requests_
+
+    def admissible(self):
+        """
+        新たにタスクを投稿してよいキーワード数（制限しない場合は None）
+
+        stop_after_s と料金の上限のそれぞれの制限（_s_allowance / _cost_allowance）の小さい方。
+        """
+        if self.stop_reason is not None:
+            return 0
+        limits = [
+            limit for limit in (self._s_allowance(), self._cost_allowance()) if limit is not None
+        ]
+        return min(limits) if limits else None
+
+    def _s_allowance(self):
+        """
+        投稿済みのキーワードから見込める S の件数と合わせて、残りの S の件数に足りる分だけを
+        投稿する（投稿しすぎると打ち切りが効かない）
+
+        1 キーワードあたりの S の見込みは、allintitle 件数が S の範囲に入った割合と、
+        そのうち直近の競合記事が無く S に確定した割合の積。S の範囲に入った割合には、
+        この実行で受け取った allintitle 件数とキャッシュにあったものの両方を使う。
+        allintitle 件数が合わせて PROBE 件わかるまでは合計 PROBE 件まで、S の範囲が 1 件も
+        無い間はわかった件数と同じだけ広げる。
+        """
+        if self.stop_after_s is None:
+            return None
+        seen = self._allintitle_seen + self._cached_seen
+        candidates_seen = self._candidates_seen + self._cached_candidates_seen
+        if seen < PROBE:
+            return max(PROBE - len(self._started), 0)
+        if not candidates_seen:
+            return max(seen - len(self._unresolved), 0)
+        p_candidate = candidates_seen / seen
+        p_clean = self._confirmed / self._checked if self._checked >= MIN_CHECKED else 1.0
+        if not p_clean:
+            return max(seen - len(self._unresolved), 0)
+        expected = (len(self._candidates) + len(self._awaiting) * p_candidate) * p_clean
+        remaining = self.stop_after_s - self.s_ranked - expected
+        if remaining <= 0:
+            return 0
+        return math.ceil(remaining / (p_candidate * p_clean) * WINDOW_MARGIN)
+
+    def _cost_allowance(self):
+        """
+        料金の残り（_remaining）から、投稿済みのキーワードの残りのタスク（保留中・追加済みの
+        日付指定検索）の分を除いた料金で始められるキーワード数
+
+        allintitle の結果を待たずに打ち切ると、払った allintitle の分のランクが
+        確定しないため、その分の料金を先に確保しておく。
+        """
+        remaining, _ = self._remaining()
+        if remaining is None:
+            return None
+        per_task = self._task_cost()
+        if not per_task:
+            return None
+        p_follow = (
+            self._follow_ups_seen / self._allintitle_seen if self._allintitle_seen else 1.0
+        )
+        reserved = len(self._queued_follow_ups)
+        if self.skip_freshness:
+            reserved += len(self._awaiting) * p_follow
+        tasks_per_keyword = 1 + p_follow if self.skip_freshness else 2
+        return max(int((remaining / per_task - reserved) / tasks_per_keyword), 0)
+
+    def _remaining(self):
+        """
+        この実行で使える残りの料金と、それを決めた上限の説明（制限しない場合は (None, None)）
+
+        max_cost の残りと、budget の hard の上限の残りの小さい方。
+        """
+        limits = []
+        if self.max_cost is not None:
+            limits.append((self.max_cost - self.cost, f"この実行の上限 {self.max_cost}"))
+        if self.budget is not None:
+            remaining = self.budget.remaining()
+            if remaining[0] is not None:
+                limits.append(remaining)
+        return min(limits) if limits else (None, None)
+
+    def _task_cost(self):
+        return self.cost / self._tasks_posted if self._tasks_posted else DEFAULT_TASK_COST
+
+    def affordable_tasks(self):
+        """料金の残りで投稿できるタスク数（制限しない場合は None）"""
+        remaining, _ = self._remaining()
+        if remaining is None or not self._task_cost():
+            return None
+        return max(int(remaining / self._task_cost() + 1e-9), 0)
+
+    def check_limits(self):
+        """
+        料金の上限による打ち切りを判定する
+
+        料金の残りで 1 タスクも投稿できなくなったか、投稿済みのキーワードの残りのタスクが
+        無く、残りの料金で新たなキーワードを始められなくなった場合に打ち切る。
+        """
+        if self.stop_reason is not None:
+            return
+        remaining, limit = self._remaining()
+        if remaining is None:
+            return
+        if remaining <= 0 or self.affordable_tasks() == 0:
+            self._stop(f"料金が{limit} に達しました（この実行 {self.cost:.4f}）")
+        elif self._cost_allowance() == 0 and not (self._unresolved or self._queued_follow_ups):
+            self._stop(f"料金が{limit} に近づきました（この実行 {self.cost:.4f}）")
+
+    def is_started(self, keyword):
+        return keyword in self._started
+
+    def posted(self, requests_):
+        """投稿した (キーワード, 種別) を記録する"""
+        self._tasks_posted += len(requests_)
+        for keyword, kind in requests_:
+            if kind == FRESHNESS:
+                self._queued_follow_ups.discard(keyword)
+            if keyword not in self._started:
+                self._started.add(keyword)
+                self._unresolved.add(keyword)
+                if keyword in self._cached_candidates:
+                    self._candidates.add(keyword)
+            if kind == ALLINTITLE:
+                self._awaiting.add(keyword)
+
+    def record_cost(self, spent):
+        """
+        投稿したタスクの料金（{種別: (タスク数, task_post のレスポンスの cost の合計)}）を加える
+
+        budget を渡していれば、その台帳にも記録する。
+        """
+        self.cost += sum(cost for _, cost in spent.values())
+        if self.budget is not None:
+            self.budget.record(spent)
+        self.check_limits()
+
+    def record_ranks(self, ranked):
+        """ランクが確定した [(キーワード, ランク), ...] を加える"""
+        for keyword, rank in ranked:
+            if keyword in self._candidates:
+                self._checked += 1
+                self._confirmed += rank == RANKS[0]
+            self._resolve(keyword)
+            if rank == RANKS[0]:
+                self.s_ranked += 1
+        if (
+            self.stop_after_s is not None and self.s_ranked >= self.stop_after_s
+            and self.stop_reason is None
+        ):
+            self._stop(f"ランク S のキーワードが {self.s_ranked} 件見つかりました")
+
+    def _stop(self, reason):
+        self.stop_reason = reason
+        logger.info("%s。未投稿のキーワードは問い合わせずに終了します", reason)
+
+    def trim(self, queue):
+        """
+        打ち切り後に、投稿待ちの queue（(キーワード, 種別) の deque）から投稿しないものを除き、
+        除いた件数を返す
+
+        投稿済みのキーワードの残りのタスク（保留していた日付指定検索）は、ランクが
+        確定するよう料金の残りで投稿できる分（affordable_tasks）まで残す。
+        """
+        if self.stop_reason is None or not queue:
+            return 0
+        before = len(queue)
+        kept = [(kw, kind) for kw, kind in queue if kw in self._started]
+        affordable = self.affordable_tasks()
+        if affordable is not None:
+            kept = kept[:affordable]
+        queue.clear()
+        queue.extend(kept)
+        return before - len(kept)
@@ -0,0 +1,160 @@
+"""
+tasks_ready の確認間隔の調整
+
+固定間隔で tasks_ready を確認すると、短ければ API 呼び出しが無駄になり、長ければ
+完了したタスクの取得が遅れる。AdaptivePoller は過去のタスクの完了までの時間
+（QueueLatencyModel、cache/dataforseo/queue_latency.json に保存）から、
+未取得のタスクが完了しそうな時刻に合わせて次の確認時刻を決める。
+
+- 完了が見込まれる時刻より前は確認しない（その時刻まで待つ）
+- 見込みの時刻を過ぎても完了していなければ、確認の間隔を指数的に延ばす
+- 完了したタスクが見つかったら間隔を最小に戻す（同じバッチのタスクは近い時刻に完了する）
+"""
+
+import json
+import logging
+import math
+import os
+from collections import deque
+
+from core.config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_PATH = os.path.join(CACHE_DIR, "dataforseo", "queue_latency.json")
+
+
+class QueueLatencyModel:
+    """
+    タスクの投稿から完了までの秒数の分布
+
+    直近 max_samples 件の観測値を保持し、キューの混み具合の変化に追従する。
+    観測値は「完了を確認した時刻」ではなく「前回の確認時刻（投稿より後）と
+    今回の確認時刻の中点」を使う。確認間隔の分だけ分布が遅い側にずれるのを防ぐため。
+    """
+
+    def __init__(self, path=DEFAULT_MODEL_PATH, max_samples=5000):
+        self.path = path
+        self.samples = deque(maxlen=max_samples)
+        self._sorted = None
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.samples.extend(json.load(f).get("samples", []))
+        except (OSError, ValueError):
+            pass
+
+    def __len__(self):
+        return len(self.samples)
+
+    def observe(self, posted_at, previous_poll_at, detected_at):
+        lower = max(posted_at, previous_poll_at or posted_at)
+        self.samples.append(round((lower + detected_at) / 2 - posted_at, 3))
+        self._sorted = None
+
+    def quantile(self, q):
+        """q 分位点（観測値が無ければ None）"""
+        if not self.samples:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        index = min(len(self._sorted) - 1, max(0, int(q * len(self._sorted))))
+        return self._sorted[index]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"samples": list(self.samples)}, f)
+        os.replace(tmp, self.path)
+
+
+class FixedPoller:
+    """一定間隔で確認する（poll_adaptive: false の場合）"""
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def next_delay(self, posted_times, now, found):
+        return self.interval
+
+    def observe(self, posted_at, detected_at):
+        pass
+
+    def polled(self, now):
+        pass
+
+    def save(self):
+        pass
+
+
+class AdaptivePoller:
+    """
+    完了時間の分布と指数バックオフで次の確認までの秒数を決める
+
+    posted_times は完了を確認していないタスクの投稿時刻。分布の quantile 分位点
+    （既定 0.1）を各タスクが完了し始める時刻とみなし、それより前は確認しない。
+    分布が空の間（初回）はバックオフだけで決める。
+    """
+
+    def __init__(self, model=None, min_interval=1.0, max_interval=20.0, quantile=0.1,
+                 backoff=2.0):
+        self.model = model if model is not None else QueueLatencyModel()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.quantile = quantile
+        self.backoff = backoff
+        self._interval = min_interval
+        self._last_poll_at = None
+
+    @classmethod
+    def from_settings(cls, settings, model=None):
+        if not settings.get("poll_adaptive", True):
+            return FixedPoller(settings.get("poll_interval", 10))
+        return cls(
+            model,
+            min_interval=settings.get("poll_min_interval", 1.0),
+            max_interval=settings.get("poll_max_interval", 20.0),
+            quantile=settings.get("poll_quantile", 0.1),
+        )
+
+    def polled(self, now):
+        """tasks_ready を確認した時刻を記録する（observe より後に呼ぶ）"""
+        self._last_poll_at = now
+
+    def observe(self, posted_at, detected_at):
+        """tasks_ready で完了を確認したタスクを分布に加える"""
+        self.model.observe(posted_at, self._last_poll_at, detected_at)
+
+    def next_delay(self, posted_times, now, found):
+        """次に tasks_ready を確認するまでの秒数"""
+        if found:
+            self._interval = self.min_interval
+        backoff = self._interval
+        if not found:
+            self._interval = min(self._interval * self.backoff, self.max_interval)
+
+        earliest = self.model.quantile(self.quantile)
+        if earliest is None or not posted_times:
+            delay = backoff
+        else:
+            # 完了が見込まれる時刻を過ぎたタスクはバックオフの間隔で、まだのタスクは
+            # その時刻に確認する（早い方）
+            until = [posted_at + earliest - now for posted_at in posted_times]
+            upcoming = [t for t in until if t > 0]
+            delay = backoff if len(upcoming) < len(until) else math.inf
+            if upcoming:
+                delay = min(delay, min(upcoming))
+        return min(max(delay, self.min_interval), self.max_interval)
+
+    def save(self):
+        try:
+            self.model.save()
+        except OSError as e:
+            logger.warning("キューの待ち時間の分布を保存できませんでした: %s", e)
@@ -0,0 +1,74 @@
+"""
+競合状況に基づくランク判定（S / A / B / C）
+
+rank_keyword は 1 キーワード分の判定、rank_codes は NumPy 配列に対する一括判定。
+どちらも同じ規則で判定する。
+"""
+
+import numpy as np
+
+RANKS = ["S", "A", "B", "C"]
+
+# rank_codes の戻り値で allintitle 未取得を表すコード
+UNRANKED = -1
+
+
+def rank_keyword(allintitle, recent_count, thresholds):
+    """
+    allintitle 件数と直近の競合記事数からランクを返す
+
+    allintitle 件数が thresholds["S"] 以下なら S、["A"] 以下なら A、["B"] 以下なら B、
+    それを超えれば C。直近の競合記事がある場合は 1 ランク下げる（C はそのまま）。
+    allintitle が未取得（None）の場合と、recent_count が未取得（None）で allintitle 件数だけでは
+    決まらない（decided_by_allintitle でない）場合は None を返す。
+    """
+    if allintitle is None:
+        return None
+    if recent_count is None and not decided_by_allintitle(allintitle, thresholds):
+        return None
+
+    index = len(RANKS) - 1
+    for i, rank in enumerate(RANKS[:-1]):
+        if allintitle <= thresholds[rank]:
+            index = i
+            break
+
+    if recent_count:
+        index = min(index + 1, len(RANKS) - 1)
+    return RANKS[index]
+
+
+def decided_by_allintitle(allintitle, thresholds):
+    """
+    直近の競合記事数に関係なくランクが決まるか
+
+    allintitle 件数が thresholds["B"] を超えると C になり、直近の競合記事があっても
+    C のまま変わらない。
+    """
+    return allintitle is not None and allintitle > thresholds[RANKS[-2]]
+
+
+def rank_codes(allintitle, recent_count, thresholds):
+    """
+    rank_keyword と同じ判定を配列全体に対して行い、ランクの番号（RANKS の添字）を返す
+
+    allintitle・recent_count は未取得を NaN とした float 配列。allintitle が未取得の要素と、
+    recent_count が未取得で allintitle 件数だけでは C に決まらない要素は UNRANKED になる。
+    """
+    allintitle = np.asarray(allintitle, dtype=np.float64)
+    limits = np.array([thresholds[rank] for rank in RANKS[:-1]], dtype=np.float64)
+    # limits[i-1] < 件数 <= limits[i] となる i（S=0 … C=3）
+    codes = np.searchsorted(limits, allintitle, side="left").astype(np.int8)
+    recent_count = np.asarray(recent_count, dtype=np.float64)
+    recent = np.nan_to_num(recent_count) > 0
+    codes = np.minimum(codes + recent, len(RANKS) - 1).astype(np.int8)
+    codes[np.isnan(recent_count) & (codes < len(RANKS) - 1)] = UNRANKED
+    codes[np.isnan(allintitle)] = UNRANKED
+    return codes
+
+
+def rank_labels(codes):
+    """rank_codes の結果を "S" / "A" / "B" / "C" / None の object 配列にする"""
+    labels = np.array(RANKS + [None], dtype=object)
+    # UNRANKED（-1）は末尾の None を指す
+    return labels[np.asarray(codes)]
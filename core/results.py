@@ -0,0 +1,277 @@
+"""
+分析結果の列指向テーブル
+
+キーワードごとの値を列ごとの NumPy 配列で持ち、ランク判定などの処理を
+配列演算でまとめて行う。数値列の未取得は NaN で表す。
+
+keyword とは別に正規化したキーワード（normalized）を持ち、表記ゆれをまとめて表示するのに使う。
+
+しきい値を変えて判定し直す場合は rerank を使う。allintitle 件数の昇順の索引を
+保持しておき、しきい値の変化幅に入る行だけを二分探索で特定して判定し直す。
+"""
+
+import numpy as np
+
+from core.ranker import RANKS, rank_codes, rank_labels
+
+COLUMNS = ["keyword", "seed", "depth", "allintitle", "recent_count", "trend", "rank", "cluster"]
+
+
+def _float_column(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+
+
+def _numeric(values, n):
+    if values is None:
+        return np.full(n, np.nan)
+    return np.asarray(values, dtype=np.float64)
+
+
+class ResultTable:
+    def __init__(self, keyword, seed, depth, allintitle=None, recent_count=None, trend=None,
+                 normalized=None):
+        n = len(keyword)
+        self.keyword = np.asarray(keyword, dtype=object)
+        self.normalized = self.keyword if normalized is None else np.asarray(normalized, dtype=object)
+        # 類似キーワードのクラスタの代表（クラスタリングしていなければ None）
+        self.cluster = np.full(n, None, dtype=object)
+        self.seed = np.asarray(seed, dtype=object)
+        self.depth = np.asarray(depth, dtype=np.int16)
+        self.keyword_id = np.arange(n, dtype=np.int64)
+        self.allintitle = _numeric(allintitle, n)
+        self.recent_count = _numeric(recent_count, n)
+        self.trend = _numeric(trend, n)
+        self.rank_code = np.full(n, -1, dtype=np.int8)
+        self.thresholds = None
+        # 値が変わるたびに増える番号（ResultView が索引を作り直す判断に使う）
+        self.version = 0
+        self._order = None
+        self._sorted_allintitle = None
+
+    @classmethod
+    def from_rows(cls, rows, normalizer=None):
+        """
+        {"keyword", "seed", "depth", ...} の dict のリストから作る
+
+        normalizer（core.normalize.KeywordNormalizer）を渡すと normalized 列を埋める。
+        """
+        table = cls(
+            [row["keyword"] for row in rows],
+            [row.get("seed") for row in rows],
+            [row.get("depth", 0) for row in rows],
+            _float_column(row.get("allintitle") for row in rows),
+            _float_column(row.get("recent_count") for row in rows),
+            _float_column(row.get("trend") for row in rows),
+            [normalizer(row["keyword"]) for row in rows] if normalizer else None,
+        )
+        table.cluster[:] = [row.get("cluster") for row in rows]
+        return table
+
+    def __len__(self):
+        return len(self.keyword)
+
+    def set_clusters(self, clusters):
+        """{キーワード: クラスタの代表}（core.cluster.cluster_keywords）から cluster 列を埋める"""
+        self.cluster[:] = [clusters.get(kw) for kw in self.keyword]
+        self.version += 1
+
+    def set_signal(self, name, values):
+        """{キーワード: 値} から数値列（allintitle / recent_count / trend）を埋める"""
+        getattr(self, name)[:] = _float_column(values.get(kw) for kw in self.keyword)
+        self._order = None
+        self.thresholds = None
+        self.version += 1
+
+    def rank(self, thresholds):
+        """全行のランクを配列演算で判定する"""
+        self.rank_code = rank_codes(self.allintitle, self.recent_count, thresholds)
+        self.thresholds = dict(thresholds)
+        self.version += 1
+        return self.rank_code
+
+    def _sorted_index(self):
+        if self._order is None:
+            # NaN（未取得）は末尾に並ぶ
+            self._order = np.argsort(self.allintitle, kind="stable")
+            self._sorted_allintitle = self.allintitle[self._order]
+        return self._order, self._sorted_allintitle
+
+    def rerank(self, thresholds):
+        """
+        しきい値を変えて判定し直し、ランクが変わった行の番号（keyword_id）を返す
+
+        しきい値 t が t' に変わったとき、ランクが変わり得るのは allintitle 件数が
+        min(t, t') より大きく max(t, t') 以下の行だけなので、その範囲を二分探索で
+        切り出して判定し直す。未判定の場合やシグナルが更新された後は全行を判定する。
+        """
+        if self.thresholds is None:
+            before = self.rank_code.copy()
+            self.rank(thresholds)
+            return np.flatnonzero(before != self.rank_code)
+
+        order, sorted_allintitle = self._sorted_index()
+        affected = []
+        for rank, old in self.thresholds.items():
+            new = thresholds[rank]
+            if new == old:
+                continue
+            lo, hi = sorted((old, new))
+            start = np.searchsorted(sorted_allintitle, lo, side="right")
+            end = np.searchsorted(sorted_allintitle, hi, side="right")
+            affected.append(order[start:end])
+        self.thresholds = dict(thresholds)
+        if not affected:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.unique(np.concatenate(affected))
+        codes = rank_codes(self.allintitle[rows], self.recent_count[rows], thresholds)
+        changed = rows[codes != self.rank_code[rows]]
+        self.rank_code[rows] = codes
+        if len(changed):
+            self.version += 1
+        return changed
+
+    @property
+    def ranks(self):
+        return rank_labels(self.rank_code)
+
+    def columns(self, indices=None):
+        """出力用に列名 → 配列の dict を返す（indices を渡すとその行だけ）"""
+        rows = slice(None) if indices is None else indices
+        return {
+            "keyword": self.keyword[rows],
+            "seed": self.seed[rows],
+            "depth": self.depth[rows],
+            "allintitle": self.allintitle[rows],
+            "recent_count": self.recent_count[rows],
+            "trend": self.trend[rows],
+            "rank": rank_labels(self.rank_code[rows]),
+            "cluster": self.cluster[rows],
+        }
+
+    def rows(self, indices=None):
+        """
+        1 行ずつ dict で返す（NaN は None、NumPy の数値は Python の数値にする）
+
+        indices を渡すとその行番号の行だけを、その順で返す。
+        """
+        columns = self.columns(indices)
+        for i in range(len(columns["keyword"])):
+            yield {name: _to_python(columns[name][i]) for name in COLUMNS}
+
+
+def _to_python(value):
+    if isinstance(value, np.floating):
+        if np.isnan(value):
+            return None
+        return int(value) if value.is_integer() else float(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    return value
+
+
+class ResultView:
+    """
+    ResultTable をサーバー側で絞り込み・並べ替えし、表示するページの行だけを返す
+
+    列ごとの並び順（argsort）はテーブルの version が変わるまで使い回し、
+    直前と同じ条件のページ送りでは絞り込み結果もそのまま使う。
+    """
+
+    SORTABLE = ("keyword", "depth", "allintitle", "recent_count", "trend", "rank")
+
+    def __init__(self, table):
+        self.table = table
+        self._version = None
+        self._orders = {}
+        self._keyword_str = None
+        self._representatives = None
+        self._last_key = None
+        self._last_indices = None
+
+    def _refresh(self):
+        if self._version != self.table.version:
+            self._orders = {}
+            self._last_key = None
+            self._version = self.table.version
+
+    def _order(self, column):
+        if column not in self._orders:
+            if column == "rank":
+                # 未判定（-1）は末尾に置く
+                values = np.where(self.table.rank_code < 0, 127, self.table.rank_code)
+            elif column == "keyword":
+                values = self._keywords()
+            else:
+                values = getattr(self.table, column)
+            self._orders[column] = np.argsort(values, kind="stable")
+        return self._orders[column]
+
+    def _keywords(self):
+        if self._keyword_str is None or len(self._keyword_str) != len(self.table):
+            self._keyword_str = self.table.keyword.astype(str)
+        return self._keyword_str
+
+    def _representative_mask(self):
+        """正規化後のキーワードごとに最初の行だけ True"""
+        if self._representatives is None or len(self._representatives) != len(self.table):
+            _, first = np.unique(self.table.normalized.astype(str), return_index=True)
+            self._representatives = np.zeros(len(self.table), dtype=bool)
+            self._representatives[first] = True
+        return self._representatives
+
+    def _mask(self, ranks, allintitle_min, allintitle_max, contains, recent, collapse_variants):
+        table = self.table
+        mask = self._representative_mask().copy() if collapse_variants else np.ones(len(table), dtype=bool)
+        if ranks:
+            codes = [RANKS.index(rank) for rank in ranks]
+            mask &= np.isin(table.rank_code, codes)
+        if allintitle_min is not None:
+            mask &= table.allintitle >= allintitle_min
+        if allintitle_max is not None:
+            mask &= table.allintitle <= allintitle_max
+        if recent is not None:
+            has_recent = np.nan_to_num(table.recent_count) > 0
+            mask &= has_recent if recent else ~has_recent
+        if contains:
+            mask &= np.char.find(self._keywords(), contains) >= 0
+        return mask
+
+    def query(self, ranks=None, allintitle_min=None, allintitle_max=None, contains=None,
+              recent=None, sort_by="allintitle", descending=False, page=0, page_size=100,
+              collapse_variants=False):
+        """
+        条件に合う行を並べ替え、page 番目（0 始まり）のページを返す
+
+        ranks: 表示するランク（例: ["S", "A"]）
+        allintitle_min / allintitle_max: allintitle 件数の範囲
+        contains: キーワードに含まれる文字列
+        recent: True なら直近の競合記事ありのみ、False なら無しのみ
+        collapse_variants: True なら表記ゆれ（正規化後が同じキーワード）を最初の 1 行にまとめる
+
+        戻り値は {"total": 該当件数, "page", "page_size", "rows": [dict, ...]}。
+        """
+        if sort_by not in self.SORTABLE:
+            raise ValueError(f"並べ替えできない列です: {sort_by}")
+        self._refresh()
+
+        key = (tuple(ranks or ()), allintitle_min, allintitle_max, contains, recent, sort_by,
+               descending, collapse_variants)
+        if key != self._last_key:
+            order = self._order(sort_by)
+            if descending:
+                order = order[::-1]
+            mask = self._mask(
+                ranks, allintitle_min, allintitle_max, contains, recent, collapse_variants
+            )
+            self._last_indices = order[mask[order]]
+            self._last_key = key
+
+        indices = self._last_indices
+        start = page * page_size
+        return {
+            "total": len(indices),
+            "page": page,
+            "page_size": page_size,
+            "rows": list(self.table.rows(indices[start:start + page_size])),
+        }
@@ -0,0 +1,519 @@
+"""
+DataForSEO タスクのパイプライン実行
+
+task_post / tasks_ready / task_get を重ねて実行する。投稿済みで未取得のタスクが
+max_in_flight 件に収まる範囲で次のバッチを投稿し続け、完了したタスクは
+スレッドプールで並列に取得する。全体の所要時間はバッチ数の合計ではなく、
+おおむね 1 バッチ分のキュー待ち時間に近づく。
+
+取得は投稿・tasks_ready の確認と並行して進め、取得が終わったタスクの分だけ
+次のバッチを投稿する。tasks_ready を確認する間隔は core.poller が過去のタスクの
+完了時間の分布から決める（poll_adaptive: false なら poll_interval の固定間隔）。
+callback_mode が pingback / postback で完了通知の受け口（core.callback）がある場合は、
+通知を受けたタスクから取得・取り込みを行い、tasks_ready は取りこぼし対策として
+callback_fallback_interval ごとにだけ確認する。
+
+plan（core.planner.SerpTaskPlan）を渡すと、取得した結果に応じて追加のタスク
+（保留していた日付指定検索）を次のバッチの先頭に加え、投稿したタスクの種別ごとの
+料金を渡す。
+plan が打ち切りを決めた後は、投稿待ちのタスクのうち plan.trim が残したものだけを投稿する。
+
+TaskJournal を渡すと投稿したタスクを記録し、開始時に前回の実行で回収できなかった
+タスクを新規投稿より先に回収する。task_get が失敗した（結果が空だった）タスクは
+fetch_retries 回まで間隔を空けて取得し直し、それでも取得できなければジャーナル上は
+未完了のまま残す（料金を払った結果を失わないよう、次回の実行で回収を試みる）。
+
+task_post のリクエスト自体が失敗した場合は、そのバッチを queue の先頭に戻し、
+post_retries 回まで間隔を空けて投稿し直す（使い切ったら、そのタスクは取得できなかった
+ものとして扱う）。tasks_ready が失敗した場合はその回の確認を飛ばし、poller の
+バックオフに従って次の確認を待つ。一時的なエラーで実行全体を止めないため。
+"""
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from core.callback import callback_fields, open_inbox
+from core.dataforseo import (
+    ALLINTITLE,
+    FRESHNESS,
+    STATUS_TASK_CREATED,
+    build_task,
+    extract_signal,
+    parse_task_tag,
+    task_tag,
+)
+from core.metrics import (
+    POLL_CYCLES,
+    TASK_COST,
+    TASK_WAIT_SECONDS,
+    TASKS_IN_FLIGHT,
+    TASKS_POSTED,
+)
+from core.poller import AdaptivePoller
+
+logger = logging.getLogger(__name__)
+
+
+class SerpTaskEngine:
+    def __init__(self, client, settings, progress=None, journal=None, on_results=None, poller=None,
+                 inbox=None, plan=None):
+        self.client = client
+        self.settings = settings
+        self.progress = progress
+        self.journal = journal
+        # 取得した結果をまとめて渡す on_results([(キーワード, 種別, 値), ...])。
+        # ジャーナルの完了記録はこの呼び出しの後に行う
+        self.on_results = on_results
+        self.plan = plan
+        self.batch_size = min(settings.get("batch_size", 100), 100)
+        self.max_in_flight = max(settings.get("max_in_flight", 1000), self.batch_size)
+        self.fetch_workers = settings.get("fetch_workers", 8)
+        # plan の追加タスクを待って 100 件未満のバッチの投稿を遅らせる最大秒数
+        self.batch_linger = settings.get("batch_linger", 1.0)
+        self.poll_timeout = settings.get("poll_timeout", 3600)
+        self.fetch_retries = settings.get("fetch_retries", 3)
+        self.fetch_retry_interval = settings.get("fetch_retry_interval", 5.0)
+        self.post_retries = settings.get("post_retries", 3)
+        self.poller = poller if poller is not None else AdaptivePoller.from_settings(settings)
+        self.inbox = inbox if inbox is not None else open_inbox(settings)
+        self.fallback_interval = settings.get("callback_fallback_interval", 300)
+        self._callback_fields = {}
+        if self.inbox is not None:
+            self._callback_fields = callback_fields(
+                settings.get("callback_mode", "poll"), settings.get("callback_url") or "",
+                self.inbox.token,
+            )
+
+        self.in_flight = {}  # タスク ID -> (キーワード, 種別, 投稿時刻)
+        self.results = {}
+        self._fetching = {}  # 取得中の Future -> タスク ID
+        self._retry_at = {}  # 取得し直すタスク ID -> 時刻
+        self._retry_counts = {}  # タスク ID -> 取得し直した回数
+        self._post_failures = 0  # task_post が続けて失敗した回数
+        self._post_retry_at = None  # 投稿を再開する時刻（task_post の失敗後）
+        self._queue = deque()
+        self._partial_since = None
+        self._started_at = time.time()
+        self._total = 0
+        self._posted = 0
+
+    def _linger(self, queue):
+        """
+        100 件未満のバッチの投稿を待つ残り秒数（待たない場合は None）
+
+        plan が追加するタスク（保留中の日付指定検索）が続いて届く見込みがある間
+        （そのキーワードの allintitle が結果待ちの間）は、batch_linger 秒までバッチが埋まるのを待つ。
+        """
+        if (
+            len(queue) >= self.batch_size or self.plan is None
+            or not self.plan.follow_ups_in_flight
+        ):
+            self._partial_since = None
+            return None
+        now = time.time()
+        if self._partial_since is None:
+            self._partial_since = now
+        remaining = self._partial_since + self.batch_linger - now
+        return remaining if remaining > 0 else None
+
+    def _post_batches(self, queue):
+        """ウィンドウに空きがある限りバッチを投稿する。投稿した件数を返す"""
+        posted = 0
+        if self._post_retry_at is not None:
+            if time.time() < self._post_retry_at:
+                return posted
+            self._post_retry_at = None
+        if self.plan is not None:
+            self.plan.check_limits()
+            self._total -= self.plan.trim(queue)
+        while queue and len(self.in_flight) + min(self.batch_size, len(queue)) <= self.max_in_flight:
+            if self._linger(queue) is not None:
+                break
+            self._partial_since = None
+            batch = self._next_batch(queue)
+            if not batch:
+                break
+            now = time.time()
+            created = []
+            tasks = [build_task(kw, kind, self.settings) for kw, kind in batch]
+            for task in tasks:
+                task.update(self._callback_fields)
+            try:
+                response = self.client.task_post(tasks)
+            except Exception as e:
+                self._post_failed(queue, batch, e)
+                break
+            self._post_failures = 0
+            spent = {}  # 種別 -> [タスク数, 料金]
+            failed = []
+            for task in response:
+                kind, keyword = parse_task_tag(task.get("data", {}).get("tag"))
+                cost = task.get("cost") or 0
+                if cost:
+                    spent.setdefault(kind, [0, 0.0])[1] += cost
+                    TASK_COST.inc(cost, kind=kind)
+                if task.get("status_code") != STATUS_TASK_CREATED:
+                    logger.warning("タスク投稿失敗: %s", task.get("status_message"))
+                    failed.append((keyword, kind))
+                    continue
+                spent.setdefault(kind, [0, 0.0])[0] += 1
+                self.in_flight[task["id"]] = (keyword, kind, now)
+                created.append((task["id"], keyword, kind, now))
+                TASKS_POSTED.inc(kind=kind)
+            TASKS_IN_FLIGHT.inc(len(created))
+            if self.inbox is not None:
+                self.inbox.expect([
+                    (task_id, task_tag(kind, keyword)) for task_id, keyword, kind, _ in created
+                ])
+            if self.journal is not None:
+                self.journal.record_posted(created)
+            posted += len(batch)
+            self._posted += len(created)
+            if self.plan is not None:
+                self.plan.posted([(keyword, kind) for _, keyword, kind, _ in created])
+                self.plan.record_cost(spent)
+            if failed:
+                # 作られなかったタスクは結果を待たず、取得できなかったものとして扱う
+                self._give_up(failed)
+            if self.progress:
+                self.progress("posted", self._posted, self._total)
+            if self.plan is not None:
+                self._total -= self.plan.trim(queue)
+        return posted
+
+    def _post_failed(self, queue, batch, error):
+        """
+        task_post のリクエストが失敗したバッチを queue の先頭に戻し、投稿を再開する時刻を決める
+
+        post_retries 回続けて失敗したら、そのバッチは取得できなかったものとして諦める。
+        """
+        self._post_failures += 1
+        if self._post_failures > self.post_retries:
+            logger.warning("タスク投稿失敗: %d 件の投稿を諦めます (%s)", len(batch), error)
+            self._post_failures = 0
+            self._give_up(batch)
+            return
+        delay = self.fetch_retry_interval * 2 ** (self._post_failures - 1)
+        logger.warning("タスク投稿失敗: %.1f 秒後に %d 件を投稿し直します (%s)", delay, len(batch), error)
+        queue.extendleft(reversed(batch))
+        self._post_retry_at = time.time() + delay
+
+    def _give_up(self, requests_):
+        """投稿できなかった (キーワード, 種別) を、結果を取得できなかったものとして plan に渡す"""
+        self._total -= len(requests_)
+        if self.plan is not None:
+            self.plan.follow_up([(keyword, kind, None) for keyword, kind in requests_])
+
+    def _next_batch(self, queue):
+        """
+        queue の先頭から 1 バッチ分を取り出す
+
+        plan.affordable_tasks（料金の残りで投稿できる数）までに抑え、plan.admissible が
+        新たに投稿してよいキーワード数を制限している場合は、まだ投稿していない
+        キーワードのタスクをその数までにする（残りは queue に残す）。
+        """
+        size = min(self.batch_size, len(queue))
+        if self.plan is None:
+            return [queue.popleft() for _ in range(size)]
+        affordable = self.plan.affordable_tasks()
+        if affordable is not None:
+            size = min(size, affordable)
+        allowance = self.plan.admissible()
+        if allowance is None:
+            return [queue.popleft() for _ in range(size)]
+        if not self.in_flight and self.plan.stop_reason is None:
+            # 結果待ちのタスクが無ければ、見込みがどうであれ次に進む
+            allowance = max(allowance, 1)
+        batch = []
+        admitted = set()
+        while queue and len(batch) < size:
+            keyword, kind = queue[0]
+            if not self.plan.is_started(keyword) and keyword not in admitted:
+                if len(admitted) >= allowance:
+                    break
+                admitted.add(keyword)
+            batch.append(queue.popleft())
+        return batch
+
+    def _fetch(self, task_id):
+        keyword, kind, _ = self.in_flight[task_id]
+        try:
+            return task_id, extract_signal(kind, self.client.task_get(task_id))
+        except Exception as e:
+            logger.warning("結果取得失敗: %s (%s)", task_id, e)
+            return task_id, None
+
+    def _store(self, fetched):
+        """
+        [(タスク ID, 値), ...] を結果に反映し、保存後にジャーナルへ完了を記録する
+
+        値が None のタスクは取得し直す（_retry_later）。回数を使い切ったものはこの実行では
+        諦めるが、ジャーナルには完了を記録しない。
+        """
+        results = []
+        done = []
+        for task_id, value in fetched:
+            if value is None and self._retry_later(task_id):
+                continue
+            keyword, kind, _ = self.in_flight.pop(task_id)
+            self._retry_counts.pop(task_id, None)
+            self.results[(keyword, kind)] = value
+            results.append((keyword, kind, value))
+            if value is not None:
+                done.append(task_id)
+        if not results:
+            return
+        TASKS_IN_FLIGHT.inc(-len(results))
+        # plan には on_results（ランクの確定）より先に取得結果を渡す
+        follow_ups = self.plan.follow_up(results) if self.plan is not None else []
+        stored = [result for result in results if result[2] is not None]
+        if self.on_results is not None and stored:
+            self.on_results(stored)
+        if self.journal is not None:
+            self.journal.record_done(done)
+        if len(done) < len(results):
+            logger.warning("結果を取得できなかったタスク %d 件は次回の実行で回収します",
+                           len(results) - len(done))
+        if follow_ups:
+            self._enqueue_follow_ups(follow_ups)
+
+    def _retry_later(self, task_id):
+        """取得し直す予定を入れる（回数を使い切っていれば False）"""
+        count = self._retry_counts.get(task_id, 0) + 1
+        if count > self.fetch_retries:
+            return False
+        self._retry_counts[task_id] = count
+        self._retry_at[task_id] = time.time() + self.fetch_retry_interval * 2 ** (count - 1)
+        return True
+
+    def _due_retries(self):
+        """取得し直す時刻になったタスク ID"""
+        now = time.time()
+        due = [task_id for task_id, at in self._retry_at.items() if at <= now]
+        for task_id in due:
+            del self._retry_at[task_id]
+        return due
+
+    def _enqueue_follow_ups(self, requests_):
+        """plan が追加したタスクを、同じキーワードの結果がそろうよう次のバッチの先頭に入れる"""
+        pending = {(keyword, kind) for keyword, kind, _ in self.in_flight.values()}
+        requests_ = [r for r in requests_ if r not in self.results and r not in pending]
+        self._queue.extendleft(reversed(requests_))
+        self._total += len(requests_)
+
+    def _collect(self, executor, task_ids):
+        self._store(list(executor.map(self._fetch, task_ids)))
+        if self.progress:
+            self.progress("ready", len(self.results), self._total)
+
+    def _submit(self, executor, task_ids):
+        for task_id in task_ids:
+            future = executor.submit(self._fetch, task_id)
+            self._fetching[future] = task_id
+            if self.inbox is not None:
+                # 取得の完了も通知と同じ待ちで拾う
+                future.add_done_callback(self.inbox.wake)
+
+    def _drain(self, futures):
+        """取得が終わった Future の結果を反映する（キャッシュへの保存はこのスレッドで行う）"""
+        if not futures:
+            return
+        for future in futures:
+            del self._fetching[future]
+        self._store([future.result() for future in futures])
+        if self.progress:
+            self.progress("ready", len(self.results), self._total)
+
+    def _receive(self, executor, events):
+        """完了通知を反映する。pingback は取得を始め、postback の結果はそのまま保存する"""
+        busy = set(self._fetching.values()) | set(self._retry_at)
+        now = time.time()
+        fetch = []
+        received = []
+        for task_id, result in events:
+            if task_id not in self.in_flight or task_id in busy:
+                continue
+            keyword, kind, posted_at = self.in_flight[task_id]
+            TASK_WAIT_SECONDS.observe(now - posted_at)
+            if result is None:
+                fetch.append(task_id)
+            else:
+                received.append((task_id, extract_signal(kind, result)))
+        self._submit(executor, fetch)
+        if received:
+            self._store(received)
+            if self.progress:
+                self.progress("ready", len(self.results), self._total)
+
+    def _wait(self, executor, timeout):
+        """次の確認時刻まで、取得の完了と完了通知を待って反映する"""
+        if self.inbox is not None:
+            self._receive(executor, self.inbox.get(timeout))
+            self._drain([future for future in self._fetching if future.done()])
+        elif self._fetching:
+            done, _ = wait(list(self._fetching), timeout=timeout, return_when=FIRST_COMPLETED)
+            self._drain(done)
+        else:
+            time.sleep(timeout)
+
+    def _waiting(self):
+        """投稿済みで、まだ完了を確認していないタスクの投稿時刻"""
+        busy = set(self._fetching.values()) | set(self._retry_at)
+        return [posted_at for tid, (_, _, posted_at) in self.in_flight.items() if tid not in busy]
+
+    def _expire(self):
+        deadline = time.time() - self.poll_timeout
+        busy = set(self._fetching.values()) | set(self._retry_at)
+        expired = [
+            tid for tid, (_, _, posted_at) in self.in_flight.items()
+            if posted_at < deadline and tid not in busy
+        ]
+        for task_id in expired:
+            # ジャーナル上は未完了のまま残し、次回の実行で回収を試みる
+            keyword, kind, _ = self.in_flight.pop(task_id)
+            if self.plan is not None:
+                self.plan.follow_up([(keyword, kind, None)])
+        TASKS_IN_FLIGHT.inc(-len(expired))
+        if expired:
+            logger.warning("タイムアウトにより %d 件のタスクが未取得です", len(expired))
+
+    def _ready_ids(self):
+        POLL_CYCLES.inc()
+        now = time.time()
+        try:
+            items = self.client.tasks_ready()
+        except Exception as e:
+            # この回は飛ばし、poller のバックオフで次の確認を待つ
+            logger.warning("完了タスクの確認に失敗しました: %s", e)
+            return []
+        busy = set(self._fetching.values()) | set(self._retry_at)
+        ready = [
+            item["id"] for item in items
+            if item.get("id") in self.in_flight and item["id"] not in busy
+        ]
+        for task_id in ready:
+            posted_at = self.in_flight[task_id][2]
+            TASK_WAIT_SECONDS.observe(now - posted_at)
+            # 前回の実行から引き継いだタスクは待ち時間が分からないため分布に加えない
+            if posted_at >= self._started_at:
+                self.poller.observe(posted_at, now)
+        self.poller.polled(now)
+        return ready
+
+    def _reconcile(self, executor):
+        """
+        前回までに投稿して未回収のタスクを取り込み、完了済みのものを回収する
+
+        引き取るのは、ジャーナルのうち投稿した実行のリースが切れたタスク（journal.outstanding）
+        だけ。そのうち tasks_ready に無いものは、取得済みで完了記録だけが漏れた可能性が
+        あるため task_get を直接試す。ジャーナルに記録される前に落ちたタスクも、タグが
+        本ツールの形式なら tasks_ready から拾う。ただし実行中の他の実行がある間は、
+        記録前のそのタスクと区別できないため拾わない。
+        """
+        adoptable = False
+        if self.journal is not None:
+            for task_id, task in self.journal.outstanding.items():
+                self.in_flight[task_id] = (task["keyword"], task["kind"], task["posted_at"])
+            adoptable = not self.journal.has_other_owners()
+
+        try:
+            items = self.client.tasks_ready()
+        except Exception as e:
+            # 引き取ったタスクは下で task_get を直接試す
+            logger.warning("完了タスクの確認に失敗しました: %s", e)
+            items = []
+        adopted = []
+        ready = []
+        for item in items:
+            task_id = item.get("id")
+            if task_id in self.in_flight:
+                ready.append(task_id)
+                continue
+            if not adoptable or self.journal.is_known(task_id):
+                continue
+            kind, keyword = parse_task_tag(item.get("tag"))
+            if kind in (ALLINTITLE, FRESHNESS) and keyword:
+                now = time.time()
+                self.in_flight[task_id] = (keyword, kind, now)
+                adopted.append((task_id, keyword, kind, now))
+                ready.append(task_id)
+        if adopted:
+            self.journal.record_posted(adopted)
+
+        if not self.in_flight:
+            return
+        TASKS_IN_FLIGHT.inc(len(self.in_flight))
+        logger.info(
+            "未回収タスク %d 件を回収します（完了済み %d 件）", len(self.in_flight), len(ready)
+        )
+        self._total += len(self.in_flight)
+        ready_set = set(ready)
+        self._collect(executor, ready)
+
+        unknown = [tid for tid in self.in_flight if tid not in ready_set]
+        self._store([(tid, v) for tid, v in executor.map(self._fetch, unknown) if v is not None])
+
+    def run(self, requests_):
+        """(キーワード, 種別) のリストを処理し、{(キーワード, 種別): 値} を返す"""
+        try:
+            with ThreadPoolExecutor(self.fetch_workers) as executor:
+                self._run(executor, requests_)
+        finally:
+            if self.inbox is not None:
+                self.inbox.close()
+            # 中断した実行で観測した待ち時間も次回の確認間隔に使う
+            self.poller.save()
+        return self.results
+
+    def _run(self, executor, requests_):
+        self._reconcile(executor)
+
+        # 回収済み・回収待ちのものは再投稿しない
+        posted = set(self.results)
+        posted.update((keyword, kind) for keyword, kind, _ in self.in_flight.values())
+        # 回収したタスクに続く追加のタスク（plan）は queue に入っている
+        queue = self._queue
+        posted.update(queue)
+        new = [r for r in requests_ if r not in posted]
+        queue.extend(new)
+        self._total += len(new)
+
+        next_poll = 0.0
+        while queue or self.in_flight:
+            self._post_batches(queue)
+            now = time.time()
+            if now >= next_poll:
+                ready = self._ready_ids()
+                self._submit(executor, ready)
+                if self.inbox is not None:
+                    next_poll = now + self.fallback_interval
+                else:
+                    next_poll = now + self.poller.next_delay(self._waiting(), now, bool(ready))
+                self._expire()
+            self._submit(executor, self._due_retries())
+            if not queue and not self.in_flight:
+                break
+            timeout = next_poll - time.time()
+            if self._retry_at:
+                timeout = min(timeout, min(self._retry_at.values()) - time.time())
+            linger = self._linger(queue) if queue else None
+            if linger is not None:
+                timeout = min(timeout, linger)
+            if queue and self._post_retry_at is not None:
+                timeout = min(timeout, self._post_retry_at - time.time())
+            if not self.in_flight:
+                # 結果待ちが無いのに投稿できなかった場合も、空回りせずに待ってから投稿し直す
+                timeout = min(timeout, self.batch_linger)
+            self._wait(executor, max(timeout, 0))
+
+
+def run_tasks(client, requests_, settings, progress=None, journal=None, on_results=None, poller=None,
+              inbox=None, plan=None):
+    """SerpTaskEngine で (キーワード, 種別) のリストを処理する"""
+    engine = SerpTaskEngine(
+        client, settings, progress, journal=journal, on_results=on_results, poller=poller,
+        inbox=inbox, plan=plan,
+    )
+    return engine.run(requests_)
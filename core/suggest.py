@@ -0,0 +1,156 @@
+"""
+Google サジェスト API からのキーワード候補収集
+"""
+
+import contextlib
+import logging
+import time
+
+from core.metrics import SUGGEST_BYTES, SUGGEST_REQUESTS, SUGGEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SUGGEST_URL = "https://suggestqueries.google.com/complete/search"
+
+HIRAGANA = list(
+    "あいうえおかきくけこさしすせそたちつてとなにぬねの"
+    "はひふへほまみむめもやゆよらりるれろわをん"
+)
+ALPHABET = [chr(c) for c in range(ord("a"), ord("z") + 1)]
+DIGITS = [str(d) for d in range(10)]
+
+SUFFIX_SETS = {
+    "hiragana": HIRAGANA,
+    "alphabet": ALPHABET,
+    "digits": DIGITS,
+}
+
+
+def build_suffixes(names):
+    """設定の suffixes（セット名または任意の文字列）を展開する"""
+    suffixes = []
+    for name in names or []:
+        suffixes.extend(SUFFIX_SETS.get(name, [name]))
+    return suffixes
+
+
+def build_queries(seed, suffixes):
+    """シード単体と「シード + 空白 + サフィックス」のクエリ一覧を返す"""
+    return [seed] + [f"{seed} {suffix}" for suffix in suffixes]
+
+
+def suggest_params(query, settings):
+    return {
+        "client": "firefox",
+        "hl": settings.get("hl", "ja"),
+        "gl": settings.get("gl", "jp"),
+        "ie": "utf-8",
+        "oe": "utf-8",
+        "q": query,
+    }
+
+
+def parse_suggest_response(data):
+    """["クエリ", ["候補1", "候補2", ...], ...] 形式のレスポンスから候補を取り出す"""
+    if isinstance(data, list) and len(data) > 1 and isinstance(data[1], list):
+        return [s for s in data[1] if isinstance(s, str)]
+    return []
+
+
+def fetch_suggestions(query, settings, session=None):
+    """1 クエリ分のサジェストを取得する"""
+    import requests
+
+    http = session or requests
+    started = time.perf_counter()
+    try:
+        resp = http.get(
+            settings.get("url") or SUGGEST_URL,
+            params=suggest_params(query, settings),
+            timeout=settings.get("timeout", 10),
+        )
+        resp.raise_for_status()
+    except Exception:
+        SUGGEST_REQUESTS.inc(result="error")
+        raise
+    finally:
+        SUGGEST_SECONDS.observe(time.perf_counter() - started)
+    SUGGEST_REQUESTS.inc(result="ok")
+    SUGGEST_BYTES.inc(len(resp.content))
+    return parse_suggest_response(resp.json())
+
+
+def merge_candidates(seeds, results):
+    """
+    (シード, 候補リスト) の並びから重複を除いた候補リストを作る
+
+    戻り値は {"keyword", "seed", "depth"} の dict のリスト（出現順）。
+    depth はシード自体が 0、サジェストで得た候補が 1。
+    """
+    seen = set()
+    candidates = []
+    for seed in seeds:
+        if seed not in seen:
+            seen.add(seed)
+            candidates.append({"keyword": seed, "seed": seed, "depth": 0})
+    for seed, suggestions in results:
+        for keyword in suggestions:
+            if keyword not in seen:
+                seen.add(keyword)
+                candidates.append({"keyword": keyword, "seed": seed, "depth": 1})
+    return candidates
+
+
+def collect_sequential(queries, settings, cache=None, session=None, progress=None):
+    """クエリを 1 件ずつ取得し、(クエリ, 候補リスト) のリストを返す"""
+    import requests
+
+    interval = settings.get("interval", 0.5)
+    cached = cache.get_many("suggest", queries) if cache is not None else {}
+    results = []
+    with contextlib.ExitStack() as stack:
+        if session is None:
+            session = stack.enter_context(requests.Session())
+        for i, query in enumerate(queries, 1):
+            suggestions = cached.get(query)
+            if suggestions is None:
+                try:
+                    suggestions = fetch_suggestions(query, settings, session)
+                except Exception as e:
+                    logger.warning("サジェスト取得失敗: %s (%s)", query, e)
+                    suggestions = []
+                else:
+                    if cache is not None:
+                        cache.set("suggest", query, suggestions)
+                    time.sleep(interval)
+            results.append((query, suggestions))
+
+            if progress:
+                progress("suggest", i, len(queries))
+    return results
+
+
+def collect_candidates(seeds, settings, cache=None, progress=None, state_dir=None):
+    """
+    シードごとにサジェストを取得し、キーワード候補を返す
+
+    settings の max_depth が 2 以上なら得られた候補をさらに再帰的に展開する
+    （state_dir に途中状態を保存し、中断後は続きから再開する。core.frontier）。
+    engine が "async" なら並列取得（core.suggest_async）、それ以外は 1 件ずつ順次取得する。
+    """
+    if settings.get("max_depth", 1) > 1 and state_dir:
+        from core.frontier import collect_candidates_recursive
+
+        return collect_candidates_recursive(
+            seeds, settings, state_dir, cache=cache, progress=progress
+        )
+
+    if settings.get("engine") == "async":
+        from core.suggest_async import collect_candidates_async
+
+        return collect_candidates_async(seeds, settings, cache=cache, progress=progress)
+
+    suffixes = build_suffixes(settings.get("suffixes"))
+    queries = [(seed, q) for seed in seeds for q in build_queries(seed, suffixes)]
+    results = dict(collect_sequential([q for _, q in queries], settings, cache, progress=progress))
+    return merge_candidates(seeds, [(seed, results[q]) for seed, q in queries])
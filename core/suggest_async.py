@@ -0,0 +1,139 @@
+"""
+asyncio による並列サジェスト収集
+
+接続プール付きの requests.Session（keep-alive）をスレッドプール上で使い回し、
+同時実行数の上限とホストごとのトークンバケットでリクエストレートを制御する。
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from core.suggest import SUGGEST_URL, fetch_suggestions
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    rate 件/秒で補充され、最大 burst 件まで貯まるトークンバケット
+
+    残量の確認と消費の間に await を挟まないため、ロック無しで同一ループ内の
+    コルーチン間で共有できる（イベントループをまたいでも状態を引き継げる）。
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AsyncSuggestCrawler:
+    """
+    サジェスト API を並列に叩くクローラ
+
+    concurrency: 同時に実行中のリクエスト数の上限
+    rate / burst: ホストごとのトークンバケット（件/秒、最大バースト）
+
+    with ブロックの間は接続プールとスレッドプールを保持し、crawl を
+    複数回呼んでも keep-alive 接続を使い回す。
+    """
+
+    def __init__(self, settings, cache=None):
+        self.settings = settings
+        self.cache = cache
+        self.concurrency = settings.get("concurrency", 8)
+        self.rate = settings.get("rate", 5.0)
+        self.burst = settings.get("burst")
+        self.retries = settings.get("retries", 2)
+        self._buckets = {}
+        self._session = None
+        self._executor = None
+
+    def __enter__(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(self.concurrency)
+        return self
+
+    def __exit__(self, *exc):
+        self._executor.shutdown()
+        self._session.close()
+        self._session = self._executor = None
+
+    def _bucket(self, url):
+        host = urlparse(url).netloc
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    async def _fetch(self, query, semaphore):
+        loop = asyncio.get_running_loop()
+        bucket = self._bucket(self.settings.get("url") or SUGGEST_URL)
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            async with semaphore:
+                try:
+                    return await loop.run_in_executor(
+                        self._executor, fetch_suggestions, query, self.settings, self._session
+                    )
+                except Exception as e:
+                    if attempt == self.retries:
+                        logger.warning("サジェスト取得失敗: %s (%s)", query, e)
+                        return None
+            await asyncio.sleep(2 ** attempt)
+
+    async def crawl(self, queries, progress=None):
+        """クエリ一覧のサジェストを並列に取得し、{クエリ: 候補リスト} を返す"""
+        if self._session is None:
+            with self:
+                return await self.crawl(queries, progress)
+
+        results = self.cache.get_many("suggest", queries) if self.cache is not None else {}
+        pending = [q for q in queries if q not in results]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        done = len(results)
+
+        async def run(query):
+            return query, await self._fetch(query, semaphore)
+
+        for future in asyncio.as_completed([run(q) for q in pending]):
+            query, suggestions = await future
+            if suggestions is not None and self.cache is not None:
+                self.cache.set("suggest", query, suggestions)
+            results[query] = suggestions or []
+            done += 1
+            if progress:
+                progress("suggest", done, len(queries))
+
+        return results
+
+
+def collect_candidates_async(seeds, settings, cache=None, progress=None):
+    """collect_candidates と同じ形式の候補リストを並列取得で作る"""
+    from core.suggest import build_queries, build_suffixes, merge_candidates
+
+    suffixes = build_suffixes(settings.get("suffixes"))
+    queries = [(seed, q) for seed in seeds for q in build_queries(seed, suffixes)]
+    crawler = AsyncSuggestCrawler(settings, cache=cache)
+    results = asyncio.run(crawler.crawl(list(dict.fromkeys(q for _, q in queries)), progress))
+    return merge_candidates(seeds, [(seed, results.get(q, [])) for seed, q in queries])
@@ -0,0 +1,178 @@
+"""
+DataForSEO に投稿したタスクのジャーナル
+
+投稿したタスク ID・キーワード・種別・投稿時刻を cache/dataforseo/tasks.sqlite3 に記録し、
+結果をキャッシュへ保存した時点で完了として削除する。プロセスが task_post と task_get の
+間で落ちても、次回起動時に未完了のタスクを回収でき、同じタスクを再投稿せずに済む。
+
+jobs のワーカーや GUI と別プロセスの実行など、複数の実行が同じジャーナルを使う。
+各タスクには投稿した実行（owner）を記録し、実行中の owner はデーモンスレッドで
+リース（heartbeat_at）を更新し続ける。新しい実行が引き取る（outstanding に載せる）のは、
+owner のリースが切れたタスク（落ちたか、終了した実行のもの）だけ。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from core.config import CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = os.path.join(CACHE_DIR, "dataforseo", "tasks.sqlite3")
+
+# DataForSEO が task_get で結果を返す期間（日）
+RETENTION_DAYS = 30
+# リースの有効期間（秒）。この間に更新されなければ owner は終了したとみなす
+LEASE_SECONDS = 60
+
+
+class TaskJournal:
+    def __init__(self, path=DEFAULT_PATH, retention_days=RETENTION_DAYS, lease=LEASE_SECONDS,
+                 legacy_path=None):
+        self.path = path
+        self.retention = retention_days * 86400
+        self.lease = lease
+        self.owner = uuid.uuid4().hex
+        self.outstanding = {}  # 引き取ったタスク ID -> {"keyword", "kind", "posted_at"}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                keyword TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                posted_at REAL NOT NULL,
+                owner TEXT
+            );
+            CREATE INDEX IF NOT EXISTS tasks_owner ON tasks (owner);
+            CREATE TABLE IF NOT EXISTS owners (
+                owner TEXT PRIMARY KEY,
+                heartbeat_at REAL NOT NULL
+            );
+            """
+        )
+        self._closed = threading.Event()
+        self._renew()
+        # 以前の追記型ジャーナル（見つかれば取り込んで削除する）
+        self._import_legacy(legacy_path or os.path.join(os.path.dirname(path), "tasks.jsonl"))
+        self._claim()
+        threading.Thread(target=self._heartbeat, name="task-journal", daemon=True).start()
+
+    def _renew(self):
+        with self._lock:
+            if self._closed.is_set():
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO owners VALUES (?, ?)", (self.owner, time.time())
+            )
+
+    def _heartbeat(self):
+        while not self._closed.wait(self.lease / 3):
+            try:
+                self._renew()
+            except sqlite3.Error as e:
+                logger.warning("タスクジャーナルのリースを更新できませんでした: %s", e)
+
+    def _import_legacy(self, path):
+        """以前の tasks.jsonl の未完了のタスクを owner なしで取り込む"""
+        if not os.path.exists(path):
+            return
+        tasks = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                if event.get("op") == "post":
+                    tasks[event["id"]] = (event["keyword"], event["kind"], event["posted_at"])
+                elif event.get("op") == "done":
+                    tasks.pop(event["id"], None)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, ?, NULL)",
+                [(task_id, *task) for task_id, task in tasks.items()],
+            )
+        os.remove(path)
+
+    def _claim(self):
+        """リースの切れた owner のタスクを引き取り、outstanding に載せる"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = self._conn.execute(
+                    "DELETE FROM tasks WHERE posted_at < ?", (now - self.retention,)
+                ).rowcount
+                self._conn.execute("DELETE FROM owners WHERE heartbeat_at < ?", (now - self.lease,))
+                self._conn.execute(
+                    "UPDATE tasks SET owner = ?"
+                    " WHERE owner IS NULL OR owner NOT IN (SELECT owner FROM owners)",
+                    (self.owner,),
+                )
+                rows = self._conn.execute(
+                    "SELECT id, keyword, kind, posted_at FROM tasks WHERE owner = ?", (self.owner,)
+                ).fetchall()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if expired:
+            logger.warning("保存期間を過ぎた未回収タスク %d 件をジャーナルから除外します", expired)
+        self.outstanding = {
+            task_id: {"keyword": keyword, "kind": kind, "posted_at": posted_at}
+            for task_id, keyword, kind, posted_at in rows
+        }
+
+    def has_other_owners(self):
+        """リースが有効な他の実行があるか（tasks_ready からタスクを拾ってよいかの判断に使う）"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM owners WHERE owner != ? AND heartbeat_at >= ? LIMIT 1",
+                (self.owner, time.time() - self.lease),
+            ).fetchone()
+        return row is not None
+
+    def is_known(self, task_id):
+        """ジャーナルに記録されているタスクか（他の実行のものを含む）"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM tasks WHERE id = ?", (task_id,)
+            ).fetchone() is not None
+
+    def record_posted(self, tasks):
+        """投稿したタスク [(ID, キーワード, 種別, 投稿時刻), ...] を記録する"""
+        for task_id, keyword, kind, posted_at in tasks:
+            self.outstanding[task_id] = {"keyword": keyword, "kind": kind, "posted_at": posted_at}
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?)",
+                [(task_id, keyword, kind, posted_at, self.owner)
+                 for task_id, keyword, kind, posted_at in tasks],
+            )
+
+    def record_done(self, task_ids):
+        """結果を保存したタスクを完了として削除する"""
+        task_ids = [task_id for task_id in task_ids if self.outstanding.pop(task_id, None) is not None]
+        if not task_ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM tasks WHERE id = ?", [(tid,) for tid in task_ids])
+
+    def close(self):
+        """リースを手放す（残ったタスクは次の実行がすぐに引き取れる）"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        with self._lock:
+            self._conn.execute("DELETE FROM owners WHERE owner = ?", (self.owner,))
+            self._conn.close()
@@ -0,0 +1,178 @@
+"""
+再帰展開で使う「訪問済み」集合
+
+深い再帰展開ではクエリ・キーワードが数百万件になり、日本語文字列の Python の set は
+1 件あたり数百バイトを使う。BloomVisitedSet はメモリ上には Bloom フィルタ
+（bytearray、または cache/ 以下のファイルを mmap したもの）だけを持ち、
+フィルタが「含まれているかもしれない」と答えた場合にだけ、ディスク上の SQLite に
+保存した値で正確に確認する。フィルタが「含まれない」と答えた値はその場で新規と確定する。
+
+どちらの実装も add（新規なら True）/ in / len / close を持つ。
+"""
+
+import hashlib
+import logging
+import math
+import mmap
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    偽陽性率 error_rate で capacity 件を保持する Bloom フィルタ
+
+    path を渡すとビット列をそのファイルに mmap する（Python のヒープを使わず、
+    OS のページキャッシュに任せる）。ファイルは開くたびに作り直す。
+    """
+
+    def __init__(self, capacity, error_rate=0.001, path=None):
+        capacity = max(1, int(capacity))
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        nbytes = (self.size + 7) // 8
+        self.path = path
+        self._file = None
+        if path:
+            self._file = open(path, "w+b")
+            self._file.truncate(nbytes)
+            self.bits = mmap.mmap(self._file.fileno(), nbytes)
+        else:
+            self.bits = bytearray(nbytes)
+
+    def _positions(self, item):
+        # 128bit のダイジェストから 2 つのハッシュを取り、k 個の位置を作る（double hashing）
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """item を加え、フィルタに確実に無かった（いずれかのビットが 0 だった）場合は True"""
+        bits = self.bits
+        added = False
+        for pos in self._positions(item):
+            byte, mask = pos >> 3, 1 << (pos & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                added = True
+        return added
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+    def close(self):
+        if self._file is not None:
+            self.bits.close()
+            self._file.close()
+            self._file = None
+
+
+class ExactVisitedSet:
+    """Python の set による訪問済み集合（件数が少ない場合の既定）"""
+
+    def __init__(self):
+        self._items = set()
+
+    def add(self, item):
+        if item in self._items:
+            return False
+        self._items.add(item)
+        return True
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        self._items = set()
+
+
+class BloomVisitedSet:
+    """
+    Bloom フィルタ + SQLite による訪問済み集合
+
+    path + ".sqlite3" に正確な値を、use_mmap=True なら path + ".bloom" にフィルタを置く。
+    どちらも開くたびに作り直す一時ファイルで、close で削除する。
+    """
+
+    def __init__(self, path, capacity, error_rate=0.001, use_mmap=True):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.bloom = BloomFilter(capacity, error_rate, f"{path}.bloom" if use_mmap else None)
+        self.db_path = f"{path}.sqlite3"
+        if os.path.exists(self.db_path):
+            os.remove(self.db_path)
+        # 中断時には作り直すため、ジャーナルも同期も不要
+        self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=OFF")
+        self._conn.execute("PRAGMA synchronous=OFF")
+        self._conn.execute("CREATE TABLE visited (item TEXT PRIMARY KEY) WITHOUT ROWID")
+        self._conn.execute("BEGIN")
+        self._count = 0
+        # フィルタが陽性を返して SQLite で確認した回数と、そのうち実際は未訪問だった回数
+        self.confirmations = 0
+        self.false_positives = 0
+        self._warned = False
+
+    def add(self, item):
+        if self.bloom.add(item):
+            self._conn.execute("INSERT INTO visited VALUES (?)", (item,))
+        else:
+            self.confirmations += 1
+            inserted = self._conn.execute("INSERT OR IGNORE INTO visited VALUES (?)", (item,)).rowcount
+            if not inserted:
+                return False
+            self.false_positives += 1
+        self._count += 1
+        if self._count > self.bloom.capacity and not self._warned:
+            # 正しさは SQLite での確認で保たれるが、偽陽性が増えて遅くなる
+            logger.warning(
+                "訪問済み集合が想定件数（%d 件）を超えました。suggest.visited_capacity を増やしてください",
+                self.bloom.capacity,
+            )
+            self._warned = True
+        return True
+
+    def __contains__(self, item):
+        if item not in self.bloom:
+            return False
+        self.confirmations += 1
+        return self._conn.execute(
+            "SELECT 1 FROM visited WHERE item = ?", (item,)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        if self._conn is None:
+            return
+        self._conn.close()
+        self._conn = None
+        self.bloom.close()
+        for path in (self.db_path, self.bloom.path):
+            if path and os.path.exists(path):
+                os.remove(path)
+
+
+def open_visited(settings, path, capacity_scale=1):
+    """
+    suggest.visited の設定に応じた訪問済み集合を返す
+
+    "set"（既定）なら ExactVisitedSet、"bloom" なら path に一時ファイルを置く
+    BloomVisitedSet。capacity_scale は suggest.visited_capacity（キーワード数）に掛ける倍率。
+    """
+    if settings.get("visited", "set") != "bloom":
+        return ExactVisitedSet()
+    return BloomVisitedSet(
+        path,
+        capacity=settings.get("visited_capacity", 1000000) * capacity_scale,
+        error_rate=settings.get("visited_error_rate", 0.001),
+        use_mmap=settings.get("visited_mmap", True),
+    )
@@ -1,16 +1,261 @@
 """
 Demand Miner Tool - エントリーポイント
 SEOキーワード需要掘削ツール
+
+サブコマンドなしで GUI を起動し、`run` サブコマンドで GUI を介さずに分析を実行する。
+Gradio の読み込みには時間がかかるため、各モジュールは必要になった時点で import する。
 """
 
 import argparse
+import logging
 import sys
 import os
+import time
 
 # プロジェクトルートをパスに追加
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from gui.gradio_app import create_interface
+# キャッシュの種別（core.cache.KINDS と同じ。argparse の選択肢用に import せず持つ）
+CACHE_KINDS = ["suggest", "allintitle", "freshness"]
+
+
+def launch_gui(args):
+    from core.config import load_settings
+    from core.jobs import WorkerPool, get_job_queue
+    from gui.gradio_app import create_interface
+
+    # 長時間の分析はジョブキュー経由でワーカーが実行する（GUI は投入と状態確認のみ）
+    workers = WorkerPool(get_job_queue(), workers=load_settings()["jobs"]["workers"]).start()
+
+    demo = create_interface(force_no_cache=args.no_cache)
+    try:
+        app, _, _ = demo.launch(
+            server_name="0.0.0.0",
+            server_port=args.port,
+            share=args.share,
+            inbrowser=True,
+            prevent_thread_lock=True,
+        )
+        mount_metrics(app)
+        mount_callbacks(app)
+        demo.block_thread()
+    finally:
+        workers.stop(timeout=10)
+
+
+def mount_metrics(app):
+    """Gradio のサーバー（FastAPI）に Prometheus 形式の /metrics を追加する"""
+    from fastapi.responses import Response
+
+    from core.metrics import CONTENT_TYPE, render
+
+    app.add_api_route(
+        "/metrics",
+        lambda: Response(render(), media_type=CONTENT_TYPE),
+        methods=["GET"],
+        include_in_schema=False,
+    )
+
+
+def mount_callbacks(app):
+    """Gradio のサーバー（FastAPI）に DataForSEO の pingback / postback の受け口を追加する"""
+    from fastapi import Request
+    from fastapi.responses import Response
+
+    from core.callback import PINGBACK_PATH, POSTBACK_PATH, get_receiver
+
+    receiver = get_receiver()
+
+    def pingback(request: Request):
+        if not receiver.authorize(request.query_params.get("token")):
+            return Response(status_code=403)
+        receiver.pingback(request.query_params.get("id"), request.query_params.get("tag"))
+        return Response(status_code=200)
+
+    async def postback(request: Request):
+        if not receiver.authorize(request.query_params.get("token")):
+            return Response(status_code=403)
+        try:
+            receiver.postback(await request.body())
+        except (OSError, ValueError):
+            return Response(status_code=400)
+        return Response(status_code=200)
+
+    app.add_api_route(PINGBACK_PATH, pingback, methods=["GET"], include_in_schema=False)
+    app.add_api_route(POSTBACK_PATH, postback, methods=["POST"], include_in_schema=False)
+    receiver.listening = True
+
+
+def start_callbacks(args):
+    if getattr(args, "callback_port", None):
+        from core.callback import start_callback_server
+
+        start_callback_server(args.callback_port)
+        logging.getLogger(__name__).info("完了通知の受け口を起動しました: ポート %d", args.callback_port)
+
+
+def start_metrics(args):
+    if getattr(args, "metrics_port", None):
+        from core.metrics import start_metrics_server
+
+        start_metrics_server(args.metrics_port)
+        logging.getLogger(__name__).info("/metrics を公開しました: ポート %d", args.metrics_port)
+
+
+def run_headless(args):
+    from core.config import load_api_keys, load_profile, read_seeds
+    from core.export import ResultStreamWriter
+    from core.pipeline import run_pipeline
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+    start_metrics(args)
+    start_callbacks(args)
+    profile = load_profile(args.profile)
+    if args.suggest_engine:
+        profile["settings"]["suggest"]["engine"] = args.suggest_engine
+    if args.stop_after_s is not None:
+        profile["settings"]["dataforseo"]["stop_after_s"] = args.stop_after_s
+    if args.max_cost is not None:
+        profile["settings"]["dataforseo"]["max_cost"] = args.max_cost
+    seeds = read_seeds(args.seeds) if args.seeds else None
+    if args.dry_run:
+        print_estimate(profile, seeds, args)
+        return
+    # ランクが確定した行から順に書き出す（途中で終了しても書き出し済みの行は残る）
+    with ResultStreamWriter(args.out, profile["settings"]["export"]["row_group_size"]) as writer:
+        table = run_pipeline(
+            profile,
+            load_api_keys(),
+            seeds=seeds,
+            no_cache=args.no_cache,
+            resume=not args.restart,
+            refresh=args.refresh or (),
+            on_rows=writer.write_rows,
+        )
+        writer.finish(table)
+    logging.getLogger(__name__).info("%d 件を出力しました: %s", len(table), ", ".join(args.out))
+
+
+def print_estimate(profile, seeds, args):
+    """DataForSEO に投稿せずに、キャッシュの利用件数と有料のタスク数・料金の見積もりを表示する"""
+    from core.pipeline import estimate_pipeline
+
+    estimate = estimate_pipeline(
+        profile,
+        seeds=seeds,
+        no_cache=args.no_cache,
+        resume=not args.restart,
+        refresh=args.refresh or (),
+    )
+    print(f"キーワード: {estimate['keywords']} 件（問い合わせ対象 {estimate['queried']} 件）")
+    for kind, tasks in estimate["tasks"].items():
+        print(f"{kind}: キャッシュ {estimate['cached'][kind]} 件 / 有料タスク {tasks} 件")
+    if estimate["freshness_skipped"]:
+        print(f"freshness: ランク C に決まるため省略 {estimate['freshness_skipped']} 件")
+    print(f"料金の見積もり: 約 {estimate['cost']:.4f} USD")
+    for scope, status in estimate["budget"].items():
+        limits = ", ".join(
+            f"{level} {status[level]}" for level in ("soft", "hard") if status.get(level) is not None
+        )
+        print(f"今日の料金（{scope}）: {status['spent']:.4f} USD" + (f"（上限 {limits}）" if limits else ""))
+
+
+def run_budget_command(args):
+    from core.budget import SpendLedger
+
+    since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (args.days - 1) * 86400))
+    ledger = SpendLedger()
+    try:
+        rows = ledger.rows(since=since, profile=args.profile)
+    finally:
+        ledger.close()
+    for row in rows:
+        print(f"{row['day']}  {row['profile']:<20}  {row['kind']:<10}  {row['tasks']:>8}  {row['cost']:>10.4f}")
+    print(f"合計: {sum(row['tasks'] for row in rows)} タスク / {sum(row['cost'] for row in rows):.4f} USD")
+
+
+def run_cache_command(args):
+    from core.cache import migrate_file_cache, open_cache
+    from core.config import load_settings
+
+    cache = open_cache(load_settings())
+    try:
+        if args.cache_command == "migrate":
+            counts = migrate_file_cache(cache)
+            for kind, count in counts.items():
+                print(f"{kind}: {count} 件を移行しました")
+        elif args.cache_command == "invalidate":
+            filters = (args.kind, args.profile, args.older_than, args.pattern)
+            if not args.all and not any(f is not None for f in filters):
+                sys.exit("条件（--kind / --profile / --older-than / --pattern）か --all を指定してください")
+            deleted = cache.invalidate(
+                kinds=args.kind,
+                profile=args.profile,
+                older_than=None if args.older_than is None else args.older_than * 86400,
+                pattern=args.pattern,
+            )
+            print(f"{deleted} 件のキャッシュを削除しました")
+        elif args.cache_command == "renormalize":
+            changed = cache.renormalize()
+            print(f"{changed} 件のキーを付け直しました")
+    finally:
+        cache.close()
+
+
+def run_jobs_command(args):
+    from core.jobs import JobQueue, WorkerPool
+
+    queue = JobQueue()
+    try:
+        if args.jobs_command == "submit":
+            params = {"no_cache": args.no_cache}
+            if args.out:
+                params["out"] = args.out
+            if args.refresh:
+                params["refresh"] = args.refresh
+            print(queue.submit(args.profile, params, priority=args.priority))
+        elif args.jobs_command == "list":
+            for job in queue.list(status=args.status, limit=args.limit):
+                ranked = job["progress"].get("ranked")
+                progress = f"{ranked[0]}/{ranked[1]}" if ranked else "-"
+                print(
+                    f"{job['id']}  {job['status']:<9}  {job['priority']:>3}  "
+                    f"{progress:>11}  {job['profile']}"
+                )
+        elif args.jobs_command == "cancel":
+            queue.cancel(args.job_id)
+        elif args.jobs_command == "worker":
+            logging.basicConfig(
+                level=logging.INFO,
+                format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+            )
+            start_metrics(args)
+            start_callbacks(args)
+            pool = WorkerPool(queue, workers=args.workers).start()
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pool.stop()
+    finally:
+        queue.close()
+
+
+def run_diff(args):
+    from core.config import load_settings
+    from core.diff import write_diff
+    from core.normalize import KeywordNormalizer
+
+    summary = write_diff(
+        args.old, args.new, args.out, min_delta=args.min_delta,
+        normalizer=KeywordNormalizer.from_settings(load_settings()),
+    )
+    for change, count in summary.items():
+        print(f"{change}: {count}")
 
 
 def main():
@@ -33,15 +278,157 @@ def main():
         default=7860,
         help="サーバーのポート番号（デフォルト: 7860）",
     )
-    args = parser.parse_args()
 
-    demo = create_interface(force_no_cache=args.no_cache)
-    demo.launch(
-        server_name="0.0.0.0",
-        server_port=args.port,
-        share=args.share,
-        inbrowser=True,
+    subparsers = parser.add_subparsers(dest="command")
+    run_parser = subparsers.add_parser(
+        "run",
+        help="GUI を起動せずに分析を実行（cron などからの一括実行用）",
+    )
+    run_parser.add_argument(
+        "--profile",
+        required=True,
+        help="プロファイル名（profiles/<name>.yaml）または YAML ファイルのパス",
+    )
+    run_parser.add_argument(
+        "--seeds",
+        help="シードキーワードのファイル（1 行 1 キーワード。省略時はプロファイルの seeds）",
+    )
+    run_parser.add_argument(
+        "--out",
+        action="append",
+        help="結果の出力先（.csv / .parquet / .arrow。複数指定可。--dry-run 以外では必須）",
+    )
+    run_parser.add_argument(
+        "--suggest-engine",
+        choices=["sequential", "async"],
+        help="サジェスト収集の方式（省略時は settings.yaml の suggest.engine）",
     )
+    run_parser.add_argument(
+        "--stop-after-s",
+        type=int,
+        metavar="N",
+        help="ランク S のキーワードが N 件見つかったら残りのキーワードを問い合わせずに終える",
+    )
+    run_parser.add_argument(
+        "--max-cost",
+        type=float,
+        metavar="USD",
+        help="この実行で投稿する DataForSEO タスクの料金の上限",
+    )
+    run_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="DataForSEO に投稿せずに、キャッシュの利用件数と有料のタスク数・料金の見積もりを表示する",
+    )
+    run_parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="中断した再帰展開の続きから再開せず、最初からやり直す",
+    )
+    run_parser.add_argument(
+        "--refresh",
+        action="append",
+        choices=CACHE_KINDS,
+        help="指定した種別だけキャッシュを無視して再取得（複数指定可）",
+    )
+    run_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=argparse.SUPPRESS,
+        help="キャッシュを無視して強制的に全キーワードを再取得",
+    )
+    run_parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="実行中の計測値を Prometheus 形式で公開するポート（/metrics）",
+    )
+    run_parser.add_argument(
+        "--callback-port",
+        type=int,
+        help="DataForSEO の完了通知（pingback / postback）を受けるポート（settings.yaml の callback_mode と併用）",
+    )
+
+    cache_parser = subparsers.add_parser("cache", help="キャッシュの管理")
+    cache_subparsers = cache_parser.add_subparsers(dest="cache_command", required=True)
+    cache_subparsers.add_parser(
+        "migrate",
+        help="旧形式のファイルキャッシュ（cache/<種別>/*.json）を SQLite に移行",
+    )
+    cache_subparsers.add_parser(
+        "renormalize",
+        help="保存済みのキーを現在の正規化規則（settings.yaml の normalize.rules）で付け直す",
+    )
+    invalidate_parser = cache_subparsers.add_parser(
+        "invalidate",
+        help="条件に合うキャッシュを削除（次回の実行で再取得される）",
+    )
+    invalidate_parser.add_argument(
+        "--kind",
+        action="append",
+        choices=CACHE_KINDS,
+        help="対象の種別（複数指定可）",
+    )
+    invalidate_parser.add_argument("--profile", help="このプロファイルで取得したキーワードに限定")
+    invalidate_parser.add_argument(
+        "--older-than",
+        type=float,
+        metavar="DAYS",
+        help="指定日数より前に取得したものに限定",
+    )
+    invalidate_parser.add_argument(
+        "--pattern",
+        help="キーワードのワイルドカード（例: '*カフェ*'）",
+    )
+    invalidate_parser.add_argument("--all", action="store_true", help="すべてのキャッシュを削除")
+
+    jobs_parser = subparsers.add_parser("jobs", help="バックグラウンドジョブの管理")
+    jobs_subparsers = jobs_parser.add_subparsers(dest="jobs_command", required=True)
+    submit_parser = jobs_subparsers.add_parser("submit", help="分析ジョブを投入（ジョブ ID を出力）")
+    submit_parser.add_argument("--profile", required=True, help="プロファイル名または YAML ファイルのパス")
+    submit_parser.add_argument("--out", help="結果の出力先（省略時は outputs/jobs/<ジョブ ID>.csv）")
+    submit_parser.add_argument("--priority", type=int, default=0, help="優先度（大きいほど先に実行）")
+    submit_parser.add_argument("--refresh", action="append", choices=CACHE_KINDS)
+    submit_parser.add_argument("--no-cache", action="store_true", default=argparse.SUPPRESS)
+    list_parser = jobs_subparsers.add_parser("list", help="ジョブの一覧")
+    list_parser.add_argument("--status", choices=["queued", "running", "done", "failed", "cancelled"])
+    list_parser.add_argument("--limit", type=int, default=50)
+    cancel_parser = jobs_subparsers.add_parser("cancel", help="ジョブをキャンセル")
+    cancel_parser.add_argument("job_id")
+    worker_parser = jobs_subparsers.add_parser("worker", help="GUI を起動せずにワーカーだけを実行")
+    worker_parser.add_argument("--workers", type=int, default=2, help="並列に実行するジョブ数")
+    worker_parser.add_argument("--metrics-port", type=int, help="/metrics を公開するポート")
+    worker_parser.add_argument("--callback-port", type=int, help="DataForSEO の完了通知を受けるポート")
+
+    budget_parser = subparsers.add_parser("budget", help="DataForSEO の料金の記録を日付・プロファイル・種別ごとに表示")
+    budget_parser.add_argument("--days", type=int, default=7, help="表示する日数（デフォルト: 7）")
+    budget_parser.add_argument("--profile", help="このプロファイルに限定")
+
+    diff_parser = subparsers.add_parser("diff", help="2 回分の結果ファイルを比較")
+    diff_parser.add_argument("old", help="比較元の結果ファイル（.csv / .parquet / .arrow）")
+    diff_parser.add_argument("new", help="比較先の結果ファイル")
+    diff_parser.add_argument("--out", required=True, help="差分の出力先（CSV）")
+    diff_parser.add_argument(
+        "--min-delta",
+        type=int,
+        default=1,
+        help="ランクが同じ場合に変化として出力する allintitle 件数の差（デフォルト: 1）",
+    )
+    args = parser.parse_args()
+
+    if args.command == "run":
+        if not args.out and not args.dry_run:
+            run_parser.error("--out を指定してください")
+        run_headless(args)
+    elif args.command == "cache":
+        run_cache_command(args)
+    elif args.command == "jobs":
+        run_jobs_command(args)
+    elif args.command == "budget":
+        run_budget_command(args)
+    elif args.command == "diff":
+        run_diff(args)
+    else:
+        launch_gui(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,14 @@
+"""
+テスト共通の設定
+
+core の各モジュールは import 時に CACHE_DIR（キャッシュ・ジャーナルの置き場所）を決めるため、
+本番の cache/ に触れないよう、import より前に一時ディレクトリへ差し替える。
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.environ["DEMAND_MINER_CACHE_DIR"] = tempfile.mkdtemp(prefix="demand-miner-test-")
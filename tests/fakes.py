@@ -0,0 +1,134 @@
+"""
+テスト用の DataForSEO クライアント（プロセス内で完結する）
+
+DataForSEOClient と同じ task_post / tasks_ready / task_get を持つ。allintitle の件数と
+日付指定検索の結果の件数はキーワードごとに指定でき、指定が無ければ allintitle は 5 件、
+日付指定検索は 0 件（直近の競合記事なし）を返す。
+
+タスクに pingback_url / postback_url があれば、完了時刻にその URL へ完了通知を送る
+（drop_callback(タスク ID) が True のタスクは送らない）。postback で結果を届けたタスクは
+tasks_ready に出さない。
+"""
+
+import gzip
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from urllib.parse import quote
+
+from core.dataforseo import STATUS_TASK_CREATED, parse_task_tag
+
+COST = 0.0006
+
+
+class FakeClient:
+    def __init__(self, allintitle=None, recent=None, ready_delay=0.0, fail_get=None,
+                 drop_callback=None, fail_ready=None, fail_post=None, reject=None):
+        self.allintitle = dict(allintitle or {})
+        self.recent = dict(recent or {})
+        self.ready_delay = ready_delay
+        # fail_get(タスク ID, 何回目の task_get か) が True なら task_get で例外を送出する
+        self.fail_get = fail_get
+        # fail_ready(何回目の tasks_ready か) / fail_post(何回目の task_post か) が True なら
+        # そのリクエスト全体が失敗する（失敗した task_post ではタスクを作らない）
+        self.fail_ready = fail_ready
+        self.fail_post = fail_post
+        self.post_calls = 0
+        # reject(タグ) が True のタスクは task_post のレスポンスで失敗（40501）を返す
+        self.reject = reject
+        self.drop_callback = drop_callback
+        self.tasks = {}  # タスク ID -> {"tag", "ready_at"}
+        self.posts = []  # task_post ごとのタスク数
+        self.gets = {}  # タスク ID -> task_get の回数
+        self.ready_calls = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def task_post(self, tasks):
+        now = time.time()
+        response = []
+        with self._lock:
+            self.post_calls += 1
+            if self.fail_post is not None and self.fail_post(self.post_calls):
+                raise RuntimeError("injected")
+            self.posts.append(len(tasks))
+            for task in tasks:
+                if self.reject is not None and self.reject(task["tag"]):
+                    response.append({"id": None, "status_code": 40501, "cost": 0,
+                                     "status_message": "Invalid Field.", "data": task})
+                    continue
+                task_id = f"t{next(self._ids)}"
+                self.tasks[task_id] = {"tag": task["tag"], "ready_at": now + self.ready_delay}
+                response.append({"id": task_id, "status_code": STATUS_TASK_CREATED, "cost": COST,
+                                 "data": task})
+                if task.get("pingback_url") or task.get("postback_url"):
+                    timer = threading.Timer(self.ready_delay, self._notify, (task_id, task))
+                    timer.daemon = True
+                    timer.start()
+        return response
+
+    def _result(self, tag):
+        kind, keyword = parse_task_tag(tag)
+        if kind == "allintitle":
+            return {"se_results_count": self.allintitle.get(keyword, 5), "items": []}
+        return {"items": [{"type": "organic"}] * self.recent.get(keyword, 0)}
+
+    def _notify(self, task_id, task):
+        if self.drop_callback is not None and self.drop_callback(task_id):
+            return
+        url = task.get("postback_url") or task["pingback_url"]
+        url = url.replace("$id", task_id).replace("$tag", quote(task["tag"]))
+        if task.get("postback_url"):
+            body = {"tasks": [{"id": task_id, "status_code": 20000, "data": task,
+                               "result": [self._result(task["tag"])]}]}
+            request = urllib.request.Request(
+                url, data=gzip.compress(json.dumps(body).encode("utf-8")), method="POST"
+            )
+        else:
+            request = urllib.request.Request(url)
+        urllib.request.urlopen(request, timeout=10).close()
+        with self._lock:
+            if task.get("postback_url"):
+                self.tasks.pop(task_id, None)
+
+    def tasks_ready(self):
+        now = time.time()
+        with self._lock:
+            self.ready_calls += 1
+            if self.fail_ready is not None and self.fail_ready(self.ready_calls):
+                raise RuntimeError("injected")
+            return [
+                {"id": task_id, "tag": task["tag"]}
+                for task_id, task in self.tasks.items() if task["ready_at"] <= now
+            ]
+
+    def task_get(self, task_id):
+        with self._lock:
+            attempt = self.gets[task_id] = self.gets.get(task_id, 0) + 1
+            task = self.tasks.get(task_id)
+        if self.fail_get is not None and self.fail_get(task_id, attempt):
+            raise RuntimeError("injected")
+        if task is None or task["ready_at"] > time.time():
+            return None
+        with self._lock:
+            self.tasks.pop(task_id, None)
+        return self._result(task["tag"])
+
+    def close(self):
+        pass
+
+
+def fast_settings(**overrides):
+    """テスト用に待ち時間を短くした dataforseo の設定"""
+    settings = {
+        "batch_size": 100,
+        "poll_adaptive": False,
+        "poll_interval": 0.01,
+        "poll_timeout": 30,
+        "fetch_retry_interval": 0.01,
+        "batch_linger": 0.05,
+    }
+    settings.update(overrides)
+    return settings
@@ -0,0 +1,72 @@
+import logging
+
+import pytest
+
+from core.budget import Budget, SpendLedger, today
+from core.config import DEFAULT_SETTINGS
+from core.dataforseo import ALLINTITLE, FRESHNESS
+from core.planner import SerpTaskPlan
+from core.serp_engine import run_tasks
+
+from fakes import COST, FakeClient, fast_settings
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    ledger = SpendLedger(str(tmp_path / "spend.sqlite3"))
+    yield ledger
+    ledger.close()
+
+
+def test_ledger_accumulates_across_connections(ledger):
+    ledger.record("a", {ALLINTITLE: (2, 0.0012), FRESHNESS: (0, 0.0)})
+    # 別のプロセスと同じく、別の接続から同じ行に加える
+    other = SpendLedger(ledger.path)
+    other.record("a", {ALLINTITLE: (3, 0.0018)})
+    other.record("b", {FRESHNESS: (1, 0.0006)})
+    other.close()
+    assert ledger.rows() == [
+        {"day": today(), "profile": "a", "kind": ALLINTITLE, "tasks": 5,
+         "cost": pytest.approx(0.003)},
+        {"day": today(), "profile": "b", "kind": FRESHNESS, "tasks": 1,
+         "cost": pytest.approx(0.0006)},
+    ]
+    assert ledger.total() == pytest.approx(0.0036)
+    assert ledger.total(profile="a") == pytest.approx(0.003)
+    assert ledger.task_costs() == {ALLINTITLE: pytest.approx(0.0006),
+                                   FRESHNESS: pytest.approx(0.0006)}
+
+
+def test_soft_limit_warns_once(ledger, caplog):
+    budget = Budget(ledger, "a", {"daily": {"soft": 0.001}})
+    with caplog.at_level(logging.WARNING, logger="core.budget"):
+        budget.record({ALLINTITLE: (1, 0.0006)})
+        assert not caplog.records
+        budget.record({ALLINTITLE: (1, 0.0006)})
+        budget.record({ALLINTITLE: (1, 0.0006)})
+    assert len(caplog.records) == 1
+
+
+def test_remaining_is_the_smaller_hard_limit(ledger):
+    ledger.record("other", {ALLINTITLE: (10, 0.006)})
+    budget = Budget(ledger, "a", {"daily": {"hard": 0.01}, "profile_daily": {"hard": 0.008}})
+    remaining, label = budget.remaining()
+    assert remaining == pytest.approx(0.004)
+    assert "1 日の上限" in label
+    assert Budget(ledger, "a").remaining() == (None, None)
+
+
+@pytest.mark.parametrize("spent_elsewhere, keywords", [(0, 15), (20, 5)])
+def test_hard_limit_stops_posting(ledger, spent_elsewhere, keywords):
+    # 他のプロファイルが今日使った分も 1 日の上限に数える
+    ledger.record("other", {ALLINTITLE: (spent_elsewhere, spent_elsewhere * COST)})
+    budget = Budget(ledger, "a", {"daily": {"hard": 30 * COST}})
+    plan = SerpTaskPlan(DEFAULT_SETTINGS["rank"], prioritize=False, budget=budget)
+    requests_ = plan.initial([f"kw{i}" for i in range(50)], {ALLINTITLE: {}, FRESHNESS: {}})
+    client = FakeClient()
+    results = run_tasks(client, requests_, fast_settings(batch_size=10), plan=plan)
+    # allintitle が S の範囲のキーワードは 2 タスクずつ。始めたキーワードのランクは確定させる
+    assert sum(client.posts) == 2 * keywords
+    assert len(results) == 2 * keywords
+    assert plan.stop_reason is not None
+    assert ledger.total() == pytest.approx(30 * COST)
@@ -0,0 +1,154 @@
+import time
+
+import pytest
+
+from core.cache import (
+    CachePolicy, FileCache, MemoryLRU, SQLiteCache, TieredCache, get_shared_cache, migrate_file_cache,
+)
+
+DAY = 86400
+
+
+def _count(cache, kind=None):
+    sql = "SELECT COUNT(*) FROM cache" + (" WHERE kind = ?" if kind else "")
+    return cache._conn.execute(sql, (kind,) if kind else ()).fetchone()[0]
+
+
+@pytest.fixture
+def filled(tmp_path):
+    """プロファイル a / b で取得したエントリ（a の allintitle の 1 件は 10 日前）"""
+    path = str(tmp_path / "cache.sqlite3")
+    a = SQLiteCache(path, profile="a")
+    a.set_many("allintitle", [("東京 カフェ", 3), ("大阪 カフェ", 4)])
+    a.import_entries("allintitle", [("名古屋 カフェ", 5, time.time() - 10 * DAY)])
+    a.set_many("freshness", [("東京 カフェ", 0)])
+    b = SQLiteCache(path, profile="b")
+    b.set_many("suggest", [("東京", ["東京 カフェ"])])
+    b.close()
+    yield a
+    a.close()
+
+
+def _profiles(cache):
+    return sorted(cache._conn.execute("SELECT profile, kind, keyword FROM cache_profiles").fetchall())
+
+
+def test_invalidate_by_kind(filled):
+    assert filled.invalidate(kinds=["allintitle"]) == 3
+    assert _count(filled, "allintitle") == 0
+    assert _count(filled) == 2
+    # 削除したエントリのプロファイルとの対応も消す
+    assert _profiles(filled) == [("a", "freshness", "東京 カフェ"), ("b", "suggest", "東京")]
+
+
+def test_invalidate_by_profile(filled):
+    assert filled.invalidate(profile="b") == 1
+    assert filled.get("suggest", "東京") is None
+    assert _count(filled) == 4
+    assert [row[0] for row in _profiles(filled)] == ["a"] * 4
+
+
+def test_invalidate_by_age(filled):
+    assert filled.invalidate(older_than=5 * DAY) == 1
+    assert filled.get("allintitle", "名古屋 カフェ") is None
+    assert filled.get("allintitle", "東京 カフェ") == 3
+
+
+def test_invalidate_by_pattern(filled):
+    # パターンもキーワードと同じ規則で正規化する
+    assert filled.invalidate(kinds=["allintitle", "freshness"], pattern="東京　*") == 2
+    assert filled.get_many("allintitle", ["東京 カフェ", "大阪 カフェ"]) == {"大阪 カフェ": 4}
+    assert filled.get("suggest", "東京") == ["東京 カフェ"]
+
+
+def test_invalidate_all(filled):
+    assert filled.invalidate() == 5
+    assert _count(filled) == 0
+    assert _profiles(filled) == []
+
+
+def test_expired_entries_are_misses(filled):
+    view = filled.view(ttl={"allintitle": 5 * DAY})
+    assert view.get_many("allintitle", ["東京 カフェ", "名古屋 カフェ"]) == {"東京 カフェ": 3}
+    # 期限切れは削除せず、再取得した値で上書きする
+    view.set("allintitle", "名古屋 カフェ", 6)
+    assert view.get("allintitle", "名古屋 カフェ") == 6
+    policy = CachePolicy.from_settings({"cache": {"ttl": {"allintitle": 1, "suggest": None}}})
+    assert policy.ttl == {"allintitle": DAY, "suggest": None}
+    assert policy.min_fetched_at("suggest") == 0
+
+
+def test_refresh_bypasses_only_the_given_kinds(filled):
+    # run --refresh allintitle と同じビュー
+    view = filled.view(bypass=("allintitle",), profile="a")
+    assert view.get("allintitle", "東京 カフェ") is None
+    assert view.get("freshness", "東京 カフェ") == 0
+    view.set("allintitle", "東京 カフェ", 7)
+    assert filled.get("allintitle", "東京 カフェ") == 7
+    # --no-cache は読み込みだけを無効にする
+    assert filled.view(enabled=False).get("freshness", "東京 カフェ") is None
+
+
+def test_lru_keeps_backend_fetched_at(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.sqlite3"), policy=CachePolicy({"allintitle": 2 * DAY}))
+    backend.import_entries("allintitle", [("古い", 5, time.time() - 1.5 * DAY)])
+    cache = TieredCache(backend, MemoryLRU())
+    assert cache.get("allintitle", "古い") == 5
+    # LRU に載った後も、下段と同じ取得時刻で有効期限を判定する
+    view = cache.view(ttl={"allintitle": DAY})
+    assert view.get("allintitle", "古い") is None
+    assert cache.get("allintitle", "古い") == 5
+    cache.close()
+
+
+def test_tiered_cache_reads_through_and_writes_both(tmp_path):
+    backend = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    cache = TieredCache(backend, MemoryLRU())
+    cache.set_many("freshness", [("a", 1), ("b", 0)])
+    assert cache.get_many("freshness", ["a", "b", "c"]) == {"a": 1, "b": 0}
+    assert cache.stats()["hits"] == 2
+    assert backend.get_many("freshness", ["a", "b"]) == {"a": 1, "b": 0}
+    assert cache.view(bypass=("freshness",)).get("freshness", "a") is None
+    cache.close()
+
+
+def test_shared_cache_applies_ttl_per_view(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    first = get_shared_cache({"cache": {"ttl": {"allintitle": 30}}}, path=path)
+    first.backend.import_entries("allintitle", [("kw", 3, time.time() - 10 * DAY)])
+    second = get_shared_cache({"cache": {"ttl": {"allintitle": 1}}}, path=path)
+    assert second is first
+    assert first.view().get("allintitle", "kw") == 3
+    ttl = CachePolicy.from_settings({"cache": {"ttl": {"allintitle": 1}}}).ttl
+    assert second.view(ttl=ttl).get("allintitle", "kw") is None
+
+
+def test_lru_drops_entries_invalidated_by_another_process(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = TieredCache(SQLiteCache(path), MemoryLRU())
+    cache.set_many("allintitle", [("東京 カフェ", 3), ("大阪 カフェ", 4)])
+    assert cache.get("allintitle", "東京 カフェ") == 3
+    # 別のプロセス（main.py cache invalidate）と同じく、別の接続で削除する
+    other = SQLiteCache(path)
+    assert other.invalidate(kinds=["allintitle"], pattern="東京*") == 1
+    other.close()
+    assert cache.get("allintitle", "東京 カフェ") is None
+    assert cache.get("allintitle", "大阪 カフェ") == 4
+    # 削除が無ければ LRU はそのまま使う
+    hits = cache.stats()["hits"]
+    assert cache.get("allintitle", "大阪 カフェ") == 4
+    assert cache.stats()["hits"] == hits + 1
+    cache.close()
+
+
+def test_migrate_file_cache(tmp_path):
+    root = str(tmp_path / "files")
+    files = FileCache(root)
+    files.set("suggest", "シード", ["シード 候補"])
+    files.set("allintitle", "キーワード", 12)
+    target = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    counts = migrate_file_cache(target, root=root)
+    assert counts == {"suggest": 1, "allintitle": 1, "freshness": 0}
+    assert target.get("suggest", "シード") == ["シード 候補"]
+    assert target.get("allintitle", "キーワード") == 12
+    target.close()
@@ -0,0 +1,90 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from core.callback import CallbackReceiver, start_callback_server
+from core.dataforseo import ALLINTITLE, FRESHNESS
+from core.serp_engine import run_tasks
+
+from fakes import FakeClient, fast_settings
+
+
+@pytest.fixture
+def receiver():
+    receiver = CallbackReceiver()
+    server = start_callback_server(0, host="127.0.0.1", receiver=receiver)
+    receiver.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield receiver
+    server.shutdown()
+    server.server_close()
+
+
+def _requests(n):
+    return [(f"kw{i}", kind) for i in range(n) for kind in (ALLINTITLE, FRESHNESS)]
+
+
+def _run(client, receiver, mode, fallback_interval=30):
+    settings = fast_settings(callback_mode=mode, callback_url=receiver.url,
+                             callback_fallback_interval=fallback_interval)
+    return run_tasks(client, _requests(10), settings, inbox=receiver.open_inbox())
+
+
+def test_postback_results_are_ingested(receiver):
+    client = FakeClient(allintitle={"kw0": 42}, recent={"kw0": 3}, ready_delay=0.05)
+    results = _run(client, receiver, "postback")
+    assert len(results) == 20
+    assert results[("kw0", ALLINTITLE)] == 42
+    assert results[("kw0", FRESHNESS)] == 3
+    # 結果は通知で届くため task_get は呼ばない
+    assert client.gets == {}
+
+
+def test_pingback_triggers_task_get(receiver):
+    client = FakeClient(ready_delay=0.05)
+    results = _run(client, receiver, "pingback")
+    assert all(value is not None for value in results.values())
+    assert len(client.gets) == 20
+    # 開始時の回収と最初の確認のほかは tasks_ready を呼ばない
+    assert client.ready_calls <= 2
+
+
+def test_dropped_notifications_fall_back_to_tasks_ready(receiver):
+    client = FakeClient(ready_delay=0.05, drop_callback=lambda task_id: int(task_id[1:]) % 3 == 0)
+    results = _run(client, receiver, "postback", fallback_interval=0.2)
+    assert len(results) == 20
+    assert all(value is not None for value in results.values())
+    assert len(client.gets) == 6
+
+
+def _get(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def test_callback_without_token_is_rejected(receiver):
+    inbox = receiver.open_inbox()
+    inbox.expect([("t1", "allintitle:kw")])
+    base = f"{receiver.url}/dataforseo/pingback?id=t1&tag=allintitle:kw"
+    assert _get(base) == 403
+    assert _get(f"{base}&token=wrong") == 403
+    assert inbox.get(0) == []
+    assert _get(f"{base}&token={receiver.token}") == 200
+    assert inbox.get(1) == [("t1", None)]
+
+
+def test_callback_with_other_tag_is_ignored():
+    receiver = CallbackReceiver()
+    inbox = receiver.open_inbox()
+    inbox.expect([("t1", "allintitle:kw")])
+    receiver.pingback("t1", "freshness:kw")
+    assert inbox.get(0) == []
+    receiver.pingback("t1", "allintitle:kw")
+    assert inbox.get(0) == [("t1", None)]
+    # 投稿のレスポンスより先に届いた通知もタグを照合する
+    receiver.pingback("t2", "allintitle:other")
+    inbox.expect([("t2", "allintitle:kw2")])
+    assert inbox.get(0) == []
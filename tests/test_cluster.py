@@ -0,0 +1,45 @@
+import itertools
+import random
+
+import numpy as np
+
+from core.cluster import _bands, cluster_keywords, minhash_signatures
+from core.config import DEFAULT_SETTINGS
+
+WORDS = ["東京", "カフェ", "おすすめ", "ランチ", "安い", "駅前", "人気", "個室", "大阪", "ホテル"]
+
+
+def _keywords(seed=0):
+    """同じ語の組み合わせ・語順違いを多く含むキーワード"""
+    rng = random.Random(seed)
+    return list(dict.fromkeys(" ".join(rng.sample(WORDS, rng.randint(2, 4))) for _ in range(400)))
+
+
+def test_word_order_variants_share_a_cluster():
+    clusters = cluster_keywords(["東京 カフェ おすすめ", "ランチ 個室", "おすすめ カフェ 東京"])
+    assert clusters["おすすめ カフェ 東京"] == "東京 カフェ おすすめ"
+    assert clusters["ランチ 個室"] == "ランチ 個室"
+
+
+def test_all_similar_pairs_in_a_bucket_are_joined():
+    keywords = _keywords()
+    threshold = DEFAULT_SETTINGS["cluster"]["threshold"]
+    clusters = cluster_keywords(keywords, threshold=threshold)
+    signatures = minhash_signatures(keywords)
+    bands, rows = _bands(64, threshold)
+    for i, j in itertools.combinations(range(len(keywords)), 2):
+        if (signatures[i] == signatures[j]).mean() < threshold:
+            continue
+        shared = any(
+            np.array_equal(signatures[i, b * rows:(b + 1) * rows], signatures[j, b * rows:(b + 1) * rows])
+            for b in range(bands)
+        )
+        if shared:
+            assert clusters[keywords[i]] == clusters[keywords[j]], (keywords[i], keywords[j])
+
+
+def test_default_threshold_matches_settings():
+    keywords = _keywords()
+    assert cluster_keywords(keywords) == cluster_keywords(
+        keywords, threshold=DEFAULT_SETTINGS["cluster"]["threshold"]
+    )
@@ -0,0 +1,60 @@
+import csv
+
+import pytest
+
+from core.diff import ALLINTITLE_CHANGED, NEW, RANK_CHANGED, REMOVED, iter_diff, write_diff
+from core.export import write_results
+from core.normalize import KeywordNormalizer
+from core.results import ResultTable
+
+
+def _write(path, rows):
+    table = ResultTable.from_rows([dict(row, seed="seed", depth=1) for row in rows])
+    table.rank({"S": 10, "A": 30, "B": 100})
+    write_results(table, str(path), row_group_size=2)
+    return str(path)
+
+
+OLD = [
+    {"keyword": "ＡＢＣ 講座", "allintitle": 5, "recent_count": 0},
+    {"keyword": "カタカナ", "allintitle": 20, "recent_count": 0},
+    {"keyword": "消える", "allintitle": 50, "recent_count": 0},
+    {"keyword": "動く", "allintitle": 40, "recent_count": 0},
+]
+NEW_ROWS = [
+    {"keyword": "abc 講座", "allintitle": 50, "recent_count": 0},
+    {"keyword": "かたかな", "allintitle": 20, "recent_count": 0},
+    {"keyword": "動く", "allintitle": 45, "recent_count": 0},
+    {"keyword": "新しい", "allintitle": 1, "recent_count": 0},
+]
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".arrow"])
+def test_diff_between_exported_runs(tmp_path, suffix):
+    old = _write(tmp_path / f"old{suffix}", OLD)
+    new = _write(tmp_path / f"new{suffix}", NEW_ROWS)
+    summary = {}
+    rows = {row["keyword"]: row for row in iter_diff(old, new, summary=summary, batch_size=2)}
+    assert rows["abc 講座"]["change"] == RANK_CHANGED
+    assert (rows["abc 講座"]["old_rank"], rows["abc 講座"]["new_rank"]) == ("S", "B")
+    assert rows["動く"]["change"] == ALLINTITLE_CHANGED
+    assert rows["動く"]["allintitle_delta"] == 5
+    assert rows["新しい"]["change"] == NEW
+    assert rows["消える"]["change"] == REMOVED
+    # 既定の規則ではカタカナとひらがなは別のキーワード
+    assert rows["かたかな"]["change"] == NEW
+    assert rows["カタカナ"]["change"] == REMOVED
+    assert summary == {NEW: 2, REMOVED: 2, RANK_CHANGED: 1, ALLINTITLE_CHANGED: 1, "unchanged": 0}
+
+
+def test_diff_uses_configured_rules(tmp_path):
+    old = _write(tmp_path / "old.csv", OLD)
+    new = _write(tmp_path / "new.csv", NEW_ROWS)
+    settings = {"normalize": {"rules": ["nfkc", "lower", "kana", "space"]}}
+    normalizer = KeywordNormalizer.from_settings(settings)
+    summary = write_diff(old, new, str(tmp_path / "diff.csv"), normalizer=normalizer)
+    assert summary[NEW] == 1
+    assert summary[REMOVED] == 1
+    assert summary["unchanged"] == 1
+    with open(tmp_path / "diff.csv", encoding="utf-8-sig", newline="") as f:
+        assert {row["keyword"] for row in csv.DictReader(f)} == {"abc 講座", "動く", "新しい", "消える"}
@@ -0,0 +1,56 @@
+import csv
+import glob
+
+import pytest
+
+from core.export import ResultStreamWriter
+from core.results import ResultTable
+
+
+def _table(n=25):
+    rows = [{"keyword": f"kw{i}", "seed": "seed", "depth": 1, "allintitle": i,
+             "recent_count": None if i % 3 == 0 else 0} for i in range(n)]
+    table = ResultTable.from_rows(rows)
+    table.rank({"S": 10, "A": 30, "B": 100})
+    return table
+
+
+def _read(path):
+    if path.endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            return list(csv.DictReader(f))
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+
+    if path.endswith(".parquet"):
+        return pq.read_table(path).to_pylist()
+    with pyarrow.ipc.open_stream(path) as reader:
+        return reader.read_all().to_pylist()
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".arrow"])
+def test_streamed_rows_are_written_once(tmp_path, suffix):
+    table = _table()
+    path = str(tmp_path / f"results{suffix}")
+    with ResultStreamWriter(path, row_group_size=4) as writer:
+        # 確定した行を逐次（重複を含めて）渡し、残りは finish で書き出す
+        writer.write_rows(table.rows(list(range(10))))
+        writer.write_rows(table.rows([3, 4, 10]))
+        writer.finish(table)
+    rows = _read(path)
+    assert sorted(row["keyword"] for row in rows) == sorted(table.keyword.tolist())
+    assert writer.count == len(table)
+
+
+def test_interrupted_parquet_keeps_written_parts(tmp_path):
+    import pyarrow.parquet as pq
+
+    table = _table()
+    path = str(tmp_path / "results.parquet")
+    with pytest.raises(KeyboardInterrupt):
+        with ResultStreamWriter(path, row_group_size=4) as writer:
+            writer.write_rows(table.rows(list(range(10))))
+            raise KeyboardInterrupt
+    # まとめる前の部分ファイルがデータセットとして読める
+    assert glob.glob(f"{path}.parts/part-*.parquet")
+    assert pq.read_table(f"{path}.parts").num_rows == 10
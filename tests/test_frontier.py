@@ -0,0 +1,99 @@
+import json
+import os
+
+import pytest
+
+from core.frontier import SuggestFrontier
+
+SUFFIXES = ["a", "b"]
+
+
+def _suggest(query):
+    """クエリごとに決まったサジェスト（深さが増えるほど既出のキーワードが多くなる）"""
+    head = query.split()[0]
+    return [f"{head}{len(query) % 3}", f"{head}x", query]
+
+
+# visited: bloom は偽陽性が起きる小さいフィルタにする
+VISITED = {
+    "set": {"visited": "set"},
+    "bloom": {"visited": "bloom", "visited_capacity": 4, "visited_error_rate": 0.3},
+}
+
+
+def _frontier(directory, snapshot_every=3, visited="set"):
+    return SuggestFrontier(str(directory), "fp", SUFFIXES, max_depth=2, snapshot_every=snapshot_every,
+                           visited_settings=VISITED[visited])
+
+
+def _crawl(frontier, limit=None):
+    done = 0
+    while frontier and (limit is None or done < limit):
+        for query in frontier.pop_batch(2):
+            frontier.complete(query, _suggest(query))
+            done += 1
+    frontier.sync()
+
+
+@pytest.mark.parametrize("visited", ["set", "bloom"])
+def test_resume_matches_uninterrupted_run(tmp_path, visited):
+    expected = _frontier(tmp_path / "full")
+    expected.start(["seed"])
+    _crawl(expected)
+    expected_rows = list(expected.iter_candidates())
+    expected.close()
+
+    first = _frontier(tmp_path / "resumed", visited=visited)
+    assert not first.start(["seed"])
+    _crawl(first, limit=7)
+    # 中断（clear せずに終える）
+    first.close()
+    second = _frontier(tmp_path / "resumed", visited=visited)
+    assert second.start(["seed"])
+    _crawl(second)
+    assert list(second.iter_candidates()) == expected_rows
+    assert second.collected == len(expected_rows)
+    second.close()
+    # 訪問済み集合の一時ファイルは残さない
+    assert not [name for name in os.listdir(tmp_path / "resumed") if name.startswith("visited-")]
+
+
+def test_snapshot_does_not_contain_candidates(tmp_path):
+    frontier = _frontier(tmp_path, snapshot_every=1)
+    frontier.start(["seed"])
+    _crawl(frontier, limit=4)
+    with open(frontier.snapshot_path, encoding="utf-8") as f:
+        state = json.load(f)
+    assert "candidates" not in state
+    assert state["candidates_size"] > 0
+    frontier.close()
+
+
+def test_tail_after_snapshot_is_replayed_from_journal(tmp_path):
+    frontier = _frontier(tmp_path, snapshot_every=100)
+    frontier.start(["seed"])
+    _crawl(frontier, limit=5)
+    collected = frontier.collected
+    frontier.close()
+    # 書き込み途中で落ちた末尾の行
+    with open(tmp_path / "candidates.jsonl", "a", encoding="utf-8") as f:
+        f.write('{"keyword": "bro')
+    resumed = _frontier(tmp_path, snapshot_every=100)
+    assert resumed.start(["seed"])
+    assert resumed.collected == collected
+    assert len(list(resumed.iter_candidates())) == collected
+    resumed.close()
+
+
+def test_legacy_snapshot_is_loaded(tmp_path):
+    state = {
+        "fingerprint": "fp", "seq": 1,
+        "candidates": [{"keyword": "seed", "seed": "seed", "depth": 0}],
+        "pending": {"seed a": [0, 0, 1, "seed"]},
+    }
+    (tmp_path / "snapshot.json").write_text(json.dumps(state), encoding="utf-8")
+    frontier = _frontier(tmp_path)
+    assert frontier.start(["seed"])
+    assert [row["keyword"] for row in frontier.iter_candidates()] == ["seed"]
+    assert len(frontier) == 1
+    frontier.close()
@@ -0,0 +1,45 @@
+import sqlite3
+import time
+
+from core.jobs import CANCELLED, QUEUED, RUNNING, JobQueue
+
+
+def test_requeue_only_stale_jobs(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+    live = queue.submit("default")
+    dead = queue.submit("default")
+    cancelled = queue.submit("default")
+    assert queue.claim("live")["id"] == live
+    assert queue.claim("dead")["id"] == dead
+    assert queue.claim("dead")["id"] == cancelled
+    queue.cancel(cancelled)
+    time.sleep(0.2)
+    queue.heartbeat("live")
+    assert queue.requeue_stale(stale_after=0.1) == 1
+    assert queue.get(live)["status"] == RUNNING
+    assert queue.get(dead)["status"] == QUEUED
+    assert queue.get(cancelled)["status"] == CANCELLED
+    queue.close()
+
+
+def test_existing_queue_is_migrated(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, profile TEXT NOT NULL, params TEXT NOT NULL,"
+        " priority INTEGER NOT NULL DEFAULT 0, status TEXT NOT NULL,"
+        " cancel_requested INTEGER NOT NULL DEFAULT 0, progress TEXT, result_path TEXT,"
+        " error TEXT, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    conn.execute(
+        "INSERT INTO jobs (id, profile, params, status, created_at, started_at)"
+        " VALUES ('j1', 'default', '{}', ?, 0, 0)",
+        (RUNNING,),
+    )
+    conn.commit()
+    conn.close()
+    queue = JobQueue(path)
+    # heartbeat の無い（以前のバージョンで実行中だった）ジョブは再投入する
+    assert queue.requeue_stale() == 1
+    assert queue.get("j1")["status"] == QUEUED
+    queue.close()
@@ -0,0 +1,56 @@
+import csv
+import os
+import subprocess
+import sys
+
+import yaml
+
+from benchmarks.fake_servers import FakeServers
+from conftest import ROOT_DIR
+
+# main.py run を別プロセスで実行し、終了後に Gradio を読み込んでいないことを確かめる。
+# API キーと実行サマリーの置き場所は一時ディレクトリに向ける
+DRIVER = """
+import os, runpy, sys
+import core.config
+work_dir = sys.argv.pop(1)
+core.config.CONFIG_DIR = os.path.join(work_dir, "config")
+core.config.OUTPUTS_DIR = os.path.join(work_dir, "outputs")
+sys.argv[0] = "main.py"
+runpy.run_path("main.py", run_name="__main__")
+assert "gradio" not in sys.modules, "gradio was imported"
+"""
+
+
+def test_headless_run_without_gradio(tmp_path):
+    config_dir = tmp_path / "config"
+    config_dir.mkdir()
+    with open(config_dir / "api_keys.yaml", "w", encoding="utf-8") as f:
+        yaml.safe_dump({"dataforseo": {"login": "test", "password": "test"}}, f)
+    servers_config = {
+        "suggest": {"latency": 0, "suggestions": 5},
+        "dataforseo": {"latency": 0, "ready_delay": 0.1, "ready_jitter": 0},
+    }
+    out = tmp_path / "results.csv"
+    with FakeServers(servers_config) as servers:
+        profile = {
+            "name": "headless",
+            "seeds": ["カフェ"],
+            "suggest": {"url": servers.suggest_url, "suffixes": ["あ"], "interval": 0},
+            "dataforseo": {"base_url": servers.dataforseo_url, "poll_adaptive": False,
+                           "poll_interval": 0.1},
+        }
+        with open(tmp_path / "headless.yaml", "w", encoding="utf-8") as f:
+            yaml.safe_dump(profile, f, allow_unicode=True)
+        env = dict(os.environ, DEMAND_MINER_CACHE_DIR=str(tmp_path / "cache"))
+        completed = subprocess.run(
+            [sys.executable, "-c", DRIVER, str(tmp_path), "run",
+             "--profile", str(tmp_path / "headless.yaml"), "--out", str(out)],
+            cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=120,
+        )
+    assert completed.returncode == 0, completed.stderr
+    with open(out, encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert rows
+    assert all(row["rank"] for row in rows)
+    assert os.listdir(tmp_path / "outputs" / "runs")
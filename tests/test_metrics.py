@@ -0,0 +1,30 @@
+import json
+import os
+import threading
+
+from core.metrics import RunRecorder
+
+
+def test_runs_started_in_the_same_second_keep_their_summaries(tmp_path):
+    directory = str(tmp_path / "runs")
+    recorders = [RunRecorder("profile") for _ in range(8)]
+    for i, recorder in enumerate(recorders):
+        # 複数のジョブワーカーが同じ秒に始めた実行
+        recorder.started_at = recorders[0].started_at
+        recorder.note(worker=i)
+    paths = [None] * len(recorders)
+
+    def write(i):
+        paths[i] = recorders[i].write(directory)
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(len(recorders))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(set(paths)) == len(recorders)
+    assert sorted(os.listdir(directory)) == sorted(os.path.basename(path) for path in paths)
+    for i, path in enumerate(paths):
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f)["worker"] == i
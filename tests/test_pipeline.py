@@ -0,0 +1,123 @@
+import argparse
+import copy
+import threading
+import time
+
+import pytest
+
+import core.pipeline
+import main
+from core.cache import SQLiteCache
+from core.config import DEFAULT_SETTINGS
+from core.dataforseo import ALLINTITLE, FRESHNESS
+from core.pipeline import estimate_pipeline, iter_pipeline
+from core.task_journal import TaskJournal
+
+from fakes import COST, FakeClient, fast_settings
+
+API_KEYS = {"dataforseo": {"login": "test", "password": "test"}}
+
+
+def _profile(**dataforseo):
+    settings = copy.deepcopy(DEFAULT_SETTINGS)
+    settings["dataforseo"].update(fast_settings(**dataforseo))
+    settings["cluster"]["enabled"] = False
+    return {"name": "test", "seeds": ["シード"], "settings": settings}
+
+
+@pytest.fixture
+def pipeline(monkeypatch, tmp_path):
+    """サジェストと DataForSEO を差し替え、キャッシュとジャーナルを一時ディレクトリに置く"""
+    env = {"keywords": [f"シード {i}" for i in range(20)], "client": FakeClient()}
+
+    def collect_candidates(seeds, settings, cache=None, progress=None, state_dir=None):
+        if progress:
+            progress("suggest", 1, 1)
+        return [{"keyword": kw, "seed": seeds[0], "depth": 1} for kw in env["keywords"]]
+
+    class Client:
+        @staticmethod
+        def from_api_keys(api_keys, **kwargs):
+            return env["client"]
+
+    monkeypatch.setattr(core.pipeline, "collect_candidates", collect_candidates)
+    monkeypatch.setattr(core.pipeline, "DataForSEOClient", Client)
+    monkeypatch.setattr(core.pipeline, "TaskJournal",
+                        lambda: TaskJournal(str(tmp_path / "tasks.sqlite3")))
+    env["cache"] = SQLiteCache(str(tmp_path / "cache.sqlite3"))
+    yield env
+    env["cache"].close()
+
+
+def test_iter_pipeline_event_order(pipeline):
+    events = list(iter_pipeline(_profile(), API_KEYS, interval=0.01, cache=pipeline["cache"],
+                                summary_dir=None))
+    types = [event["type"] for event in events]
+    assert types[0] == "progress"
+    assert types[-1] == "done"
+    assert types.count("done") == 1
+    rows = [row for event in events if event["type"] == "rows" for row in event["rows"]]
+    assert sorted(row["keyword"] for row in rows) == sorted(pipeline["keywords"])
+    assert all(row["rank"] == "S" for row in rows)
+    last_progress = [event for event in events if event["type"] == "progress"][-1]
+    assert last_progress["stages"]["ranked"] == (20, 20)
+    assert len(events[-1]["table"]) == 20
+
+
+def test_closing_iter_pipeline_stops_posting(pipeline):
+    pipeline["keywords"] = [f"シード {i}" for i in range(500)]
+    client = pipeline["client"] = FakeClient(ready_delay=0.05)
+    profile = _profile(batch_size=20, max_in_flight=20, batch_linger=0.01)
+    events = iter_pipeline(profile, API_KEYS, interval=0.01, cache=pipeline["cache"],
+                           summary_dir=None)
+    for event in events:
+        if event["type"] == "rows":
+            break
+    events.close()
+    for thread in threading.enumerate():
+        if thread.name == "pipeline":
+            thread.join(timeout=10)
+            assert not thread.is_alive()
+    posted = sum(client.posts)
+    assert posted < 1000
+    time.sleep(0.2)
+    assert sum(client.posts) == posted
+
+
+def _cache_for_estimate(cache):
+    """
+    20 件のうち 10 件の allintitle がキャッシュにある（5 件は S の範囲、5 件は C に決まる）。
+    鮮度は S の範囲の 2 件だけがキャッシュにある
+    """
+    cache.set_many(ALLINTITLE, [(f"シード {i}", 5 if i < 5 else 500) for i in range(10)])
+    cache.set_many(FRESHNESS, [("シード 0", 0), ("シード 1", 0)])
+
+
+def test_estimate_counts_cached_and_paid_tasks(pipeline):
+    _cache_for_estimate(pipeline["cache"])
+    estimate = estimate_pipeline(_profile(), cache=pipeline["cache"])
+    assert estimate["keywords"] == 20
+    assert estimate["queried"] == 20
+    assert estimate["cached"] == {ALLINTITLE: 10, FRESHNESS: 2}
+    assert estimate["freshness_skipped"] == 5
+    # allintitle は未取得の 10 件。鮮度は S の範囲の残り 3 件と、保留した 10 件のうち
+    # キャッシュの割合（10 件中 5 件が C 以外）で見込んだ 5 件
+    assert estimate["tasks"] == {ALLINTITLE: 10, FRESHNESS: 8}
+    assert estimate["cost"] == pytest.approx(18 * COST)
+    # 見積もりでは投稿しない
+    assert pipeline["client"].posts == []
+
+
+def test_dry_run_prints_estimate(pipeline, monkeypatch, capsys):
+    _cache_for_estimate(pipeline["cache"])
+    monkeypatch.setattr(core.pipeline, "open_cache", lambda settings: pipeline["cache"].view())
+    args = argparse.Namespace(no_cache=False, restart=False, refresh=None)
+    main.print_estimate(_profile(), None, args)
+    out = capsys.readouterr().out
+    assert "allintitle: キャッシュ 10 件 / 有料タスク 10 件" in out
+    assert "freshness: キャッシュ 2 件 / 有料タスク 8 件" in out
+    assert "省略 5 件" in out
+    # --refresh allintitle ではキャッシュの allintitle を使わない
+    args.refresh = [ALLINTITLE]
+    main.print_estimate(_profile(), None, args)
+    assert "allintitle: キャッシュ 0 件 / 有料タスク 20 件" in capsys.readouterr().out
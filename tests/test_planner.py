@@ -0,0 +1,68 @@
+from collections import deque
+
+from core.config import DEFAULT_SETTINGS
+from core.dataforseo import ALLINTITLE, FRESHNESS
+from core.planner import SerpTaskPlan
+from core.ranker import rank_keyword
+from core.serp_engine import run_tasks
+
+from fakes import COST, FakeClient, fast_settings
+
+THRESHOLDS = DEFAULT_SETTINGS["rank"]
+
+
+def _run(client, plan, values, keywords):
+    """pipeline と同じく、両方の値がそろったキーワードのランクを plan に渡しながら実行する"""
+    requests_ = plan.initial(keywords, values)
+
+    def on_results(results):
+        ranked = []
+        for keyword, kind, value in results:
+            values[kind][keyword] = value
+            if keyword in values[ALLINTITLE] and keyword in values[FRESHNESS]:
+                ranked.append((keyword, rank_keyword(values[ALLINTITLE][keyword],
+                                                     values[FRESHNESS][keyword], THRESHOLDS)))
+        plan.record_ranks(ranked)
+
+    return run_tasks(client, requests_, fast_settings(), on_results=on_results, plan=plan)
+
+
+def test_stop_after_s_with_cached_allintitle():
+    # --refresh freshness: allintitle はすべてキャッシュにあり、10 件に 1 件が S の範囲
+    keywords = [f"kw{i}" for i in range(400)]
+    cached = {keyword: 3 if i % 10 == 0 else 50 for i, keyword in enumerate(keywords)}
+    values = {ALLINTITLE: dict(cached), FRESHNESS: {}}
+    client = FakeClient()
+    plan = SerpTaskPlan(THRESHOLDS, prioritize=False, stop_after_s=20)
+    _run(client, plan, values, keywords)
+    assert plan.s_ranked >= 20
+    assert plan.stop_reason is not None
+    # S の割合をキャッシュから見積もるため、1 件ずつのバッチにはならない
+    assert len(client.posts) <= 4
+    assert min(client.posts) > 1
+
+
+def test_limit_queries_do_not_stop():
+    plan = SerpTaskPlan(THRESHOLDS, max_cost=COST * 3)
+    plan.record_cost({ALLINTITLE: (3, COST * 3)})
+    assert plan.stop_reason is not None
+    plan = SerpTaskPlan(THRESHOLDS, max_cost=COST * 2)
+    plan.initial(["a", "b"], {ALLINTITLE: {}, FRESHNESS: {}})
+    plan.posted([("a", ALLINTITLE)])
+    plan.record_cost({ALLINTITLE: (1, COST)})
+    # 問い合わせは打ち切りを決めない
+    assert plan.affordable_tasks() == 1
+    assert plan.admissible() == 0
+    assert plan.stop_reason is None
+
+
+def test_started_keywords_finish_after_stop():
+    plan = SerpTaskPlan(THRESHOLDS, stop_after_s=1, max_cost=COST * 4)
+    plan.initial(["a", "b", "c"], {ALLINTITLE: {}, FRESHNESS: {}})
+    plan.posted([("a", ALLINTITLE), ("b", ALLINTITLE)])
+    plan.record_cost({ALLINTITLE: (2, COST * 2)})
+    plan.follow_up([("a", ALLINTITLE, 3), ("b", ALLINTITLE, 3)])
+    plan.record_ranks([("x", "S")])
+    queue = deque([("a", FRESHNESS), ("b", FRESHNESS), ("c", ALLINTITLE)])
+    assert plan.trim(queue) == 1
+    assert list(queue) == [("a", FRESHNESS), ("b", FRESHNESS)]
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from core.poller import AdaptivePoller, FixedPoller, QueueLatencyModel
+from core.serp_engine import run_tasks
+
+from fakes import FakeClient, fast_settings
+
+
+def _poller(samples=(), **kwargs):
+    model = QueueLatencyModel(path=None)
+    model.samples.extend(samples)
+    return AdaptivePoller(model, min_interval=1.0, max_interval=20.0, **kwargs)
+
+
+def test_backoff_doubles_up_to_max_and_resets_on_hit():
+    poller = _poller()
+    delays = [poller.next_delay([0.0], 100.0, False) for _ in range(7)]
+    assert delays == [1.0, 2.0, 4.0, 8.0, 16.0, 20.0, 20.0]
+    # 完了したタスクが見つかったら最小の間隔に戻す
+    assert poller.next_delay([0.0], 100.0, True) == 1.0
+    assert poller.next_delay([0.0], 100.0, False) == 1.0
+    assert poller.next_delay([0.0], 100.0, False) == 2.0
+
+
+def test_no_poll_before_the_quantile():
+    # 10 分位点は 30 秒
+    poller = _poller(samples=[30.0] * 20 + [60.0] * 80, quantile=0.1)
+    assert poller.model.quantile(0.1) == 30.0
+    # 投稿から 5 秒後なら、30 秒後（残り 25 秒。ただし上限は max_interval）まで確認しない
+    assert poller.next_delay([95.0], 100.0, False) == 20.0
+    assert poller.next_delay([88.0], 100.0, False) == 18.0
+    # 見込みの時刻を過ぎたタスクがあればバックオフの間隔で確認する（空振りのたびに倍になる）
+    assert poller.next_delay([60.0, 95.0], 100.0, False) == 4.0
+    # 結果待ちが無ければバックオフだけで決める
+    assert poller.next_delay([], 100.0, False) == 8.0
+
+
+def test_observations_use_the_poll_midpoint(tmp_path):
+    path = str(tmp_path / "queue_latency.json")
+    poller = AdaptivePoller(QueueLatencyModel(path))
+    poller.polled(110.0)
+    # 前回の確認（110 秒）と今回（120 秒）の間に完了したとみなし、中点の 115 秒を使う
+    poller.observe(100.0, 120.0)
+    # 前回の確認が投稿より前なら投稿時刻からの中点
+    poller.observe(115.0, 125.0)
+    assert list(poller.model.samples) == [15.0, 5.0]
+    poller.save()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f) == {"samples": [15.0, 5.0]}
+    assert list(QueueLatencyModel(path).samples) == [15.0, 5.0]
+
+
+def test_model_keeps_recent_samples():
+    model = QueueLatencyModel(path=None, max_samples=3)
+    for latency in (1.0, 2.0, 3.0, 4.0):
+        model.observe(0.0, None, latency * 2)
+    assert list(model.samples) == [2.0, 3.0, 4.0]
+    assert model.quantile(0.0) == 2.0
+    assert model.quantile(1.0) == 4.0
+    assert QueueLatencyModel(path=None).quantile(0.5) is None
+
+
+class _SavingPoller(FixedPoller):
+    def __init__(self):
+        super().__init__(0.01)
+        self.saved = False
+
+    def save(self):
+        self.saved = True
+
+
+def test_poller_is_saved_when_the_run_fails():
+    poller = _SavingPoller()
+
+    def progress(stage, done, total):
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        run_tasks(FakeClient(), [("kw", "allintitle")], fast_settings(), progress=progress,
+                  poller=poller)
+    assert poller.saved
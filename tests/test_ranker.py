@@ -0,0 +1,28 @@
+import numpy as np
+
+from core.config import DEFAULT_SETTINGS
+from core.ranker import UNRANKED, rank_codes, rank_keyword
+
+THRESHOLDS = DEFAULT_SETTINGS["rank"]
+
+
+def test_missing_freshness_is_unranked():
+    assert rank_keyword(5, None, THRESHOLDS) is None
+    assert rank_keyword(50, None, THRESHOLDS) is None
+    # allintitle 件数だけで C に決まる
+    assert rank_keyword(500, None, THRESHOLDS) == "C"
+    assert rank_keyword(5, 0, THRESHOLDS) == "S"
+    assert rank_keyword(5, 2, THRESHOLDS) == "A"
+
+
+def test_rank_codes_match_rank_keyword():
+    allintitle = [None, 0, 5, 10, 11, 30, 31, 100, 101, 500]
+    recent = [None, 0, 3]
+    pairs = [(a, r) for a in allintitle for r in recent]
+    codes = rank_codes(
+        [np.nan if a is None else a for a, _ in pairs],
+        [np.nan if r is None else r for _, r in pairs],
+        THRESHOLDS,
+    )
+    expected = [rank_keyword(a, r, THRESHOLDS) for a, r in pairs]
+    assert [None if code == UNRANKED else "SABC"[code] for code in codes] == expected
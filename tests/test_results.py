@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from core.results import ResultTable, ResultView
+
+
+def _table(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    allintitle = rng.integers(0, 150, n).astype(np.float64)
+    recent = rng.integers(0, 3, n).astype(np.float64)
+    # 未取得（NaN）の行も混ぜる
+    allintitle[rng.random(n) < 0.05] = np.nan
+    recent[rng.random(n) < 0.2] = np.nan
+    return ResultTable([f"kw{i}" for i in range(n)], ["seed"] * n, [1] * n,
+                       allintitle=allintitle, recent_count=recent)
+
+
+def test_rerank_matches_full_rank():
+    table = _table()
+    table.rank({"S": 10, "A": 30, "B": 100})
+    for thresholds in ({"S": 20, "A": 30, "B": 80}, {"S": 5, "A": 50, "B": 120},
+                       {"S": 5, "A": 50, "B": 120}, {"S": 0, "A": 0, "B": 0}):
+        before = table.rank_code.copy()
+        changed = table.rerank(thresholds)
+        expected = _table().rank(thresholds)
+        assert np.array_equal(table.rank_code, expected)
+        assert np.array_equal(changed, np.flatnonzero(before != expected))
+
+
+def test_rerank_before_rank_judges_all_rows():
+    table = _table()
+    changed = table.rerank({"S": 10, "A": 30, "B": 100})
+    assert np.array_equal(table.rank_code, _table().rank({"S": 10, "A": 30, "B": 100}))
+    assert np.array_equal(changed, np.flatnonzero(table.rank_code != -1))
+
+
+def _view():
+    rows = [
+        {"keyword": "東京 カフェ", "allintitle": 5, "recent_count": 0},
+        # 全角スペースの表記ゆれ（正規化すると 1 行目と同じ）
+        {"keyword": "東京\u3000カフェ", "allintitle": 8, "recent_count": 0},
+        {"keyword": "大阪 カフェ", "allintitle": 20, "recent_count": 1},
+        {"keyword": "大阪 ランチ", "allintitle": 50, "recent_count": 0},
+        {"keyword": "京都 ランチ", "allintitle": 500, "recent_count": 0},
+        {"keyword": "京都 カフェ"},
+    ]
+    table = ResultTable.from_rows(rows, normalizer=lambda kw: kw.replace("\u3000", " "))
+    table.rank({"S": 10, "A": 30, "B": 100})
+    return ResultView(table)
+
+
+def _keywords(result):
+    return [row["keyword"] for row in result["rows"]]
+
+
+@pytest.mark.parametrize("conditions, expected", [
+    ({}, ["東京 カフェ", "東京\u3000カフェ", "大阪 カフェ", "大阪 ランチ", "京都 ランチ",
+          "京都 カフェ"]),
+    ({"ranks": ["S"]}, ["東京 カフェ", "東京\u3000カフェ"]),
+    ({"ranks": ["B", "C"]}, ["大阪 カフェ", "大阪 ランチ", "京都 ランチ"]),
+    ({"allintitle_min": 8, "allintitle_max": 50}, ["東京\u3000カフェ", "大阪 カフェ", "大阪 ランチ"]),
+    ({"allintitle_min": 100}, ["京都 ランチ"]),
+    ({"contains": "ランチ"}, ["大阪 ランチ", "京都 ランチ"]),
+    ({"recent": True}, ["大阪 カフェ"]),
+    # 未取得の recent_count は「直近の競合記事なし」に数える
+    ({"recent": False}, ["東京 カフェ", "東京\u3000カフェ", "大阪 ランチ", "京都 ランチ",
+                         "京都 カフェ"]),
+    ({"collapse_variants": True}, ["東京 カフェ", "大阪 カフェ", "大阪 ランチ", "京都 ランチ",
+                                   "京都 カフェ"]),
+    ({"ranks": ["S"], "collapse_variants": True, "contains": "カフェ"}, ["東京 カフェ"]),
+])
+def test_view_filters(conditions, expected):
+    result = _view().query(**conditions)
+    assert _keywords(result) == expected
+    assert result["total"] == len(expected)
+
+
+def test_view_sorts_and_pages():
+    view = _view()
+    result = view.query(sort_by="allintitle", descending=True, page=1, page_size=2)
+    # 降順では未取得（NaN）が先頭に来る
+    assert _keywords(result) == ["大阪 ランチ", "大阪 カフェ"]
+    assert result["total"] == 6
+    assert _keywords(view.query(sort_by="rank", page_size=3)) == [
+        "東京 カフェ", "東京\u3000カフェ", "大阪 カフェ"]
+    with pytest.raises(ValueError):
+        view.query(sort_by="seed")
+
+
+def test_view_rebuilds_index_after_rerank():
+    view = _view()
+    assert _keywords(view.query(ranks=["S"], sort_by="rank")) == ["東京 カフェ", "東京\u3000カフェ"]
+    assert _keywords(view.query(sort_by="rank"))[-1] == "京都 カフェ"
+    version = view.table.version
+    view.table.rerank({"S": 50, "A": 100, "B": 200})
+    assert view.table.version > version
+    # 同じ条件でも、ランクが変わった後は絞り込みと並び順を作り直す
+    assert _keywords(view.query(ranks=["S"], sort_by="rank")) == [
+        "東京 カフェ", "東京\u3000カフェ", "大阪 ランチ"]
+    assert _keywords(view.query(sort_by="rank"))[:4] == [
+        "東京 カフェ", "東京\u3000カフェ", "大阪 ランチ", "大阪 カフェ"]
@@ -0,0 +1,107 @@
+import time
+
+from core.config import DEFAULT_SETTINGS
+from core.dataforseo import ALLINTITLE, FRESHNESS, task_tag
+from core.planner import SerpTaskPlan
+from core.serp_engine import run_tasks
+from core.task_journal import TaskJournal
+
+from fakes import FakeClient, fast_settings
+
+
+def _requests(n):
+    return [(f"kw{i}", kind) for i in range(n) for kind in (ALLINTITLE, FRESHNESS)]
+
+
+def test_all_tasks_fetched(tmp_path):
+    client = FakeClient()
+    journal = TaskJournal(str(tmp_path / "tasks.sqlite3"))
+    results = run_tasks(client, _requests(60), fast_settings(), journal=journal)
+    journal.close()
+    assert len(results) == 120
+    assert all(value is not None for value in results.values())
+    assert TaskJournal(str(tmp_path / "tasks.sqlite3")).outstanding == {}
+
+
+def test_failed_task_get_is_retried(tmp_path):
+    # 各タスクの最初の task_get は失敗する
+    client = FakeClient(fail_get=lambda task_id, attempt: attempt == 1)
+    journal = TaskJournal(str(tmp_path / "tasks.sqlite3"))
+    stored = []
+    results = run_tasks(client, _requests(10), fast_settings(), journal=journal,
+                        on_results=stored.extend)
+    journal.close()
+    assert all(value is not None for value in results.values())
+    assert len(stored) == 20
+    assert TaskJournal(str(tmp_path / "tasks.sqlite3")).outstanding == {}
+
+
+def test_task_get_given_up_stays_outstanding(tmp_path):
+    client = FakeClient(fail_get=lambda task_id, attempt: True)
+    journal = TaskJournal(str(tmp_path / "tasks.sqlite3"))
+    results = run_tasks(client, _requests(3), fast_settings(fetch_retries=2), journal=journal)
+    journal.close()
+    assert all(value is None for value in results.values())
+    # 取得できなかったタスクは完了として記録せず、次回の実行で回収する
+    assert len(TaskJournal(str(tmp_path / "tasks.sqlite3")).outstanding) == 6
+    assert max(client.gets.values()) == 3
+
+
+def test_failed_tasks_ready_is_skipped(tmp_path):
+    # 2 回目の tasks_ready（最初の確認）だけ失敗する
+    client = FakeClient(fail_ready=lambda attempt: attempt == 2)
+    journal = TaskJournal(str(tmp_path / "tasks.sqlite3"))
+    results = run_tasks(client, _requests(10), fast_settings(), journal=journal)
+    journal.close()
+    assert len(results) == 20
+    assert all(value is not None for value in results.values())
+
+
+def test_failed_task_post_is_retried():
+    client = FakeClient(fail_post=lambda attempt: attempt == 1)
+    results = run_tasks(client, _requests(10), fast_settings())
+    assert all(value is not None for value in results.values())
+    # 失敗したバッチを投稿し直す（タスクは 1 回ずつしか作られない）
+    assert client.posts == [20]
+    assert client.post_calls == 2
+
+
+def test_task_post_given_up():
+    client = FakeClient(fail_post=lambda attempt: True)
+    plan = SerpTaskPlan(DEFAULT_SETTINGS["rank"], prioritize=False)
+    requests_ = plan.initial([f"kw{i}" for i in range(5)], {ALLINTITLE: {}, FRESHNESS: {}})
+    results = run_tasks(client, requests_, fast_settings(post_retries=2), plan=plan)
+    assert results == {}
+    assert client.post_calls == 3
+    assert plan.follow_ups_in_flight == 0
+
+
+def test_linger_waits_only_for_follow_ups_in_flight():
+    # 保留した日付指定検索があっても、allintitle を投稿する前は待たない
+    client = FakeClient(ready_delay=0.05)
+    plan = SerpTaskPlan(DEFAULT_SETTINGS["rank"], prioritize=False)
+    requests_ = plan.initial([f"kw{i}" for i in range(10)], {ALLINTITLE: {}, FRESHNESS: {}})
+    started = time.time()
+    results = run_tasks(client, requests_, fast_settings(batch_linger=2.0, poll_interval=0.05),
+                        plan=plan)
+    assert time.time() - started < 1.0
+    assert len(results) == 20
+    assert client.posts == [10, 10]
+    assert client.ready_calls < 20
+
+
+def test_rejected_task_does_not_hold_the_plan():
+    # kw0 の allintitle だけ投稿に失敗する
+    client = FakeClient(ready_delay=0.05, reject=lambda tag: tag == task_tag(ALLINTITLE, "kw0"))
+    plan = SerpTaskPlan(DEFAULT_SETTINGS["rank"], prioritize=False)
+    requests_ = plan.initial([f"kw{i}" for i in range(10)], {ALLINTITLE: {}, FRESHNESS: {}})
+    progress = []
+    started = time.time()
+    results = run_tasks(client, requests_, fast_settings(batch_linger=2.0, poll_interval=0.05),
+                        plan=plan, progress=lambda *event: progress.append(event))
+    assert time.time() - started < 1.0
+    assert plan.follow_ups_in_flight == 0
+    assert not plan.is_started("kw0")
+    assert len(results) == 18
+    # 作られなかったタスクは全体の件数に含めない
+    assert progress[-1][1:] == (18, 18)
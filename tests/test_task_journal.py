@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+from core.dataforseo import ALLINTITLE, FRESHNESS
+from core.serp_engine import run_tasks
+from core.task_journal import TaskJournal
+
+from fakes import FakeClient, fast_settings
+
+
+def _post(journal, *task_ids):
+    journal.record_posted([(task_id, f"kw-{task_id}", ALLINTITLE, time.time()) for task_id in task_ids])
+
+
+def test_live_owner_tasks_are_not_claimed(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    first = TaskJournal(path)
+    _post(first, "a1", "a2")
+    second = TaskJournal(path)
+    try:
+        assert second.outstanding == {}
+        assert second.has_other_owners()
+        assert second.is_known("a1")
+    finally:
+        second.close()
+        first.close()
+
+
+def test_expired_lease_tasks_are_claimed(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    first = TaskJournal(path, lease=0.2)
+    _post(first, "a1", "a2")
+    first.record_done(["a2"])
+    # close せずに落ちたプロセスを模し、heartbeat を止める
+    first._closed.set()
+    time.sleep(0.3)
+    second = TaskJournal(path, lease=0.2)
+    try:
+        assert set(second.outstanding) == {"a1"}
+        assert not second.has_other_owners()
+    finally:
+        second.close()
+
+
+def test_closed_owner_tasks_are_claimed_immediately(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    first = TaskJournal(path)
+    _post(first, "a1")
+    first.close()
+    second = TaskJournal(path)
+    try:
+        assert set(second.outstanding) == {"a1"}
+    finally:
+        second.close()
+
+
+def test_legacy_jsonl_is_imported(tmp_path):
+    legacy = tmp_path / "tasks.jsonl"
+    events = [
+        {"op": "post", "id": "x1", "keyword": "kw1", "kind": ALLINTITLE, "posted_at": time.time()},
+        {"op": "post", "id": "x2", "keyword": "kw2", "kind": FRESHNESS, "posted_at": time.time()},
+        {"op": "done", "id": "x1"},
+    ]
+    legacy.write_text("".join(json.dumps(event) + "\n" for event in events) + "{broken", encoding="utf-8")
+    journal = TaskJournal(str(tmp_path / "tasks.sqlite3"))
+    try:
+        assert set(journal.outstanding) == {"x2"}
+        assert journal.outstanding["x2"]["keyword"] == "kw2"
+        assert not legacy.exists()
+    finally:
+        journal.close()
+
+
+def test_concurrent_runs_fetch_only_their_own_tasks(tmp_path):
+    path = str(tmp_path / "tasks.sqlite3")
+    # 2 つの実行が同じアカウント（tasks_ready は両方のタスクを返す）と同じジャーナルを使う
+    client = FakeClient(ready_delay=0.05)
+    runs = {
+        "a": [(f"a{i}", kind) for i in range(20) for kind in (ALLINTITLE, FRESHNESS)],
+        "b": [(f"b{i}", kind) for i in range(20) for kind in (ALLINTITLE, FRESHNESS)],
+    }
+    journals = {name: TaskJournal(path) for name in runs}
+    results = {}
+
+    def run(name):
+        results[name] = run_tasks(client, runs[name], fast_settings(batch_size=10),
+                                  journal=journals[name])
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in runs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+    for name, requests_ in runs.items():
+        assert set(results[name]) == set(requests_)
+        assert all(value is not None for value in results[name].values())
+        assert journals[name].outstanding == {}
+        journals[name].close()
+    # 各タスクは投稿した実行だけが取得する
+    assert all(count == 1 for count in client.gets.values())
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from core.visited import BloomVisitedSet
+
+
+@pytest.mark.parametrize("use_mmap", [True, False])
+def test_bloom_add_is_exact(tmp_path, use_mmap):
+    path = str(tmp_path / "visited")
+    # 小さいフィルタで偽陽性を起こす
+    visited = BloomVisitedSet(path, capacity=16, error_rate=0.3, use_mmap=use_mmap)
+    items = [f"キーワード {i}" for i in range(300)]
+    assert all(visited.add(item) for item in items)
+    assert visited.false_positives > 0
+    assert not any(visited.add(item) for item in items)
+    assert len(visited) == 300
+    assert all(item in visited for item in items)
+    assert not any(f"未訪問 {i}" in visited for i in range(300))
+    visited.close()
+
+
+def test_bloom_files_are_removed_on_close(tmp_path):
+    path = str(tmp_path / "visited")
+    visited = BloomVisitedSet(path, capacity=100)
+    visited.add("キーワード")
+    assert os.path.exists(f"{path}.bloom")
+    assert os.path.exists(f"{path}.sqlite3")
+    visited.close()
+    assert os.listdir(tmp_path) == []
+    # 閉じた後にもう一度 close しても失敗しない
+    visited.close()